@@ -8,12 +8,6 @@ CORS(app)
 
 app.config.from_object('app.config')
 
-from werkzeug.middleware.shared_data import SharedDataMiddleware
-import os
-app.wsgi_app = SharedDataMiddleware(app.wsgi_app, {
-    '/uploads': os.path.join(app.root_path, '..', 'uploads')
-})
-
 
 
 
@@ -21,4 +15,20 @@ app.wsgi_app = SharedDataMiddleware(app.wsgi_app, {
 from app import db
 db.init_app(app)
 
+from app.photo_service import photo_service
+photo_service.init_app(app)
+
+from app.ingest_queue import ingest_queue
+ingest_queue.init_app(app)
+
+from app.file_cleanup import file_cleaner
+file_cleaner.init_app(app)
+
+from app.clustering import cluster_cache
+cluster_cache.init_app(app)
+
+from app.renditions import rendition_cache
+rendition_cache.init_app(app)
+
+from app import media
 from app import routes
\ No newline at end of file
@@ -0,0 +1,319 @@
+"""Server-side photo clustering for map views.
+
+Each trip gets a grid quadtree in Web Mercator space: at zoom z the world
+is cut into square cells about CLUSTER_RADIUS_PX screen pixels wide, so a
+cell at zoom z splits into 2x2 cells at zoom z + 1. Every cell keeps a
+count and coordinate sums for its photos, which makes a cluster lookup a
+handful of dict reads and lets single photos be added or removed in
+O(zoom levels).
+"""
+import math
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# Mercator projection is undefined at the poles
+MAX_LATITUDE = 85.05112878
+TILE_SIZE = 256
+
+
+def project(longitude: float, latitude: float) -> Tuple[float, float]:
+    """Map (lon, lat) to Web Mercator coordinates in [0, 1)."""
+    latitude = max(-MAX_LATITUDE, min(MAX_LATITUDE, latitude))
+    sin_lat = math.sin(math.radians(latitude))
+    mx = (longitude + 180.0) / 360.0
+    my = 0.5 - math.log((1 + sin_lat) / (1 - sin_lat)) / (4 * math.pi)
+    return min(max(mx, 0.0), 1 - 1e-12), min(max(my, 0.0), 1 - 1e-12)
+
+
+class _Cell:
+    __slots__ = ('count', 'sum_x', 'sum_y', 'sample')
+
+    def __init__(self):
+        self.count = 0
+        self.sum_x = 0.0
+        self.sum_y = 0.0
+        self.sample = None  # Any member photo id, shown as the cluster's thumbnail
+
+
+class ClusterIndex:
+    """
+    Cluster hierarchy for one trip's photos.
+
+    Zoom levels 0..max_zoom hold aggregated cells; the finest level also
+    keeps its member ids so photos can be listed individually above
+    max_zoom and so a cell's sample can be replaced when it is deleted.
+    """
+
+    def __init__(self, radius_px: int, max_zoom: int):
+        self.max_zoom = max_zoom
+        # Cells per world side at each zoom, one cell ~ radius_px wide; kept
+        # a power-of-two multiple of the zoom 0 count so the levels nest
+        base = max(1, round(TILE_SIZE / radius_px))
+        self.cells_per_side = [base << z for z in range(max_zoom + 1)]
+        self.levels: List[Dict[Tuple[int, int], _Cell]] = [{} for _ in range(max_zoom + 1)]
+        self.members: Dict[Tuple[int, int], set] = {}
+        self.photos: Dict[int, dict] = {}
+        # Photos without coordinates still count towards the trip's total
+        self.unplaced = set()
+
+    def __len__(self):
+        return len(self.photos) + len(self.unplaced)
+
+    def _cell_keys(self, mx: float, my: float) -> List[Tuple[int, int]]:
+        return [(int(mx * n), int(my * n)) for n in self.cells_per_side]
+
+    def add(self, photo: dict):
+        """Index a photo with id, x, y, thumbnail_url and taken_at."""
+        if photo['id'] in self.photos:
+            return
+        if photo['x'] is None or photo['y'] is None:
+            self.unplaced.add(photo['id'])
+            return
+        mx, my = project(photo['x'], photo['y'])
+        entry = {key: photo.get(key) for key in ('id', 'x', 'y', 'thumbnail_url', 'taken_at')}
+        entry['keys'] = self._cell_keys(mx, my)
+        self.photos[photo['id']] = entry
+
+        for level, key in zip(self.levels, entry['keys']):
+            cell = level.get(key)
+            if cell is None:
+                cell = level[key] = _Cell()
+            cell.count += 1
+            cell.sum_x += photo['x']
+            cell.sum_y += photo['y']
+            if cell.sample is None:
+                cell.sample = photo['id']
+        self.members.setdefault(entry['keys'][-1], set()).add(photo['id'])
+
+    def remove(self, photo_id: int):
+        self.unplaced.discard(photo_id)
+        entry = self.photos.pop(photo_id, None)
+        if entry is None:
+            return
+
+        finest = entry['keys'][-1]
+        self.members[finest].discard(photo_id)
+        replacement = next(iter(self.members[finest]), None)
+        if not self.members[finest]:
+            del self.members[finest]
+
+        # Walk from the finest level up so a replacement sample found below
+        # is always a member of the cells above it
+        for z in range(self.max_zoom, -1, -1):
+            key = entry['keys'][z]
+            cell = self.levels[z][key]
+            cell.count -= 1
+            if cell.count == 0:
+                del self.levels[z][key]
+                continue
+            cell.sum_x -= entry['x']
+            cell.sum_y -= entry['y']
+            if cell.sample == photo_id:
+                # A cell emptied at the finest level means z < max_zoom here
+                if replacement is None:
+                    replacement = self._any_member(z, key)
+                cell.sample = replacement
+
+    def _any_member(self, z: int, key: Tuple[int, int]) -> Optional[int]:
+        """Return the sample of any non-empty child cell one level down."""
+        children = self.levels[z + 1]
+        for dx in (0, 1):
+            for dy in (0, 1):
+                cell = children.get((key[0] * 2 + dx, key[1] * 2 + dy))
+                if cell is not None:
+                    return cell.sample
+        return None
+
+    def query(self, bbox: Tuple[float, float, float, float], zoom: int) -> dict:
+        """
+        Return the clusters and single photos visible in a viewport.
+
+        Args:
+            bbox: (min_lon, min_lat, max_lon, max_lat)
+            zoom: Map zoom level; above max_zoom every photo is a point
+
+        Returns:
+            {'clusters': [...], 'points': [...]}; cells holding one photo
+            are reported as points
+        """
+        min_lon, min_lat, max_lon, max_lat = bbox
+        z = min(max(zoom, 0), self.max_zoom)
+        n = self.cells_per_side[z]
+        left, top = project(min_lon, max_lat)
+        right, bottom = project(max_lon, min_lat)
+        x0, x1 = int(left * n), int(right * n)
+        y0, y1 = int(top * n), int(bottom * n)
+
+        def in_bbox(photo: dict) -> bool:
+            return min_lon <= photo['x'] <= max_lon and min_lat <= photo['y'] <= max_lat
+
+        clusters = []
+        points = []
+        if zoom > self.max_zoom:
+            for key in self._keys_in_range(self.members, x0, x1, y0, y1):
+                points.extend(self._point(self.photos[i]) for i in self.members[key]
+                              if in_bbox(self.photos[i]))
+        else:
+            level = self.levels[z]
+            for key in self._keys_in_range(level, x0, x1, y0, y1):
+                cell = level[key]
+                if cell.count == 1:
+                    points.append(self._point(self.photos[cell.sample]))
+                    continue
+                sample = self.photos[cell.sample]
+                clusters.append({
+                    'x': cell.sum_x / cell.count,
+                    'y': cell.sum_y / cell.count,
+                    'count': cell.count,
+                    'photo_id': sample['id'],
+                    'thumbnail_url': sample['thumbnail_url'],
+                })
+
+        points.sort(key=lambda p: p['id'])
+        return {'clusters': clusters, 'points': points}
+
+    @staticmethod
+    def _keys_in_range(cells: dict, x0: int, x1: int, y0: int, y1: int) -> Iterable[Tuple[int, int]]:
+        # Probe the viewport's cells, unless there are fewer stored cells
+        # than that (e.g. a whole-world box at a deep zoom)
+        if (x1 - x0 + 1) * (y1 - y0 + 1) <= len(cells):
+            return [(x, y) for x in range(x0, x1 + 1) for y in range(y0, y1 + 1)
+                    if (x, y) in cells]
+        return [key for key in cells if x0 <= key[0] <= x1 and y0 <= key[1] <= y1]
+
+    @staticmethod
+    def _point(photo: dict) -> dict:
+        return {key: photo[key] for key in ('id', 'x', 'y', 'thumbnail_url', 'taken_at')}
+
+
+class ClusterCache:
+    """
+    Per-process LRU of ClusterIndex objects, one per trip.
+
+    An index is built from the database on first use and records the
+    Trips.version it was built at. Each lookup compares that with the
+    trip's current version, so any change since, from this process or
+    another (or a rolled-back ingest), triggers a rebuild. Writes made in
+    this process patch the index instead through apply_write, which moves
+    it to the version they committed.
+    """
+
+    def __init__(self):
+        self.config = None
+        self._indexes: 'OrderedDict[int, ClusterIndex]' = OrderedDict()
+        self._versions = {}  # trip_id -> Trips.version the index is current for
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.config = app.config
+
+    def query(self, connection, trip_id: int, bbox: Tuple[float, float, float, float],
+              zoom: int) -> Optional[dict]:
+        """Run ClusterIndex.query for a trip, or return None if the trip does not exist."""
+        index = self._get_index(connection, trip_id)
+        if index is None:
+            return None
+        # Ingest and delete update cached indexes from other threads
+        with self._lock:
+            return index.query(bbox, zoom)
+
+    def _get_index(self, connection, trip_id: int) -> Optional[ClusterIndex]:
+        cursor = connection.execute("SELECT version FROM Trips WHERE id = ?", (trip_id,))
+        trip = cursor.fetchone()
+        if not trip:
+            return None
+
+        with self._lock:
+            index = self._indexes.get(trip_id)
+            if index is not None and self._versions.get(trip_id) == trip['version']:
+                self._indexes.move_to_end(trip_id)
+                return index
+
+        index = ClusterIndex(self.config['CLUSTER_RADIUS_PX'], self.config['CLUSTER_MAX_ZOOM'])
+        # One statement, so the version matches the photos read with it
+        cursor = connection.execute(
+            """
+            SELECT Trips.version, Photos.id, Photos.x, Photos.y,
+                   Photos.thumbnail_url, Photos.taken_at
+            FROM Trips
+            LEFT JOIN Locations ON Locations.trip_id = Trips.id
+            LEFT JOIN Photos ON Photos.location_id = Locations.id
+            WHERE Trips.id = ?
+            """,
+            (trip_id,)
+        )
+        version = trip['version']
+        for photo in cursor:
+            version = photo['version']
+            if photo['id'] is not None:
+                index.add(photo)
+
+        with self._lock:
+            self._indexes[trip_id] = index
+            self._versions[trip_id] = version
+            self._indexes.move_to_end(trip_id)
+            while len(self._indexes) > self.config['CLUSTER_CACHE_TRIPS']:
+                evicted, _ = self._indexes.popitem(last=False)
+                del self._versions[evicted]
+        return index
+
+    def apply_write(self, before: Dict[int, int], after: Dict[int, int],
+                    added: Optional[Dict[int, List[dict]]] = None,
+                    removed: Iterable[int] = ()):
+        """
+        Patch cached indexes with a committed write.
+
+        An index is patched only if it is current for the version the write
+        started from; otherwise it is left to be rebuilt on next use.
+
+        Args:
+            before: trip_versions of the trips the write touched, read in
+                its transaction before the change
+            after: The same trips' versions read just before commit
+            added: New photos of each trip, keyed by trip id
+            removed: Ids of photos deleted or moved away
+        """
+        added = added or {}
+        removed = list(removed)
+        with self._lock:
+            for trip_id, version in after.items():
+                index = self._indexes.get(trip_id)
+                if index is None or self._versions.get(trip_id) != before.get(trip_id):
+                    continue
+                for photo_id in removed:
+                    index.remove(photo_id)
+                for photo in added.get(trip_id, ()):
+                    index.add(photo)
+                self._versions[trip_id] = version
+
+
+def trip_versions(connection, trip_ids: Iterable[int]) -> Dict[int, int]:
+    """Return {trip id: Trips.version} for the given trips."""
+    trip_ids = list(trip_ids)
+    cursor = connection.execute(
+        f"SELECT id, version FROM Trips WHERE id IN ({','.join('?' * len(trip_ids))})",
+        trip_ids
+    )
+    return {trip['id']: trip['version'] for trip in cursor}
+
+
+def photo_trip_versions(connection, photo_ids: Iterable[int]) -> Dict[int, int]:
+    """Return {trip id: Trips.version} for the trips holding the given photos."""
+    photo_ids = list(photo_ids)
+    cursor = connection.execute(
+        f"""
+        SELECT Trips.id, Trips.version FROM Trips
+        WHERE Trips.id IN (
+            SELECT Locations.trip_id
+            FROM Photos JOIN Locations ON Locations.id = Photos.location_id
+            WHERE Photos.id IN ({','.join('?' * len(photo_ids))})
+        )
+        """,
+        photo_ids
+    )
+    return {trip['id']: trip['version'] for trip in cursor}
+
+
+# Singleton instance
+cluster_cache = ClusterCache()
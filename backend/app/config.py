@@ -1,4 +1,5 @@
 """Application configuration."""
+import os
 import pathlib
 import flask
 
@@ -11,10 +12,99 @@ APPLICATION_ROOT = '/'
 APP_ROOT = pathlib.Path(__file__).resolve().parent.parent
 DATABASE_FILENAME = APP_ROOT / 'sql' / 'greetings.db'
 
+# Applied to every SQLite connection as it is opened
+DATABASE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'foreign_keys': 'ON',
+    'busy_timeout': 5000,  # ms
+    'cache_size': -64000,  # negative = KiB, so 64 MB
+    'mmap_size': 256 * 1024 * 1024,
+    'temp_store': 'MEMORY',
+}
+
+# Prepared statements cached per connection
+DATABASE_STATEMENT_CACHE = 256
+
+# Idle connections each process keeps open between requests
+DATABASE_POOL_SIZE = 8
+
+# Funnel route writes through one writer thread that commits them in groups
+DATABASE_WRITER = False
+DATABASE_WRITER_BATCH = 64  # operations per transaction
+
 # Photo upload configuration
 UPLOAD_FOLDER = APP_ROOT / 'uploads' / 'photos'
 MAX_CONTENT_LENGTH = 32 * 1024 * 1024  # 32MB max file size
 ALLOWED_EXTENSIONS = {'jpg', 'jpeg', 'png', 'heic', 'heif', 'gif'}
 
+# Recommended chunk size for resumable uploads, must stay below MAX_CONTENT_LENGTH
+UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024
+
+# Worker processes for EXIF parsing and HEIC conversion (1 = run inline)
+INGEST_WORKERS = os.cpu_count() or 1
+
+# Background threads that run queued ingest jobs, and how often idle ones
+# check for jobs queued by other processes
+INGEST_QUEUE_WORKERS = 2
+INGEST_QUEUE_POLL_SECONDS = 2.0
+
+# Each process marks the jobs it runs this often; a running job whose mark
+# is older than INGEST_JOB_STALE_SECONDS lost its process and is requeued
+INGEST_HEARTBEAT_SECONDS = 10
+INGEST_JOB_STALE_SECONDS = 60
+
+# Server-side map clustering: cell width in screen pixels (matches the
+# frontend's maxClusterRadius), deepest clustered zoom, trips cached per process
+CLUSTER_RADIUS_PX = 60
+CLUSTER_MAX_ZOOM = 16
+CLUSTER_CACHE_TRIPS = 64
+
+# Upper bound for the limit parameter of photo listing endpoints
+MAX_PHOTOS_PER_PAGE = 5000
+
+# Photo ids one batch delete/move/set-cover request may name; each batch
+# is a single IN list, so this stays below SQLite's bound-parameter limit
+MAX_PHOTOS_PER_BATCH = 500
+
+# Stored files served under /uploads; names are content hashes, so clients
+# and CDNs may cache them for a year without revalidating
+MEDIA_ROOT = APP_ROOT / 'uploads'
+MEDIA_MAX_AGE = 365 * 24 * 60 * 60
+
+# Where photo files are stored: 'local' keeps them under MEDIA_ROOT, 's3'
+# in an S3 bucket (needs boto3). For S3-compatible stores such as MinIO
+# set the endpoint; the public URL defaults to <endpoint>/<bucket>.
+STORAGE_BACKEND = 'local'
+STORAGE_S3_BUCKET = None
+STORAGE_S3_ENDPOINT_URL = None
+STORAGE_S3_PUBLIC_URL = None
+STORAGE_S3_REGION = None
+
+# Background file cleanup: seconds between passes, purge queue rows per
+# batch, storage shards (of 256) garbage collected per pass, and the age
+# below which unreferenced files are left alone because an ingest may not
+# have committed them yet (also how long purged queue entries are kept and
+# after which a dead purger's claims are taken over)
+FILE_CLEANUP_INTERVAL = 30.0
+FILE_PURGE_BATCH = 500
+FILE_GC_SHARDS_PER_PASS = 4
+FILE_GC_GRACE_SECONDS = 60 * 60
+
+# Upload sessions still open after this long are expired and their parts removed
+UPLOAD_SESSION_MAX_AGE = 7 * 24 * 60 * 60
+
+# Resized renditions served by /media/<photo_id>: largest side a client may
+# request, cache location and byte budget (least recently used go first),
+# and how long clients may reuse one before revalidating its ETag
+MEDIA_RESIZE_MAX = 2048
+MEDIA_CACHE_DIR = APP_ROOT / 'uploads' / 'cache'
+MEDIA_CACHE_BYTES = 512 * 1024 * 1024
+MEDIA_RENDITION_MAX_AGE = 24 * 60 * 60
+
+# Let a fronting nginx/Apache send file bodies (X-Sendfile) instead of the
+# WSGI server's file wrapper
+USE_X_SENDFILE = False
+
 # Secret key for sessions
 SECRET_KEY = 'dev-secret-key-change-this-in-production'
\ No newline at end of file
@@ -1,6 +1,11 @@
 """Database API."""
 
+import os
+import queue
 import sqlite3
+import threading
+from concurrent.futures import Future
+from pathlib import Path
 import flask
 
 
@@ -13,22 +18,222 @@ def dict_factory(ptr, row):
     return {col[0]: row[idx] for idx, col in enumerate(ptr.description)}
 
 
+# Pragmas that change the database file rather than the connection
+FILE_PRAGMAS = {'journal_mode'}
+
+
+def connect(config, readonly=False):
+    """Open a new SQLite connection tuned by the app configuration.
+
+    config: Flask config mapping (DATABASE_FILENAME, DATABASE_PRAGMAS,
+    DATABASE_STATEMENT_CACHE)
+    readonly: open with mode=ro; in WAL mode such a connection reads from
+    the last committed snapshot and never waits on a writer
+    """
+    if readonly:
+        path = Path(config['DATABASE_FILENAME']).resolve().as_uri()
+        database, uri = f"{path}?mode=ro", True
+    else:
+        database, uri = str(config['DATABASE_FILENAME']), False
+    connection = sqlite3.connect(
+        database,
+        cached_statements=config['DATABASE_STATEMENT_CACHE'],
+        check_same_thread=False,
+        uri=uri,
+    )
+    connection.row_factory = dict_factory
+    for name, value in config['DATABASE_PRAGMAS'].items():
+        if readonly and name in FILE_PRAGMAS:
+            continue
+        connection.execute(f"PRAGMA {name} = {value}")
+    if readonly:
+        connection.execute("PRAGMA query_only = ON")
+    return connection
+
+
+class ConnectionPool:
+    """Long-lived connections to one database, reused across requests.
+
+    A connection is only ever used by one thread at a time: it is checked
+    out for the length of a request and handed back at teardown. Up to
+    max_idle connections are kept open between requests.
+    """
+
+    def __init__(self, config, readonly=False):
+        self.config = config
+        self.readonly = readonly
+        self.max_idle = config['DATABASE_POOL_SIZE']
+        self._idle = []
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+
+    def acquire(self):
+        """Check out an idle connection, opening one if none is free."""
+        with self._lock:
+            # Connections must not cross a fork; start over in a child
+            if self._pid != os.getpid():
+                self._idle = []
+                self._pid = os.getpid()
+            if self._idle:
+                return self._idle.pop()
+        return connect(self.config, self.readonly)
+
+    def release(self, connection):
+        """Return a connection; it must not be inside a transaction."""
+        with self._lock:
+            if self._pid == os.getpid() and len(self._idle) < self.max_idle:
+                self._idle.append(connection)
+                return
+        connection.close()
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(config, readonly=False):
+    """Return the process-wide writer or reader pool for the configured database."""
+    key = (str(config['DATABASE_FILENAME']), readonly)
+    with _pools_lock:
+        if key not in _pools:
+            _pools[key] = ConnectionPool(config, readonly)
+        return _pools[key]
+
+
+class GroupCommitWriter:
+    """Single writer thread that applies queued operations in shared transactions.
+
+    Callers submit fn(connection, *args); the writer drains whatever is
+    queued (up to max_batch), runs each operation in its own savepoint
+    inside one BEGIN IMMEDIATE transaction and commits once for the whole
+    group. An operation that raises is rolled back alone and its caller
+    gets the exception. Operations must not commit themselves.
+    """
+
+    def __init__(self, config):
+        self.config = config
+        self.max_batch = config['DATABASE_WRITER_BATCH']
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._pid = None
+
+    def submit(self, fn, *args):
+        """Queue an operation and return a Future for its result."""
+        with self._lock:
+            # The thread does not survive a fork; start one per process
+            if self._pid != os.getpid():
+                self._queue = queue.Queue()
+                threading.Thread(target=self._run, name="db-writer", daemon=True).start()
+                self._pid = os.getpid()
+        future = Future()
+        self._queue.put((fn, args, future))
+        return future
+
+    def run(self, fn, *args):
+        """Apply an operation and wait for it to be committed."""
+        return self.submit(fn, *args).result()
+
+    def _run(self):
+        operations = self._queue
+        connection = connect(self.config)
+        while True:
+            batch = [operations.get()]
+            while len(batch) < self.max_batch:
+                try:
+                    batch.append(operations.get_nowait())
+                except queue.Empty:
+                    break
+            self._apply(connection, batch)
+
+    def _apply(self, connection, batch):
+        outcomes = []
+        try:
+            connection.execute("BEGIN IMMEDIATE")
+            for fn, args, future in batch:
+                if not future.set_running_or_notify_cancel():
+                    continue
+                connection.execute("SAVEPOINT operation")
+                try:
+                    result = fn(connection, *args)
+                except Exception as e:
+                    connection.execute("ROLLBACK TO operation")
+                    outcomes.append((future, None, e))
+                else:
+                    outcomes.append((future, result, None))
+                connection.execute("RELEASE operation")
+            connection.commit()
+        except Exception as e:
+            # The group as a whole failed; nothing in it was committed
+            if connection.in_transaction:
+                connection.rollback()
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for future, result, error in outcomes:
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
+
+
+_writers = {}
+
+
+def get_writer(config):
+    """Return the process-wide group-commit writer, or None when disabled."""
+    if not config['DATABASE_WRITER']:
+        return None
+    key = str(config['DATABASE_FILENAME'])
+    with _pools_lock:
+        if key not in _writers:
+            _writers[key] = GroupCommitWriter(config)
+        return _writers[key]
+
+
+def run_write(fn, *args):
+    """Apply fn(connection, *args) as one committed write for this request.
+
+    Goes through the group-commit writer when DATABASE_WRITER is on;
+    otherwise runs on the request's connection and commits it.
+    """
+    writer = get_writer(flask.current_app.config)
+    if writer is not None:
+        return writer.run(fn, *args)
+
+    connection = get_db()
+    result = fn(connection, *args)
+    connection.commit()
+    return result
+
+
 def get_db():
-    """Open a new database connection.
+    """Check out a pooled database connection for this request.
 
     Flask docs:
     https://flask.palletsprojects.com/en/1.0.x/appcontext/#storing-data
     """
     if 'sqlite_db' not in flask.g:
-        db_filename = flask.current_app.config['DATABASE_FILENAME']
-        flask.g.sqlite_db = sqlite3.connect(str(db_filename))
-        flask.g.sqlite_db.row_factory = dict_factory
+        flask.g.sqlite_db = get_pool(flask.current_app.config).acquire()
 
     return flask.g.sqlite_db
 
 
+def get_read_db():
+    """Check out a pooled read-only connection for this request.
+
+    GET routes use this so they read the last committed state instead of
+    queueing behind an ingest transaction on the writer connection.
+    """
+    if 'sqlite_read_db' not in flask.g:
+        flask.g.sqlite_read_db = get_pool(flask.current_app.config, readonly=True).acquire()
+
+    return flask.g.sqlite_read_db
+
+
 def close_db(error):
-    """Close the database at the end of a request.
+    """Finish the request's transaction and return its connection to the pool.
 
     error: Exception or None
 
@@ -37,10 +242,49 @@ def close_db(error):
     """
     sqlite_db = flask.g.pop('sqlite_db', None)
     if sqlite_db is not None:
-        sqlite_db.commit()
-        sqlite_db.close()
+        if error is None:
+            sqlite_db.commit()
+        else:
+            sqlite_db.rollback()
+        get_pool(flask.current_app.config).release(sqlite_db)
+
+    sqlite_read_db = flask.g.pop('sqlite_read_db', None)
+    if sqlite_read_db is not None:
+        sqlite_read_db.rollback()
+        get_pool(flask.current_app.config, readonly=True).release(sqlite_read_db)
 
 
 def init_app(app):
     """Attach the database teardown function to the Flask app."""
-    app.teardown_appcontext(close_db)
\ No newline at end of file
+    app.teardown_appcontext(close_db)
+
+
+# Bound-parameter limit of older SQLite builds; newer ones allow more
+MAX_SQL_VARIABLES = 999
+
+
+def insert_chunk_size(column_count):
+    """Return how many rows fit in one multi-row INSERT."""
+    return max(1, MAX_SQL_VARIABLES // column_count)
+
+
+def insert_returning(connection, table, columns, rows):
+    """Insert rows with one multi-row INSERT ... RETURNING * statement.
+
+    connection: sqlite3.Connection
+    table: str, trusted table name
+    columns: sequence of trusted column names
+    rows: list of value tuples, at most insert_chunk_size(len(columns))
+
+    Returns the created rows in the order of ``rows``.
+    """
+    if not rows:
+        return []
+    placeholders = f"({', '.join('?' * len(columns))})"
+    cursor = connection.execute(
+        f"INSERT INTO {table} ({', '.join(columns)}) "
+        f"VALUES {', '.join([placeholders] * len(rows))} RETURNING *",
+        [value for row in rows for value in row]
+    )
+    # SQLite does not promise RETURNING order; ids grow in insert order
+    return sorted(cursor.fetchall(), key=lambda row: row['id'])
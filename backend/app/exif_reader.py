@@ -0,0 +1,313 @@
+"""Header-only EXIF reader for GPS coordinates and capture time.
+
+Parses just the JPEG APP1 segment or the HEIF Exif item straight from the
+raw bytes, without handing the file to Pillow. Anything unexpected makes
+the reader return None so callers can fall back to the full Pillow path.
+"""
+import struct
+from datetime import datetime
+from typing import Optional, Tuple
+
+
+# TIFF tags
+TAG_DATETIME = 0x0132
+TAG_EXIF_IFD = 0x8769
+TAG_GPS_IFD = 0x8825
+TAG_DATETIME_ORIGINAL = 0x9003
+TAG_DATETIME_DIGITIZED = 0x9004
+
+# GPS IFD tags
+GPS_LATITUDE_REF = 1
+GPS_LATITUDE = 2
+GPS_LONGITUDE_REF = 3
+GPS_LONGITUDE = 4
+
+# TIFF field type -> size in bytes
+TYPE_SIZES = {1: 1, 2: 1, 3: 2, 4: 4, 5: 8, 7: 1, 9: 4, 10: 8}
+
+# HEIF brands we know how to walk
+HEIF_BRANDS = {b'heic', b'heix', b'heim', b'heis', b'hevc', b'hevx', b'mif1', b'msf1'}
+
+
+class _Unsupported(Exception):
+    """Raised internally when the fast path should give up."""
+
+
+def read_gps_metadata(data) -> Optional[dict]:
+    """
+    Read GPS position and capture time from the raw bytes of a photo.
+
+    Args:
+        data: bytes, bytearray, mmap or any buffer holding the whole file
+
+    Returns:
+        Dict with 'latitude', 'longitude' and 'taken_at' (each possibly
+        None when the file has no such data), or None if the file is in a
+        layout this reader does not handle.
+    """
+    try:
+        if data[:2] == b'\xff\xd8':
+            tiff = _find_jpeg_exif(data)
+        elif data[4:8] == b'ftyp' and data[8:12] in HEIF_BRANDS:
+            tiff = _find_heif_exif(data)
+        else:
+            return None
+
+        if tiff is None:
+            return {'latitude': None, 'longitude': None, 'taken_at': None}
+        return _parse_tiff(data, *tiff)
+    except (_Unsupported, struct.error, IndexError, ValueError):
+        return None
+
+
+def _find_jpeg_exif(data) -> Optional[Tuple[int, int]]:
+    """Return (start, end) of the TIFF block in the APP1 Exif segment."""
+    offset = 2
+    while offset + 4 <= len(data):
+        if data[offset] != 0xFF:
+            raise _Unsupported()
+        marker = data[offset + 1]
+
+        # Fill bytes and standalone markers carry no length
+        if marker == 0xFF:
+            offset += 1
+            continue
+        if marker == 0x01 or 0xD0 <= marker <= 0xD7:
+            offset += 2
+            continue
+        # Start of scan or end of image: metadata segments are behind us
+        if marker in (0xDA, 0xD9):
+            return None
+
+        (length,) = struct.unpack_from('>H', data, offset + 2)
+        segment_end = offset + 2 + length
+        if length < 2 or segment_end > len(data):
+            raise _Unsupported()
+        if marker == 0xE1 and data[offset + 4:offset + 10] == b'Exif\x00\x00':
+            return offset + 10, segment_end
+        offset = segment_end
+
+    raise _Unsupported()
+
+
+def _iter_boxes(data, start: int, end: int):
+    """Yield (type, payload_start, box_end) for ISO BMFF boxes in a range."""
+    offset = start
+    while offset + 8 <= end:
+        size, box_type = struct.unpack_from('>I4s', data, offset)
+        header = 8
+        if size == 1:
+            (size,) = struct.unpack_from('>Q', data, offset + 8)
+            header = 16
+        elif size == 0:
+            size = end - offset
+        if size < header or offset + size > end:
+            raise _Unsupported()
+        yield box_type, offset + header, offset + size
+        offset += size
+
+
+def _find_heif_exif(data) -> Optional[Tuple[int, int]]:
+    """Return (start, end) of the TIFF block in the HEIF Exif item."""
+    meta = None
+    for box_type, payload, box_end in _iter_boxes(data, 0, len(data)):
+        if box_type == b'meta':
+            meta = (payload + 4, box_end)  # Skip FullBox version/flags
+            break
+    if meta is None:
+        raise _Unsupported()
+
+    exif_item_id = None
+    locations = {}
+    for box_type, payload, box_end in _iter_boxes(data, *meta):
+        if box_type == b'iinf':
+            exif_item_id = _find_exif_item_id(data, payload, box_end)
+        elif box_type == b'iloc':
+            locations = _parse_iloc(data, payload, box_end)
+
+    if exif_item_id is None:
+        return None
+    if exif_item_id not in locations:
+        raise _Unsupported()
+
+    item_offset, item_length = locations[exif_item_id]
+    (tiff_header_offset,) = struct.unpack_from('>I', data, item_offset)
+    start = item_offset + 4 + tiff_header_offset
+    end = item_offset + item_length
+    if start >= end or end > len(data):
+        raise _Unsupported()
+    return start, end
+
+
+def _find_exif_item_id(data, payload: int, box_end: int) -> Optional[int]:
+    """Return the item ID of the 'Exif' entry in an iinf box."""
+    version = data[payload]
+    entries_start = payload + (6 if version == 0 else 8)
+    for box_type, infe, infe_end in _iter_boxes(data, entries_start, box_end):
+        if box_type != b'infe':
+            continue
+        infe_version = data[infe]
+        if infe_version == 2:
+            item_id, _, item_type = struct.unpack_from('>HH4s', data, infe + 4)
+        elif infe_version == 3:
+            item_id, _, item_type = struct.unpack_from('>IH4s', data, infe + 4)
+        else:
+            raise _Unsupported()
+        if item_type == b'Exif':
+            return item_id
+    return None
+
+
+def _read_uint(data, offset: int, size: int) -> int:
+    """Read a big-endian unsigned integer of 0, 4 or 8 bytes."""
+    if size == 0:
+        return 0
+    if size == 4:
+        return struct.unpack_from('>I', data, offset)[0]
+    if size == 8:
+        return struct.unpack_from('>Q', data, offset)[0]
+    raise _Unsupported()
+
+
+def _parse_iloc(data, payload: int, box_end: int) -> dict:
+    """Map item ID -> (file offset, length) for single-extent items in an iloc box."""
+    version = data[payload]
+    sizes = struct.unpack_from('>H', data, payload + 4)[0]
+    offset_size = sizes >> 12
+    length_size = (sizes >> 8) & 0xF
+    base_offset_size = (sizes >> 4) & 0xF
+    index_size = sizes & 0xF if version in (1, 2) else 0
+
+    offset = payload + 6
+    if version < 2:
+        (item_count,) = struct.unpack_from('>H', data, offset)
+        offset += 2
+    else:
+        (item_count,) = struct.unpack_from('>I', data, offset)
+        offset += 4
+
+    locations = {}
+    for _ in range(item_count):
+        if version < 2:
+            (item_id,) = struct.unpack_from('>H', data, offset)
+            offset += 2
+        else:
+            (item_id,) = struct.unpack_from('>I', data, offset)
+            offset += 4
+
+        construction_method = 0
+        if version in (1, 2):
+            construction_method = struct.unpack_from('>H', data, offset)[0] & 0xF
+            offset += 2
+        offset += 2  # data_reference_index
+        base_offset = _read_uint(data, offset, base_offset_size)
+        offset += base_offset_size
+        (extent_count,) = struct.unpack_from('>H', data, offset)
+        offset += 2
+
+        extents = []
+        for _ in range(extent_count):
+            offset += index_size
+            extent_offset = _read_uint(data, offset, offset_size)
+            offset += offset_size
+            extent_length = _read_uint(data, offset, length_size)
+            offset += length_size
+            extents.append((base_offset + extent_offset, extent_length))
+
+        # Only plain file-offset items with one extent are worth the fast path
+        if construction_method == 0 and len(extents) == 1:
+            locations[item_id] = extents[0]
+        if offset > box_end:
+            raise _Unsupported()
+
+    return locations
+
+
+def _parse_tiff(data, start: int, end: int) -> dict:
+    """Pull GPS and capture time out of a TIFF block."""
+    byte_order = data[start:start + 2]
+    if byte_order == b'II':
+        endian = '<'
+    elif byte_order == b'MM':
+        endian = '>'
+    else:
+        raise _Unsupported()
+
+    magic, ifd0_offset = struct.unpack_from(endian + 'HI', data, start + 2)
+    if magic != 42:
+        raise _Unsupported()
+
+    def read_ifd(ifd_offset: int) -> dict:
+        """Return {tag: (type, count, value_offset)} for one IFD."""
+        position = start + ifd_offset
+        if ifd_offset < 8 or position + 2 > end:
+            raise _Unsupported()
+        (count,) = struct.unpack_from(endian + 'H', data, position)
+        entries = {}
+        for index in range(count):
+            entry = position + 2 + index * 12
+            if entry + 12 > end:
+                raise _Unsupported()
+            tag, field_type, value_count = struct.unpack_from(endian + 'HHI', data, entry)
+            size = TYPE_SIZES.get(field_type, 0) * value_count
+            if size <= 4:
+                value_offset = entry + 8
+            else:
+                value_offset = start + struct.unpack_from(endian + 'I', data, entry + 8)[0]
+                if value_offset + size > end:
+                    raise _Unsupported()
+            entries[tag] = (field_type, value_count, value_offset)
+        return entries
+
+    def read_ascii(entry) -> Optional[str]:
+        if entry is None or entry[0] != 2:
+            return None
+        _, count, value_offset = entry
+        return bytes(data[value_offset:value_offset + count]).rstrip(b'\x00 ').decode('ascii', 'replace')
+
+    def read_pointer(entry) -> Optional[int]:
+        if entry is None or entry[0] not in (4, 13) or entry[1] != 1:
+            return None
+        return struct.unpack_from(endian + 'I', data, entry[2])[0]
+
+    def read_degrees(entry) -> Optional[float]:
+        if entry is None or entry[0] != 5 or entry[1] != 3:
+            return None
+        values = struct.unpack_from(endian + '6I', data, entry[2])
+        if 0 in values[1::2]:
+            raise _Unsupported()
+        degrees, minutes, seconds = (values[i] / values[i + 1] for i in (0, 2, 4))
+        return degrees + (minutes / 60.0) + (seconds / 3600.0)
+
+    ifd0 = read_ifd(ifd0_offset)
+
+    exif_ifd = {}
+    exif_pointer = read_pointer(ifd0.get(TAG_EXIF_IFD))
+    if exif_pointer:
+        exif_ifd = read_ifd(exif_pointer)
+
+    latitude = longitude = None
+    gps_pointer = read_pointer(ifd0.get(TAG_GPS_IFD))
+    if gps_pointer:
+        gps_ifd = read_ifd(gps_pointer)
+        lat = read_degrees(gps_ifd.get(GPS_LATITUDE))
+        lat_ref = read_ascii(gps_ifd.get(GPS_LATITUDE_REF))
+        lon = read_degrees(gps_ifd.get(GPS_LONGITUDE))
+        lon_ref = read_ascii(gps_ifd.get(GPS_LONGITUDE_REF))
+        if lat is not None and lon is not None and lat_ref and lon_ref:
+            latitude = -lat if lat_ref == 'S' else lat
+            longitude = -lon if lon_ref == 'W' else lon
+
+    # Same preference order as PhotoService.extract_datetime
+    taken_at = None
+    for entry in (exif_ifd.get(TAG_DATETIME_ORIGINAL), ifd0.get(TAG_DATETIME),
+                  exif_ifd.get(TAG_DATETIME_DIGITIZED)):
+        dt_str = read_ascii(entry)
+        if dt_str:
+            try:
+                taken_at = int(datetime.strptime(dt_str, "%Y:%m:%d %H:%M:%S").timestamp())
+            except ValueError:
+                pass
+            break
+
+    return {'latitude': latitude, 'longitude': longitude, 'taken_at': taken_at}
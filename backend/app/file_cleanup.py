@@ -0,0 +1,276 @@
+"""Background removal of photo files that no row needs any more."""
+import json
+import os
+import re
+import shutil
+import threading
+import time
+from pathlib import Path
+from typing import List, Optional
+
+from app.db import connect
+from app.photo_service import PhotoService, photo_service
+
+# Stored file names start with the content hash of their photo
+CONTENT_NAME = re.compile(r'^([0-9a-f]{64})(_\d+)?\.[a-z0-9]+$')
+
+
+class FileCleaner:
+    """
+    Deletes files off the request path, from one background thread.
+
+    Each pass first purges FilePurgeQueue, which triggers fill whenever
+    the last photo of a blob is deleted, a batch of rows at a time. It
+    then garbage collects a few first-level storage shards, queueing
+    content-addressed files that no blob references, e.g. files stored by
+    an ingest whose transaction failed, for the next pass to purge. Every
+    full sweep of the shards also clears stale spools and abandoned upload
+    sessions out of the incoming directory.
+    """
+
+    def __init__(self, service: PhotoService):
+        self.photo_service = service
+        self.app = None
+        self._wakeup = threading.Event()
+        self._started = False
+        self._start_lock = threading.Lock()
+        self._next_shard = 0
+
+    def init_app(self, app):
+        """Start the cleaner with the first request served by this process."""
+        self.app = app
+
+        @app.before_request
+        def start_file_cleaner():
+            if not self._started:
+                self.start()
+
+    def start(self):
+        with self._start_lock:
+            if self._started:
+                return
+            self._started = True
+
+        threading.Thread(target=self._run, name="file-cleaner", daemon=True).start()
+
+    def wake(self):
+        """Purge soon instead of at the next interval, e.g. after a delete."""
+        self._wakeup.set()
+
+    def _run(self):
+        connection = connect(self.app.config)
+        while True:
+            try:
+                self.purge(connection)
+                self.collect(connection)
+            except Exception as e:
+                # Storage errors (e.g. S3 unreachable) are retried next pass
+                print(f"❌ File cleanup error: {e}")
+                connection.rollback()
+
+            self._wakeup.wait(self.app.config['FILE_CLEANUP_INTERVAL'])
+            self._wakeup.clear()
+
+    def purge(self, connection) -> int:
+        """
+        Delete the files of every queued entry.
+
+        A batch is claimed in one short write transaction, its files are
+        deleted with no transaction open, and it is marked purged in a
+        second one. Storage I/O therefore never holds the write lock; an
+        ingest that stored the same content meanwhile sees the claim in
+        its own transaction (PhotoService.find_purged) and fails that file.
+        Entries whose content was uploaded again are dropped without
+        deleting anything. Purged entries are kept, and claims of a purger
+        that died are taken over, after FILE_GC_GRACE_SECONDS.
+
+        Returns:
+            Number of entries purged
+        """
+        config = self.app.config
+        storage = self.photo_service.storage
+        purged = 0
+        while True:
+            now = int(time.time())
+            expired = now - config['FILE_GC_GRACE_SECONDS']
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                connection.execute("DELETE FROM FilePurgeQueue WHERE purged_at < ?", (expired,))
+                cursor = connection.execute(
+                    """
+                    UPDATE FilePurgeQueue SET claimed_at = ? WHERE id IN (
+                        SELECT id FROM FilePurgeQueue
+                        WHERE purged_at IS NULL AND (claimed_at IS NULL OR claimed_at < ?)
+                        ORDER BY id LIMIT ?
+                    )
+                    RETURNING *
+                    """,
+                    (now, expired, config['FILE_PURGE_BATCH'])
+                )
+                entries = cursor.fetchall()
+                # Content uploaded again since its entry was queued keeps its files
+                hashes = [entry['content_hash'] for entry in entries if entry['content_hash']]
+                stored = self.photo_service.find_blobs(connection, hashes) if hashes else {}
+                kept = [entry['id'] for entry in entries if entry['content_hash'] in stored]
+                if kept:
+                    connection.execute(
+                        f"DELETE FROM FilePurgeQueue WHERE id IN ({','.join('?' * len(kept))})",
+                        kept
+                    )
+                connection.commit()
+            except BaseException:
+                connection.rollback()
+                raise
+            if not entries:
+                return purged
+
+            claimed = [entry for entry in entries if entry['content_hash'] not in stored]
+            keys = []
+            for entry in claimed:
+                for url in self._entry_urls(entry):
+                    key = storage.key_for_url(url)
+                    if key is not None:
+                        keys.append(key)
+            ids = [entry['id'] for entry in claimed]
+            try:
+                storage.delete_many(keys)
+            except BaseException:
+                # Still claimed, so ingests keep treating the content as
+                # deleted, but free for the next pass to take over
+                self._mark(connection, ids, 0, None)
+                raise
+            self._mark(connection, ids, now, int(time.time()))
+            purged += len(entries)
+
+    @staticmethod
+    def _mark(connection, ids: List[int], claimed_at: int, purged_at: Optional[int]):
+        """Set claimed_at and purged_at of entries in a short write transaction."""
+        if not ids:
+            return
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            connection.execute(
+                f"""
+                UPDATE FilePurgeQueue SET claimed_at = ?, purged_at = ?
+                WHERE id IN ({','.join('?' * len(ids))})
+                """,
+                [claimed_at, purged_at, *ids]
+            )
+            connection.commit()
+        except BaseException:
+            connection.rollback()
+            raise
+
+    @staticmethod
+    def _entry_urls(entry: dict) -> List[str]:
+        urls = [entry['file_url']]
+        if entry['thumbnail_url']:
+            urls.append(entry['thumbnail_url'])
+        for formats in json.loads(entry['derivatives'] or '{}').values():
+            urls.extend(formats.values())
+        return urls
+
+    def collect(self, connection, shards: Optional[int] = None) -> int:
+        """
+        Queue unreferenced files from the next few first-level shards.
+
+        Files younger than FILE_GC_GRACE_SECONDS are left alone: an ingest
+        stores its files before it commits their blob rows. The rest go
+        through FilePurgeQueue, so purge() deletes them under the same claim
+        that ingest checks for.
+
+        Returns:
+            Number of files queued
+        """
+        config = self.app.config
+        storage = self.photo_service.storage
+        cutoff = time.time() - config['FILE_GC_GRACE_SECONDS']
+
+        queued = 0
+        for _ in range(shards or config['FILE_GC_SHARDS_PER_PASS']):
+            if self._next_shard == 0:
+                queued += self.collect_incoming(connection)
+            prefix = f"photos/{self._next_shard:02x}/"
+            self._next_shard = (self._next_shard + 1) % 256
+
+            candidates = {}
+            for key, modified in storage.list_files(prefix):
+                match = CONTENT_NAME.match(key.rsplit('/', 1)[-1])
+                if match and modified < cutoff:
+                    candidates.setdefault(match.group(1), []).append(key)
+            if not candidates:
+                continue
+
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                stored = self.photo_service.find_blobs(connection, list(candidates))
+                now = int(time.time())
+                orphans = [(content_hash, storage.url(key), now)
+                           for content_hash, keys in candidates.items()
+                           if content_hash not in stored for key in keys]
+                connection.executemany(
+                    "INSERT INTO FilePurgeQueue (content_hash, file_url, queued_at) VALUES (?, ?, ?)",
+                    orphans
+                )
+                connection.commit()
+            except BaseException:
+                connection.rollback()
+                raise
+            queued += len(orphans)
+        return queued
+
+    def collect_incoming(self, connection) -> int:
+        """
+        Clear stale files out of the incoming directory.
+
+        Removes spools and temporary files older than FILE_GC_GRACE_SECONDS
+        that no pending ingest job still needs, and the part files of upload
+        sessions that were finalized, deleted, or left open for longer than
+        UPLOAD_SESSION_MAX_AGE (those sessions are marked expired).
+
+        Returns:
+            Number of files and session directories removed
+        """
+        config = self.app.config
+        incoming_dir = self.photo_service.incoming_dir
+        now = time.time()
+        cutoff = now - config['FILE_GC_GRACE_SECONDS']
+
+        cursor = connection.execute(
+            "SELECT spool_path FROM IngestJobFiles WHERE status IN ('pending', 'processing')"
+        )
+        pending = {Path(row['spool_path']).name for row in cursor}
+
+        removed = 0
+        for entry in os.scandir(incoming_dir):
+            if entry.is_file() and entry.name not in pending \
+                    and entry.stat().st_mtime < cutoff:
+                os.unlink(entry.path)
+                removed += 1
+
+        sessions_dir = incoming_dir / 'sessions'
+        if sessions_dir.is_dir():
+            expired_before = int(now - config['UPLOAD_SESSION_MAX_AGE'])
+            for entry in os.scandir(sessions_dir):
+                if not entry.is_dir() or entry.stat().st_mtime >= cutoff:
+                    continue
+                cursor = connection.execute(
+                    "SELECT status, created_at FROM UploadSessions WHERE id = ?",
+                    (entry.name,)
+                )
+                session = cursor.fetchone()
+                if session and session['status'] == 'open':
+                    if session['created_at'] >= expired_before:
+                        continue
+                    connection.execute(
+                        "UPDATE UploadSessions SET status = 'expired' WHERE id = ? AND status = 'open'",
+                        (entry.name,)
+                    )
+                shutil.rmtree(entry.path, ignore_errors=True)
+                removed += 1
+        connection.commit()
+        return removed
+
+
+# Singleton instance
+file_cleaner = FileCleaner(photo_service)
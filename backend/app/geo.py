@@ -0,0 +1,102 @@
+"""Small geodesy helpers for proximity lookups."""
+import math
+from typing import List, Optional, Tuple
+
+
+EARTH_RADIUS_M = 6371008.8
+
+# Length of one degree of latitude, close enough everywhere for box sizing
+METERS_PER_DEGREE = 111320.0
+
+
+def distance_m(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Great-circle (haversine) distance in meters."""
+    phi1 = math.radians(lat1)
+    phi2 = math.radians(lat2)
+    d_phi = phi2 - phi1
+    d_lambda = math.radians(lon2 - lon1)
+    a = (math.sin(d_phi / 2) ** 2
+         + math.cos(phi1) * math.cos(phi2) * math.sin(d_lambda / 2) ** 2)
+    return 2 * EARTH_RADIUS_M * math.asin(min(1.0, math.sqrt(a)))
+
+
+def bbox_around(latitude: float, longitude: float, radius_m: float) -> Tuple[float, float, float, float]:
+    """
+    Return (min_lon, max_lon, min_lat, max_lat) of a box containing every
+    point within radius_m of the center.
+
+    The longitude span widens with latitude so the box never undershoots.
+    """
+    d_lat = radius_m / METERS_PER_DEGREE
+    # Keep the divisor away from zero near the poles
+    cos_lat = max(math.cos(math.radians(latitude)), 1e-6)
+    d_lon = min(radius_m / (METERS_PER_DEGREE * cos_lat), 180.0)
+    return longitude - d_lon, longitude + d_lon, latitude - d_lat, latitude + d_lat
+
+
+def group_points(points: List[Tuple[float, float]], radius_m: float) -> List[List[int]]:
+    """
+    Group (latitude, longitude) points in memory with a hash grid.
+
+    Points are taken in order; each joins the nearest existing group whose
+    first point (its seed) is within radius_m, or seeds a new group. Seeds
+    are bucketed in cells one radius wide, so every lookup only inspects
+    the 3x3 neighbouring cells.
+
+    Returns:
+        Lists of point indexes, one per group, in order of first appearance
+    """
+    cell_deg = radius_m / METERS_PER_DEGREE
+    groups = []
+    seeds = []
+    cells = {}
+
+    def cell_of(latitude: float, longitude: float, row: int) -> Tuple[int, int]:
+        # Cells in a row are one radius wide at that row's latitude
+        row_lat = (row + 0.5) * cell_deg
+        cos_lat = max(math.cos(math.radians(row_lat)), 1e-6)
+        return row, math.floor(longitude * cos_lat / cell_deg)
+
+    for index, (latitude, longitude) in enumerate(points):
+        row = math.floor(latitude / cell_deg)
+
+        nearest = None
+        nearest_distance = radius_m
+        for d_row in (-1, 0, 1):
+            _, column = cell_of(latitude, longitude, row + d_row)
+            for d_column in (-1, 0, 1):
+                for group in cells.get((row + d_row, column + d_column), ()):
+                    seed_lat, seed_lon = seeds[group]
+                    distance = distance_m(latitude, longitude, seed_lat, seed_lon)
+                    if distance <= nearest_distance:
+                        nearest, nearest_distance = group, distance
+
+        if nearest is not None:
+            groups[nearest].append(index)
+            continue
+
+        groups.append([index])
+        seeds.append((latitude, longitude))
+        cells.setdefault(cell_of(latitude, longitude, row), []).append(len(groups) - 1)
+
+    return groups
+
+
+def parse_bbox(value: str) -> Optional[Tuple[float, float, float, float]]:
+    """
+    Parse a 'min_lon,min_lat,max_lon,max_lat' query value (Leaflet's
+    toBBoxString order), clamped to the valid coordinate range.
+
+    Returns:
+        (min_lon, min_lat, max_lon, max_lat), or None if malformed
+    """
+    try:
+        min_lon, min_lat, max_lon, max_lat = (float(part) for part in value.split(','))
+    except ValueError:
+        return None
+    if not all(map(math.isfinite, (min_lon, min_lat, max_lon, max_lat))):
+        return None
+    if min_lon > max_lon or min_lat > max_lat:
+        return None
+    return (max(min_lon, -180.0), max(min_lat, -90.0),
+            min(max_lon, 180.0), min(max_lat, 90.0))
@@ -0,0 +1,193 @@
+"""Geohash keys for prefix-indexed proximity and tile queries.
+
+A geohash interleaves longitude and latitude bits and writes them in
+base 32, so points that share a prefix share a cell and every cell is one
+contiguous B-tree range: [prefix, prefix + '{'). Neighbour lookups scan
+the nine cells around a point at a precision matched to the radius.
+"""
+import math
+from typing import List, Tuple
+
+BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+_DECODE = {char: index for index, char in enumerate(BASE32)}
+
+# Stored precision: cells of about 4.8 m x 4.8 m
+GEOHASH_PRECISION = 9
+
+# Sorts after every base-32 character, so prefix + RANGE_END bounds a cell
+RANGE_END = '{'
+
+# Rows per transaction when backfilling existing rows
+BACKFILL_BATCH_SIZE = 10000
+
+
+def _bit_counts(precision: int) -> Tuple[int, int]:
+    """Return (longitude bits, latitude bits); longitude takes the extra bit."""
+    bits = precision * 5
+    return (bits + 1) // 2, bits // 2
+
+
+def encode(latitude: float, longitude: float, precision: int = GEOHASH_PRECISION) -> str:
+    """Return the geohash of a point."""
+    lon_bits, lat_bits = _bit_counts(precision)
+    # Quantize once, then interleave; the same arithmetic as encode_array
+    lon_cell = min(int((longitude + 180.0) / 360.0 * (1 << lon_bits)), (1 << lon_bits) - 1)
+    lat_cell = min(int((latitude + 90.0) / 180.0 * (1 << lat_bits)), (1 << lat_bits) - 1)
+    lon_cell, lat_cell = max(lon_cell, 0), max(lat_cell, 0)
+
+    chars = []
+    value = 0
+    for bit in range(precision * 5):
+        # Even bits come from longitude, odd bits from latitude, MSB first
+        if bit % 2 == 0:
+            lon_bits -= 1
+            value = (value << 1) | ((lon_cell >> lon_bits) & 1)
+        else:
+            lat_bits -= 1
+            value = (value << 1) | ((lat_cell >> lat_bits) & 1)
+        if bit % 5 == 4:
+            chars.append(BASE32[value])
+            value = 0
+    return ''.join(chars)
+
+
+def encode_array(latitudes, longitudes, precision: int = GEOHASH_PRECISION):
+    """
+    Vectorized encode over NumPy arrays.
+
+    Returns:
+        NumPy array of geohash strings, identical to encode() per element
+    """
+    import numpy as np
+
+    lon_bits, lat_bits = _bit_counts(precision)
+    latitudes = np.asarray(latitudes, dtype=np.float64)
+    longitudes = np.asarray(longitudes, dtype=np.float64)
+    lon_cell = np.clip(((longitudes + 180.0) / 360.0 * (1 << lon_bits)).astype(np.int64),
+                       0, (1 << lon_bits) - 1)
+    lat_cell = np.clip(((latitudes + 90.0) / 180.0 * (1 << lat_bits)).astype(np.int64),
+                       0, (1 << lat_bits) - 1)
+
+    digits = np.zeros((len(latitudes), precision), dtype=np.int64)
+    for bit in range(precision * 5):
+        if bit % 2 == 0:
+            lon_bits -= 1
+            value = (lon_cell >> lon_bits) & 1
+        else:
+            lat_bits -= 1
+            value = (lat_cell >> lat_bits) & 1
+        digits[:, bit // 5] = (digits[:, bit // 5] << 1) | value
+
+    chars = np.array(list(BASE32))[digits]
+    return np.ascontiguousarray(chars).view(f'<U{precision}').ravel()
+
+
+def decode_bbox(geohash: str) -> Tuple[float, float, float, float]:
+    """Return (min_lon, min_lat, max_lon, max_lat) of a geohash cell."""
+    lon_range = [-180.0, 180.0]
+    lat_range = [-90.0, 90.0]
+    bit = 0
+    for char in geohash:
+        value = _DECODE[char]
+        for shift in range(4, -1, -1):
+            target = lon_range if bit % 2 == 0 else lat_range
+            mid = (target[0] + target[1]) / 2
+            if (value >> shift) & 1:
+                target[0] = mid
+            else:
+                target[1] = mid
+            bit += 1
+    return lon_range[0], lat_range[0], lon_range[1], lat_range[1]
+
+
+def neighbors(geohash: str) -> List[str]:
+    """Return the cell and its eight neighbours (fewer at the poles)."""
+    min_lon, min_lat, max_lon, max_lat = decode_bbox(geohash)
+    width = max_lon - min_lon
+    height = max_lat - min_lat
+    center_lat = (min_lat + max_lat) / 2
+    center_lon = (min_lon + max_lon) / 2
+
+    cells = []
+    for d_lat in (-1, 0, 1):
+        lat = center_lat + d_lat * height
+        if not -90.0 < lat < 90.0:
+            continue
+        for d_lon in (-1, 0, 1):
+            # Wrap across the antimeridian
+            lon = (center_lon + d_lon * width + 180.0) % 360.0 - 180.0
+            cell = encode(lat, lon, len(geohash))
+            if cell not in cells:
+                cells.append(cell)
+    return cells
+
+
+def precision_for_radius(radius_m: float, latitude: float = 0.0) -> int:
+    """
+    Longest precision whose cells are at least radius_m on each side, so a
+    circle of that radius always fits inside a cell and its neighbours.
+
+    Returns 0 when even precision 1 cells are too small, e.g. for radii of
+    thousands of kilometres or circles reaching close to a pole.
+    """
+    # Cells are narrowest in metres at the circle's edge nearest a pole
+    edge_lat = min(abs(latitude) + radius_m / 111320.0, 90.0)
+    cos_lat = max(math.cos(math.radians(edge_lat)), 1e-6)
+    for precision in range(GEOHASH_PRECISION, 0, -1):
+        lon_bits, lat_bits = _bit_counts(precision)
+        height_m = 180.0 / (1 << lat_bits) * 111320.0
+        width_m = 360.0 / (1 << lon_bits) * 111320.0 * cos_lat
+        if min(width_m, height_m) >= radius_m:
+            return precision
+    return 0
+
+
+def prefix_range(prefix: str) -> Tuple[str, str]:
+    """Return (low, high) so that low <= geohash < high matches the prefix."""
+    return prefix, prefix + RANGE_END
+
+
+def backfill(connection, table: str, batch_size: int = BACKFILL_BATCH_SIZE) -> int:
+    """
+    Fill in missing geohashes for rows of Photos.
+
+    Encodes a batch at a time with NumPy when it is installed, falling back
+    to encode() per row otherwise.
+
+    Returns:
+        Number of rows updated
+    """
+    try:
+        import numpy as np
+    except ImportError:
+        np = None
+        print("NumPy not installed, encoding geohashes one row at a time")
+
+    updated = 0
+    while True:
+        cursor = connection.execute(
+            f"""
+            SELECT id, x, y FROM {table}
+            WHERE geohash IS NULL AND x IS NOT NULL AND y IS NOT NULL
+            LIMIT ?
+            """,
+            (batch_size,)
+        )
+        rows = cursor.fetchall()
+        if not rows:
+            return updated
+
+        if np is not None:
+            hashes = encode_array(
+                np.fromiter((row['y'] for row in rows), dtype=np.float64, count=len(rows)),
+                np.fromiter((row['x'] for row in rows), dtype=np.float64, count=len(rows)),
+            ).tolist()
+        else:
+            hashes = [encode(row['y'], row['x']) for row in rows]
+
+        connection.executemany(
+            f"UPDATE {table} SET geohash = ? WHERE id = ?",
+            zip(hashes, (row['id'] for row in rows))
+        )
+        connection.commit()
+        updated += len(rows)
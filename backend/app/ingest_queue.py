@@ -0,0 +1,332 @@
+"""SQLite-backed background queue for photo ingest jobs."""
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+from app.db import connect
+from app.photo_service import PhotoService, photo_service
+
+
+class IngestQueue:
+    """
+    Runs PhotoService ingest off the request path.
+
+    Routes enqueue already-spooled uploads and return a job id at once;
+    local worker threads claim queued jobs and process them a slice at a
+    time, recording per-file outcomes as they go. Jobs and their files live
+    in SQLite, so anything queued or interrupted is picked up again after a
+    restart.
+
+    A running job belongs to the process that claimed it, which renews a
+    heartbeat on it; only jobs whose heartbeat went stale are requeued, so
+    a process starting next to busy ones never takes their jobs.
+    """
+
+    def __init__(self, service: PhotoService):
+        self.photo_service = service
+        self.app = None
+        self._wakeup = threading.Event()
+        self._started = False
+        self._start_lock = threading.Lock()
+        self.owner = None
+
+    def init_app(self, app):
+        """Start the workers with the first request served by this process.
+
+        Starting lazily keeps ingest threads out of processes that merely
+        import the app, such as the photo service's worker pool.
+        """
+        self.app = app
+
+        @app.before_request
+        def start_ingest_workers():
+            if not self._started:
+                self.start()
+
+    def start(self):
+        """Launch the worker threads; the request that triggers this never waits."""
+        with self._start_lock:
+            if self._started:
+                return
+            self._started = True
+            self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+        threading.Thread(target=self._start_workers, name="ingest-start", daemon=True).start()
+
+    def _start_workers(self):
+        """Run the workers, then keep this process's jobs alive and requeue dead ones."""
+        for index in range(self.app.config['INGEST_QUEUE_WORKERS']):
+            thread = threading.Thread(
+                target=self._run_worker, name=f"ingest-worker-{index}", daemon=True
+            )
+            thread.start()
+
+        connection = connect(self.app.config)
+        while True:
+            try:
+                self._heartbeat(connection)
+                if self._requeue_stale(connection):
+                    self._wakeup.set()
+            except sqlite3.Error as e:
+                print(f"❌ Ingest heartbeat error: {e}")
+                connection.rollback()
+            time.sleep(self.app.config['INGEST_HEARTBEAT_SECONDS'])
+
+    def _heartbeat(self, connection):
+        connection.execute(
+            "UPDATE IngestJobs SET heartbeat_at = ? WHERE status = 'running' AND owner = ?",
+            (int(datetime.now().timestamp()), self.owner)
+        )
+        connection.commit()
+
+    def _requeue_stale(self, connection) -> int:
+        """
+        Requeue running jobs whose owner stopped renewing its heartbeat.
+
+        Their files claimed but not recorded go back to pending: a file's
+        photo and its outcome are committed together, so none was stored.
+
+        Returns:
+            Number of jobs requeued
+        """
+        stale_before = int(datetime.now().timestamp()) - self.app.config['INGEST_JOB_STALE_SECONDS']
+        cursor = connection.execute(
+            """
+            UPDATE IngestJobs SET status = 'queued', owner = NULL
+            WHERE status = 'running' AND (heartbeat_at IS NULL OR heartbeat_at < ?)
+            RETURNING id
+            """,
+            (stale_before,)
+        )
+        job_ids = [job['id'] for job in cursor.fetchall()]
+        if job_ids:
+            connection.execute(
+                f"""
+                UPDATE IngestJobFiles SET status = 'pending'
+                WHERE job_id IN ({','.join('?' * len(job_ids))}) AND status = 'processing'
+                """,
+                job_ids
+            )
+        connection.commit()
+        return len(job_ids)
+
+    def enqueue(self, connection, staged: List[Tuple[str, str, str]],
+                trip_id: int, user_id: int) -> int:
+        """
+        Record a job for spooled uploads and wake a worker.
+
+        Args:
+            staged: List of (spool_path, content_hash, original_filename)
+
+        Returns:
+            The new job id
+        """
+        cursor = connection.execute(
+            """
+            INSERT INTO IngestJobs (trip_id, user_id, status, created_at)
+            VALUES (?, ?, 'queued', ?)
+            """,
+            (trip_id, user_id, int(datetime.now().timestamp()))
+        )
+        job_id = cursor.lastrowid
+        connection.executemany(
+            """
+            INSERT INTO IngestJobFiles
+            (job_id, file_index, filename, spool_path, content_hash)
+            VALUES (?, ?, ?, ?, ?)
+            """,
+            [(job_id, index, filename, spool_path, content_hash)
+             for index, (spool_path, content_hash, filename) in enumerate(staged)]
+        )
+        connection.commit()
+
+        self._wakeup.set()
+        return job_id
+
+    def get_job(self, connection, job_id: int) -> Optional[dict]:
+        """Return a job with its per-file progress."""
+        cursor = connection.execute(
+            "SELECT * FROM IngestJobs WHERE id = ?",
+            (job_id,)
+        )
+        job = cursor.fetchone()
+        if not job:
+            return None
+
+        cursor = connection.execute(
+            """
+            SELECT file_index, filename, status, photo_id, error
+            FROM IngestJobFiles WHERE job_id = ? ORDER BY file_index
+            """,
+            (job_id,)
+        )
+        job['files'] = cursor.fetchall()
+
+        counts = {'pending': 0, 'processing': 0, 'created': 0, 'skipped': 0, 'error': 0}
+        for file in job['files']:
+            counts[file['status']] += 1
+        job['counts'] = counts
+        return job
+
+    def _claim_job(self, connection) -> Optional[dict]:
+        """Atomically move the oldest queued job to running."""
+        while True:
+            cursor = connection.execute(
+                "SELECT * FROM IngestJobs WHERE status = 'queued' ORDER BY id LIMIT 1"
+            )
+            job = cursor.fetchone()
+            if not job:
+                return None
+
+            now = int(datetime.now().timestamp())
+            cursor = connection.execute(
+                """
+                UPDATE IngestJobs SET status = 'running', started_at = ?,
+                    owner = ?, heartbeat_at = ?
+                WHERE id = ? AND status = 'queued'
+                """,
+                (now, self.owner, now, job['id'])
+            )
+            connection.commit()
+            # Another worker won the race, try the next job
+            if cursor.rowcount == 1:
+                return job
+
+    def _run_worker(self):
+        connection = connect(self.app.config)
+        while True:
+            try:
+                job = self._claim_job(connection)
+            except sqlite3.Error as e:
+                print(f"❌ Ingest queue error: {e}")
+                job = None
+
+            if job is None:
+                self._wakeup.wait(self.app.config['INGEST_QUEUE_POLL_SECONDS'])
+                self._wakeup.clear()
+                continue
+
+            try:
+                self._process_job(connection, job)
+            except Exception as e:
+                print(f"❌ Ingest job {job['id']} failed: {e}")
+                connection.rollback()
+                connection.execute(
+                    """
+                    UPDATE IngestJobs SET status = 'failed', error = ?, finished_at = ?
+                    WHERE id = ? AND owner = ?
+                    """,
+                    (str(e), int(datetime.now().timestamp()), job['id'], self.owner)
+                )
+                connection.commit()
+
+    def _process_job(self, connection, job: dict):
+        """Ingest the job's pending files, a slice of files per transaction."""
+        workers = self.app.config['INGEST_WORKERS']
+        slice_size = max(1, workers) * 2
+
+        cursor = connection.execute(
+            """
+            SELECT * FROM IngestJobFiles
+            WHERE job_id = ? AND status = 'pending' ORDER BY file_index
+            """,
+            (job['id'],)
+        )
+        pending = cursor.fetchall()
+
+        for start in range(0, len(pending), slice_size):
+            files = self._claim_files(connection, job, pending[start:start + slice_size])
+            if files is None:
+                print(f"⚠️ Ingest job {job['id']} was requeued by another process")
+                return
+
+            # A spool can only vanish if a crash hit after the file was moved
+            # but before its outcome was committed
+            lost = [f for f in files if not os.path.exists(f['spool_path'])]
+            files = [f for f in files if os.path.exists(f['spool_path'])]
+            for file in lost:
+                self._record_file(connection, file, {'status': 'error', 'error': 'Upload data lost'})
+            # Never hold a write transaction while the slice is being decoded
+            connection.commit()
+
+            if files:
+                results = self.photo_service.ingest_spooled(
+                    connection,
+                    [(f['spool_path'], f['content_hash'], f['filename']) for f in files],
+                    job['trip_id'],
+                    job['user_id'],
+                    workers,
+                    commit=False
+                )
+            else:
+                results = []
+            recorded = [self._record_file(connection, file, result)
+                        for file, result in zip(files, results)]
+            if not all(recorded):
+                # The job changed hands mid-slice; its new owner redoes these files
+                connection.rollback()
+                print(f"⚠️ Ingest job {job['id']} was requeued by another process")
+                return
+            connection.commit()
+
+        connection.execute(
+            """
+            UPDATE IngestJobs SET status = 'done', finished_at = ?
+            WHERE id = ? AND owner = ?
+            """,
+            (int(datetime.now().timestamp()), job['id'], self.owner)
+        )
+        connection.commit()
+
+    def _claim_files(self, connection, job: dict, files: List[dict]) -> Optional[List[dict]]:
+        """
+        Mark pending files of a job this process still owns as processing.
+
+        Returns:
+            The files claimed, or None if the job now belongs to another process
+        """
+        cursor = connection.execute(
+            f"""
+            UPDATE IngestJobFiles SET status = 'processing'
+            WHERE job_id = ? AND file_index IN ({','.join('?' * len(files))})
+            AND status = 'pending'
+            AND EXISTS (SELECT 1 FROM IngestJobs WHERE id = ? AND owner = ?)
+            RETURNING file_index
+            """,
+            [job['id'], *(f['file_index'] for f in files), job['id'], self.owner]
+        )
+        claimed = {row['file_index'] for row in cursor.fetchall()}
+        owned = True
+        if not claimed:
+            cursor = connection.execute(
+                "SELECT 1 FROM IngestJobs WHERE id = ? AND owner = ?",
+                (job['id'], self.owner)
+            )
+            owned = cursor.fetchone() is not None
+        connection.commit()
+        if not owned:
+            return None
+        return [f for f in files if f['file_index'] in claimed]
+
+    def _record_file(self, connection, file: dict, result: dict) -> bool:
+        """Store a claimed file's outcome; False if this process no longer owns it."""
+        cursor = connection.execute(
+            """
+            UPDATE IngestJobFiles SET status = ?, photo_id = ?, error = ?
+            WHERE job_id = ? AND file_index = ? AND status = 'processing'
+            AND EXISTS (SELECT 1 FROM IngestJobs WHERE id = ? AND owner = ?)
+            """,
+            (result['status'], result['photo']['id'] if 'photo' in result else None,
+             result.get('error'), file['job_id'], file['file_index'],
+             file['job_id'], self.owner)
+        )
+        return cursor.rowcount == 1
+
+
+# Singleton instance
+ingest_queue = IngestQueue(photo_service)
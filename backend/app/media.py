@@ -0,0 +1,123 @@
+"""Serving of stored photo files under /uploads and resized renditions.
+
+Files stored since content addressing are named after their hash
+(<sha256>.<ext>, or <sha256>_<size>.<fmt> for derivatives), so their URL
+always refers to the same bytes. Those responses are cached forever, and
+the name doubles as a strong ETag for revalidation and If-Range. Files with
+older names are served too, but revalidated.
+
+/media/<photo_id> renders other sizes on demand. Photo ids can point at
+new content after a delete, so those responses are revalidated instead of
+immutable; the ETag is known before anything is rendered.
+"""
+import re
+from pathlib import PurePosixPath
+
+import flask
+from app import app
+from app.db import get_read_db
+from app.photo_service import DERIVATIVE_FORMATS, photo_service
+from app.renditions import render, rendition_cache, rendition_name
+
+# Names that are the content hash, so the bytes behind them never change
+CONTENT_ADDRESSED = re.compile(r'^[0-9a-f]{64}(_\d+)?\.[a-z0-9]+$')
+
+
+@app.route('/uploads/<path:filename>', methods=['GET', 'HEAD'])
+def get_media(filename):
+    """Send a stored photo file.
+
+    send_file answers If-None-Match/If-Modified-Since with 304 and Range
+    with 206, and hands the file to the server's wsgi.file_wrapper (or
+    X-Sendfile when USE_X_SENDFILE is set) so the body is sent without
+    being read into Python.
+    """
+    path = PurePosixPath(filename)
+    # Only photos/, in any layout; spools and upload sessions live under
+    # dot-prefixed directories such as photos/.incoming
+    if path.parts[0] != 'photos' or any(part.startswith('.') for part in path.parts):
+        flask.abort(404)
+
+    config = flask.current_app.config
+    if not CONTENT_ADDRESSED.match(path.name):
+        # Legacy names: Werkzeug's mtime/size ETag, revalidated on every use
+        response = flask.send_from_directory(config['MEDIA_ROOT'], filename, conditional=True)
+        response.accept_ranges = 'bytes'
+        return response
+
+    response = flask.send_from_directory(
+        config['MEDIA_ROOT'],
+        filename,
+        etag=path.stem,
+        max_age=config['MEDIA_MAX_AGE'],
+        conditional=True,
+    )
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    # Werkzeug only advertises ranges on range responses
+    response.accept_ranges = 'bytes'
+    return response
+
+
+@app.route('/media/<int:photo_id>', methods=['GET', 'HEAD'])
+def get_media_rendition(photo_id):
+    """A photo resized to fit w x h, from the stored original.
+    
+    Query: w=<px>&h=<px> (at least one) &fmt=webp|jpeg (default webp)
+    """
+    config = flask.current_app.config
+    width = flask.request.args.get('w', type=int)
+    height = flask.request.args.get('h', type=int)
+    fmt = flask.request.args.get('fmt', 'webp')
+    
+    if fmt not in DERIVATIVE_FORMATS:
+        return flask.jsonify({'success': False, 'error': 'fmt must be webp or jpeg'}), 400
+    
+    if not (width or height) or any(
+        size is not None and not 0 < size <= config['MEDIA_RESIZE_MAX'] for size in (width, height)
+    ):
+        return flask.jsonify({
+            'success': False,
+            'error': f"w or h required, each 1-{config['MEDIA_RESIZE_MAX']}"
+        }), 400
+    
+    cursor = get_read_db().execute("SELECT file_url FROM Photos WHERE id = ?", (photo_id,))
+    photo = cursor.fetchone()
+    
+    if not photo:
+        return flask.jsonify({'success': False, 'error': 'Photo not found'}), 404
+    
+    name = rendition_name(photo['file_url'], width, height, fmt)
+    if name in flask.request.if_none_match:
+        # Revalidation needs no render, nor even the cached file
+        response = flask.Response(status=304)
+        response.set_etag(name)
+        response.cache_control.public = True
+        response.cache_control.max_age = config['MEDIA_RENDITION_MAX_AGE']
+        return response
+    
+    storage = photo_service.storage
+    key = storage.key_for_url(photo['file_url'])
+    if key is None or not storage.exists(key):
+        return flask.jsonify({'success': False, 'error': 'Photo file missing'}), 404
+    
+    def render_to(target):
+        with storage.local_copy(key) as source:
+            render(source, target, width, height, fmt)
+    
+    def send(path):
+        return flask.send_file(
+            path,
+            mimetype=f'image/{fmt}',
+            etag=name,
+            max_age=config['MEDIA_RENDITION_MAX_AGE'],
+            conditional=True,
+        )
+    
+    path = rendition_cache.get(name, render_to)
+    try:
+        return send(path)
+    except FileNotFoundError:
+        # Another request evicted the file before send_file opened it;
+        # once open, eviction no longer affects this response
+        return send(rendition_cache.get(name, render_to))
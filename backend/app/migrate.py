@@ -0,0 +1,232 @@
+"""Versioned schema migrations and a query plan report.
+
+Usage:
+    python -m app.migrate             Upgrade the database in place
+    python -m app.migrate --explain   Print EXPLAIN QUERY PLAN for every
+                                      query the app issues
+
+Migrations are the numbered files in sql/migrations (NNNN_name.sql). The
+database records the last one applied in PRAGMA user_version, and
+sql/schema.sql creates new databases already at the newest version.
+"""
+import argparse
+import ast
+import itertools
+import re
+import sqlite3
+import sys
+from pathlib import Path
+from typing import List, Tuple
+
+from app import app as flask_app
+from app import geohash
+from app.db import connect
+from app.photo_service import PHOTO_INSERT_COLUMNS
+
+
+APP_DIR = Path(__file__).resolve().parent
+SQL_DIR = APP_DIR.parent / 'sql'
+SCHEMA_FILE = SQL_DIR / 'schema.sql'
+MIGRATIONS_DIR = SQL_DIR / 'migrations'
+
+MIGRATION_NAME = re.compile(r'^(\d{4})_\w+\.sql$')
+
+# Statements worth a query plan; pragmas and transaction control are not
+PLANNED_STATEMENTS = {'SELECT', 'INSERT', 'UPDATE', 'DELETE', 'WITH', 'REPLACE'}
+
+# What the app fills into f-string fields that are not placeholder lists,
+# keyed by (file, field expression). A query is explained once per value.
+TEMPLATE_FIELDS = {
+    ('db.py', 'table'): ['Photos'],
+    ('db.py', "', '.join(columns)"): [', '.join(PHOTO_INSERT_COLUMNS)],
+    ('db.py', "', '.join([placeholders] * len(rows))"): [
+        f"({', '.join('?' * len(PHOTO_INSERT_COLUMNS))})"
+    ],
+    ('geohash.py', 'table'): ['Photos'],
+    ('storage.py', 'table'): ['PhotoBlobs', 'Photos'],
+}
+
+
+def list_migrations() -> List[Tuple[int, Path]]:
+    """Return (version, path) for every migration file, oldest first."""
+    migrations = []
+    for path in MIGRATIONS_DIR.glob('*.sql'):
+        match = MIGRATION_NAME.match(path.name)
+        if match:
+            migrations.append((int(match.group(1)), path))
+    return sorted(migrations)
+
+
+def get_version(connection) -> int:
+    return connection.execute("PRAGMA user_version").fetchone()['user_version']
+
+
+def migrate(connection) -> List[str]:
+    """
+    Apply every migration newer than the database, each in its own transaction.
+
+    An empty database is created straight from sql/schema.sql instead.
+
+    Returns:
+        Names of the migrations (or schema file) applied
+    """
+    cursor = connection.execute("SELECT COUNT(*) AS tables FROM sqlite_master")
+    if cursor.fetchone()['tables'] == 0:
+        _apply_script(connection, SCHEMA_FILE.read_text())
+        return [SCHEMA_FILE.name]
+
+    applied = []
+    current = get_version(connection)
+    for version, path in list_migrations():
+        if version <= current:
+            continue
+        _apply_script(
+            connection,
+            f"{path.read_text()}\nPRAGMA user_version = {version};"
+        )
+        applied.append(path.name)
+    return applied
+
+
+def _apply_script(connection, script: str):
+    """Run a multi-statement script atomically."""
+    try:
+        connection.executescript(f"BEGIN;\n{script}\nCOMMIT;")
+    except sqlite3.Error:
+        if connection.in_transaction:
+            connection.rollback()
+        raise
+
+
+def _render_sql(node, filename: str) -> List[str]:
+    """
+    Return the text of a SQL literal, once per combination of known
+    TEMPLATE_FIELDS values, with '?' for any other f-string field.
+    """
+    if isinstance(node, ast.Constant):
+        return [node.value]
+
+    fields = []
+    for part in node.values:
+        if isinstance(part, ast.FormattedValue):
+            expression = ast.unparse(part.value)
+            if (filename, expression) in TEMPLATE_FIELDS and expression not in fields:
+                fields.append(expression)
+
+    rendered = []
+    for values in itertools.product(*(TEMPLATE_FIELDS[filename, field] for field in fields)):
+        known = dict(zip(fields, values))
+        rendered.append(''.join(
+            part.value if isinstance(part, ast.Constant)
+            else known.get(ast.unparse(part.value), '?')
+            for part in node.values
+        ))
+    return rendered
+
+
+def collect_queries(package_dir: Path = APP_DIR) -> List[Tuple[str, str]]:
+    """
+    Find the SQL the app runs by reading execute()/executemany() calls.
+
+    Returns:
+        List of ('file.py:line', sql) with whitespace collapsed
+    """
+    queries = []
+    for path in sorted(package_dir.glob('*.py')):
+        tree = ast.parse(path.read_text(), str(path))
+        for node in ast.walk(tree):
+            if not (isinstance(node, ast.Call)
+                    and isinstance(node.func, ast.Attribute)
+                    and node.func.attr in ('execute', 'executemany')
+                    and node.args):
+                continue
+            literal = node.args[0]
+            if not (isinstance(literal, ast.JoinedStr)
+                    or (isinstance(literal, ast.Constant) and isinstance(literal.value, str))):
+                continue
+
+            for text in _render_sql(literal, path.name):
+                sql = ' '.join(text.split())
+                if sql.split(' ', 1)[0].upper() in PLANNED_STATEMENTS:
+                    queries.append((f"{path.name}:{node.lineno}", sql))
+    return queries
+
+
+def explain(connection, out=sys.stdout) -> Tuple[int, int]:
+    """
+    Print the query plan of every query found by collect_queries.
+
+    Parameters are bound to NULL; the planner does not look at their values.
+
+    Returns:
+        (number of queries whose plan scans a whole table,
+         number of queries SQLite could not plan)
+    """
+    scans = failed = 0
+    for origin, sql in collect_queries():
+        print(f"{origin}  {sql}", file=out)
+        # Count placeholders outside quoted string literals
+        parameters = [None] * re.sub(r"'[^']*'", '', sql).count('?')
+        try:
+            plan = connection.execute(f"EXPLAIN QUERY PLAN {sql}", parameters).fetchall()
+        except sqlite3.Error as e:
+            print(f"    (not explained: {e})\n", file=out)
+            failed += 1
+            continue
+
+        depth = {0: 0}
+        for row in plan:
+            depth[row['id']] = depth.get(row['parent'], 0) + 1
+            print(f"{'  ' * depth[row['id']]}  {row['detail']}", file=out)
+        if any(_is_table_scan(row['detail']) for row in plan):
+            scans += 1
+        print(file=out)
+
+    print(f"{scans} queries scan a whole table", file=out)
+    if failed:
+        print(f"{failed} queries could not be explained", file=out)
+    return scans, failed
+
+
+def _is_table_scan(detail: str) -> bool:
+    # Covering-index and virtual-table scans are bounded by design
+    return (detail.startswith('SCAN ')
+            and 'COVERING INDEX' not in detail
+            and 'VIRTUAL TABLE' not in detail)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Upgrade the JourniTag database in place.")
+    parser.add_argument('--database', default=str(flask_app.config['DATABASE_FILENAME']),
+                        help="SQLite file to migrate (default: DATABASE_FILENAME)")
+    parser.add_argument('--explain', action='store_true',
+                        help="print EXPLAIN QUERY PLAN for every query the app issues")
+    args = parser.parse_args(argv)
+
+    config = dict(flask_app.config, DATABASE_FILENAME=args.database)
+    connection = connect(config)
+
+    if args.explain:
+        latest = list_migrations()[-1][0]
+        if get_version(connection) < latest:
+            print(f"Warning: database is not migrated to version {latest}", file=sys.stderr)
+        _, failed = explain(connection)
+        connection.close()
+        if failed:
+            sys.exit(f"Error: {failed} queries could not be explained")
+        return
+
+    before = get_version(connection)
+    for name in migrate(connection):
+        print(f"+ Applied {name}")
+    print(f"+ Database at version {get_version(connection)} (was {before}).")
+
+    # Keys the ingest path writes but older rows lack
+    filled = geohash.backfill(connection, 'Photos')
+    if filled:
+        print(f"+ Backfilled {filled} Photos geohashes.")
+    connection.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,135 @@
+"""Batch edits of a user's photos: delete, move between locations, set cover.
+
+Each operation checks ownership of every requested photo with one IN
+query and changes all of them with set-based statements, inside
+the caller's transaction. Photos the user may not edit are reported per
+item instead of failing the batch. Aggregates on Locations and Trips, blob
+references and the file purge queue are kept current by triggers.
+"""
+from typing import Dict, List, Tuple
+
+
+def _placeholders(values: List) -> str:
+    return ','.join('?' * len(values))
+
+
+def check_photos(connection, user_id: int, photo_ids: List[int]) -> Tuple[Dict[int, dict], dict]:
+    """
+    Look up the requested photos and sort out the ones the user owns.
+
+    Returns:
+        (photos the user owns keyed by id, results for the others keyed by id)
+    """
+    cursor = connection.execute(
+        f"""
+        SELECT Photos.id, Photos.user_id, Photos.location_id, Photos.x, Photos.y,
+               Photos.thumbnail_url, Photos.taken_at, Locations.trip_id
+        FROM Photos JOIN Locations ON Locations.id = Photos.location_id
+        WHERE Photos.id IN ({_placeholders(photo_ids)})
+        """,
+        photo_ids
+    )
+    found = {photo['id']: photo for photo in cursor.fetchall()}
+
+    owned, rejected = {}, {}
+    for photo_id in photo_ids:
+        photo = found.get(photo_id)
+        if photo is None:
+            rejected[photo_id] = {'id': photo_id, 'status': 'error', 'error': 'Photo not found'}
+        elif photo['user_id'] != user_id:
+            rejected[photo_id] = {'id': photo_id, 'status': 'error', 'error': 'Not authorized'}
+        else:
+            owned[photo_id] = photo
+    return owned, rejected
+
+
+def _results(photo_ids: List[int], rejected: dict, status: Dict[int, str]) -> List[dict]:
+    """Per-item results in request order."""
+    return [
+        rejected.get(photo_id) or {'id': photo_id, 'status': status[photo_id]}
+        for photo_id in photo_ids
+    ]
+
+
+def delete_photos(connection, user_id: int, photo_ids: List[int]) -> Tuple[List[dict], List[dict]]:
+    """
+    Delete the user's photos among photo_ids.
+
+    Returns:
+        (per-item results, deleted photos)
+    """
+    owned, rejected = check_photos(connection, user_id, photo_ids)
+    if owned:
+        # Triggers queue the files once no other photo shares the content
+        connection.execute(
+            f"DELETE FROM Photos WHERE id IN ({_placeholders(list(owned))})",
+            list(owned)
+        )
+    return _results(photo_ids, rejected, dict.fromkeys(owned, 'deleted')), list(owned.values())
+
+
+def move_photos(connection, user_id: int, photo_ids: List[int],
+                location_id: int) -> Tuple[List[dict], List[dict]]:
+    """
+    Move the user's photos among photo_ids to another location.
+
+    A moved photo stops being a cover: its old location falls back to no
+    cover, and the destination keeps its own.
+
+    Returns:
+        (per-item results, moved photos)
+    """
+    owned, rejected = check_photos(connection, user_id, photo_ids)
+    moved = [photo for photo in owned.values() if photo['location_id'] != location_id]
+    if moved:
+        connection.execute(
+            f"""
+            UPDATE Photos SET location_id = ?, is_cover_photo = 0
+            WHERE id IN ({_placeholders(moved)})
+            """,
+            [location_id, *(photo['id'] for photo in moved)]
+        )
+
+    status = {photo_id: 'unchanged' for photo_id in owned}
+    status.update((photo['id'], 'moved') for photo in moved)
+    return _results(photo_ids, rejected, status), moved
+
+
+def set_cover_photos(connection, user_id: int, photo_ids: List[int]) -> List[dict]:
+    """
+    Make each of the user's photos among photo_ids the cover of its location.
+
+    A location gets the first of its photos in the list; later ones are
+    reported as errors.
+
+    Returns:
+        Per-item results
+    """
+    owned, rejected = check_photos(connection, user_id, photo_ids)
+
+    covers = {}
+    for photo_id, photo in owned.items():
+        if photo['location_id'] in covers:
+            rejected[photo_id] = {
+                'id': photo_id, 'status': 'error',
+                'error': f"Photo {covers[photo['location_id']]} is already this location's cover"
+            }
+        else:
+            covers[photo['location_id']] = photo_id
+
+    if covers:
+        location_ids = list(covers)
+        cover_ids = list(covers.values())
+        connection.execute(
+            f"""
+            UPDATE Photos SET is_cover_photo = 0
+            WHERE location_id IN ({_placeholders(location_ids)}) AND is_cover_photo = 1
+            AND id NOT IN ({_placeholders(cover_ids)})
+            """,
+            [*location_ids, *cover_ids]
+        )
+        connection.execute(
+            f"UPDATE Photos SET is_cover_photo = 1 WHERE id IN ({_placeholders(cover_ids)})",
+            cover_ids
+        )
+    return _results(photo_ids, rejected, dict.fromkeys(covers.values(), 'updated'))
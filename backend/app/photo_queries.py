@@ -0,0 +1,221 @@
+"""Read-side photo queries for map and listing views.
+
+Listings are paged with a keyset cursor: `after` is the (taken_at, id) of
+the last photo already seen, and the next page starts strictly past it in
+the listing's sort order, so each page is one index range scan however
+deep the client has paged.
+"""
+from typing import Iterable, List, Optional, Tuple
+
+from app import geohash
+from app.geo import distance_m
+
+# Viewports covering at least this share of the lon/lat plane are served
+# by walking the user's photos newest-first instead of the R*Tree, which
+# would visit every user's photos inside the box
+WIDE_BBOX_FRACTION = 0.125
+
+# Columns a listing may project with ?fields=
+PHOTO_FIELDS = (
+    'id', 'location_id', 'user_id', 'x', 'y', 'file_url', 'thumbnail_url',
+    'derivatives', 'content_hash', 'original_filename', 'taken_at',
+    'is_cover_photo', 'geohash',
+)
+
+# Always selected: the cursor is built from them
+CURSOR_FIELDS = ('id', 'taken_at')
+
+# Default projection of the map listings
+MAP_FIELDS = ('id', 'x', 'y', 'thumbnail_url', 'taken_at')
+
+# Cursors that sort before every photo, ascending and descending; keeping
+# the keyset condition in the query unconditionally leaves one statement
+# per listing for the statement cache
+_START_ASC = (-(1 << 63), 0)
+_START_DESC = ((1 << 63) - 1, 0)
+
+
+def parse_fields(value: Optional[str], default: Iterable[str] = PHOTO_FIELDS) -> Optional[List[str]]:
+    """
+    Parse a comma-separated ?fields= projection.
+
+    Returns:
+        Column names in PHOTO_FIELDS order, including CURSOR_FIELDS, or
+        None if a name is unknown
+    """
+    names = set(default) if not value else {name.strip() for name in value.split(',')}
+    if not names <= set(PHOTO_FIELDS):
+        return None
+    names.update(CURSOR_FIELDS)
+    return [name for name in PHOTO_FIELDS if name in names]
+
+
+def parse_cursor(value: str) -> Optional[Tuple[int, int]]:
+    """Parse an ?after= cursor "taken_at,id", returning None if it is malformed."""
+    try:
+        taken_at, photo_id = (int(part) for part in value.split(','))
+    except ValueError:
+        return None
+    # SQLite integers are signed 64-bit; binding anything wider overflows
+    if not all(_START_ASC[0] <= part <= _START_DESC[0] for part in (taken_at, photo_id)):
+        return None
+    return taken_at, photo_id
+
+
+def format_cursor(photo: dict) -> str:
+    return f"{photo['taken_at']},{photo['id']}"
+
+
+def _select_list(fields: Iterable[str]) -> str:
+    # Map views fall back to the full image for photos without a thumbnail
+    return ', '.join(
+        'COALESCE(Photos.thumbnail_url, Photos.file_url) AS thumbnail_url'
+        if name == 'thumbnail_url' else f'Photos.{name}'
+        for name in fields
+    )
+
+
+def iter_location_photos(connection, location_id: int, fields: Iterable[str],
+                         after: Optional[Tuple[int, int]] = None,
+                         limit: Optional[int] = None):
+    """
+    Return a cursor over a location's photos in (taken_at, id) order.
+
+    Args:
+        fields: Columns to select, from parse_fields
+        after: Cursor of the last photo of the previous page
+        limit: Maximum number of photos, or None for all of them
+
+    Returns:
+        sqlite3 cursor yielding one dict per photo
+    """
+    columns = ', '.join(f'Photos.{name}' for name in fields)
+    # Photos never have a NULL taken_at (triggers refuse it, see migration
+    # 0011), so the row-value comparison is a plain range on
+    # idx_photos_location_taken_at
+    return connection.execute(
+        f"""
+        SELECT {columns}
+        FROM Photos
+        WHERE location_id = ?
+        AND (taken_at, id) > (?, ?)
+        ORDER BY taken_at, id
+        LIMIT ?
+        """,
+        (location_id, *(after or _START_ASC), -1 if limit is None else limit)
+    )
+
+
+def find_user_photos_in_bbox(connection, user_id: int,
+                             bbox: Tuple[float, float, float, float],
+                             limit: int, fields: Iterable[str] = MAP_FIELDS,
+                             after: Optional[Tuple[int, int]] = None):
+    """
+    Return a user's newest photos inside a viewport, across all trips.
+
+    Args:
+        bbox: (min_lon, min_lat, max_lon, max_lat)
+        limit: Maximum number of photos
+        fields: Columns to select, from parse_fields
+        after: Cursor of the last photo of the previous page
+
+    Returns:
+        sqlite3 cursor yielding one dict per photo, newest first
+    """
+    min_lon, min_lat, max_lon, max_lat = bbox
+    area = (max_lon - min_lon) * (max_lat - min_lat) / (360.0 * 180.0)
+    columns = _select_list(fields)
+    after = after or _START_DESC
+
+    if area >= WIDE_BBOX_FRACTION:
+        # Most of the user's photos are inside; idx_photos_user_taken_at
+        # yields them in order and the scan stops after `limit` matches
+        return connection.execute(
+            f"""
+            SELECT {columns}
+            FROM Photos
+            WHERE user_id = ?
+            AND (taken_at, id) < (?, ?)
+            AND x BETWEEN ? AND ? AND y BETWEEN ? AND ?
+            ORDER BY taken_at DESC, id DESC
+            LIMIT ?
+            """,
+            (user_id, *after, min_lon, max_lon, min_lat, max_lat, limit)
+        )
+
+    # The R*Tree stores 32-bit floats rounded outwards, so candidates are
+    # checked against the exact coordinates after the join
+    return connection.execute(
+        f"""
+        SELECT {columns}
+        FROM PhotosRtree CROSS JOIN Photos ON Photos.id = PhotosRtree.id
+        WHERE PhotosRtree.min_x <= ? AND PhotosRtree.max_x >= ?
+        AND PhotosRtree.min_y <= ? AND PhotosRtree.max_y >= ?
+        AND PhotosRtree.user_id = ?
+        AND (PhotosRtree.taken_at, PhotosRtree.id) < (?, ?)
+        AND Photos.x BETWEEN ? AND ? AND Photos.y BETWEEN ? AND ?
+        ORDER BY PhotosRtree.taken_at DESC, PhotosRtree.id DESC
+        LIMIT ?
+        """,
+        (max_lon, min_lon, max_lat, min_lat, user_id, *after,
+         min_lon, max_lon, min_lat, max_lat, limit)
+    )
+
+
+def find_user_photos_near(connection, user_id: int, latitude: float, longitude: float,
+                          radius_m: float, limit: int) -> List[dict]:
+    """
+    Return a user's photos within radius_m of a point, nearest first.
+
+    Candidates come from geohash prefix range scans over the cell holding
+    the point and its eight neighbours, at a precision whose cells are at
+    least radius_m wide, or from all of the user's photos when no precision
+    is coarse enough; the exact distance is checked here.
+    """
+    precision = geohash.precision_for_radius(radius_m, latitude)
+    if precision:
+        cells = geohash.neighbors(geohash.encode(latitude, longitude, precision))
+    else:
+        # The empty prefix ranges over every geohash
+        cells = ['']
+
+    parameters = []
+    for cell in cells:
+        parameters.extend((user_id, *geohash.prefix_range(cell)))
+    cursor = connection.execute(
+        " UNION ALL ".join(["""
+            SELECT id, x, y, COALESCE(thumbnail_url, file_url) AS thumbnail_url, taken_at
+            FROM Photos WHERE user_id = ? AND geohash >= ? AND geohash < ?
+            """] * len(cells)),
+        parameters
+    )
+
+    photos = []
+    for photo in cursor:
+        distance = distance_m(latitude, longitude, photo['y'], photo['x'])
+        if distance <= radius_m:
+            photo['distance_m'] = round(distance, 1)
+            photos.append(photo)
+    photos.sort(key=lambda photo: photo['distance_m'])
+    return photos[:limit]
+
+
+def group_user_photos_by_tile(connection, user_id: int, precision: int) -> List[dict]:
+    """
+    Count a user's photos per geohash tile of the given precision.
+
+    Returns:
+        Dicts with tile, count and the mean x/y of the tile's photos, in
+        geohash order
+    """
+    cursor = connection.execute(
+        """
+        SELECT substr(geohash, 1, ?) AS tile, COUNT(*) AS count, AVG(x) AS x, AVG(y) AS y
+        FROM Photos
+        WHERE user_id = ? AND geohash IS NOT NULL
+        GROUP BY tile
+        ORDER BY tile
+        """,
+        (precision, user_id)
+    )
+    return cursor.fetchall()
@@ -1,20 +1,116 @@
 """Photo upload service for handling batch uploads with EXIF extraction."""
+import math
+import mmap
+import multiprocessing
 import os
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
-from typing import List, Optional, Tuple
-from PIL import Image
+from typing import Dict, List, Optional, Tuple
+from PIL import Image, ImageOps
 from PIL.ExifTags import TAGS, GPSTAGS
 import hashlib
+import json
 from pathlib import Path
+from app import geohash
+from app.clustering import cluster_cache, trip_versions
+from app.config import UPLOAD_FOLDER
+from app.db import GroupCommitWriter, insert_chunk_size, insert_returning
+from app.exif_reader import read_gps_metadata
+from app.geo import bbox_around, distance_m, group_points
+from app.storage import STORAGE_SETTINGS, Storage, create_storage, shard_key
+
+
+# Read size used when streaming uploads to disk
+SPOOL_CHUNK_SIZE = 1024 * 1024
+
+# Longest edge in pixels of each derivative made at ingest, largest first
+DERIVATIVE_SIZES = (1600, 512, 128)
+DERIVATIVE_FORMATS = {'webp': ('WEBP', {'quality': 80, 'method': 4}),
+                      'jpeg': ('JPEG', {'quality': 85, 'optimize': True})}
+THUMBNAIL_SIZE = 128
+
+# Columns written for each new Photos row, in insert order
+PHOTO_INSERT_COLUMNS = (
+    'location_id', 'user_id', 'x', 'y', 'file_url', 'thumbnail_url', 'derivatives',
+    'content_hash', 'original_filename', 'taken_at', 'is_cover_photo', 'geohash',
+)
+
+# Photos within this distance of an existing location are attached to it
+LOCATION_MATCH_RADIUS_M = 50.0
+
+
+# One service per storage configuration in each worker process, so the
+# backend (e.g. an S3 client) is built once rather than per photo
+_worker_services = {}
+
+
+def _prepare_photo_worker(upload_dir: str, storage_settings: dict, spool_path: str,
+                          content_hash: str, original_filename: str) -> dict:
+    """Process pool entry point; must live at module level to be picklable."""
+    key = (upload_dir, tuple(sorted(storage_settings.items())))
+    if key not in _worker_services:
+        _worker_services[key] = PhotoService(upload_dir, storage_settings)
+    return _worker_services[key].prepare_photo(spool_path, content_hash, original_filename)
 
 
 class PhotoService:
-    def __init__(self, upload_dir: str = "uploads/photos"):
+    def __init__(self, upload_dir: str = UPLOAD_FOLDER, storage_settings: Optional[dict] = None):
+        self._pool = None
+        self._pool_workers = 0
+        self._pool_lock = threading.Lock()
+        self.configure(upload_dir, storage_settings or {
+            'STORAGE_BACKEND': 'local', 'MEDIA_ROOT': str(Path(upload_dir).parent)
+        })
+    
+    def init_app(self, app):
+        """Use the app's upload folder and storage backend."""
+        self.configure(
+            app.config['UPLOAD_FOLDER'],
+            {name: app.config.get(name) for name in STORAGE_SETTINGS}
+        )
+        # Set up the pool before any request starts background threads; the
+        # pool's own workers import the app too and must not nest pools
+        workers = app.config['INGEST_WORKERS']
+        if workers > 1 and multiprocessing.parent_process() is None:
+            self._get_pool(workers)
+    
+    def configure(self, upload_dir: str, storage_settings: dict):
         self.upload_dir = Path(upload_dir)
-        self.upload_dir.mkdir(parents=True, exist_ok=True)
+        # Spooled uploads live next to local storage so that storing them
+        # is a rename rather than a copy
+        self.incoming_dir = self.upload_dir / '.incoming'
+        self.incoming_dir.mkdir(parents=True, exist_ok=True)
+        self.storage_settings = storage_settings
+        self.storage: Storage = create_storage(storage_settings)
     
-    def extract_exif_data(self, image_path: str) -> dict:
-        """Extract EXIF metadata from an image (supports HEIC, JPEG, PNG)."""
+    def _get_pool(self, workers: int) -> ProcessPoolExecutor:
+        """
+        Return a process pool with the given size, creating it lazily.
+        
+        Workers come from a forkserver: forking this process directly could
+        copy a lock held by one of its threads (writer, ingest, cleaner)
+        into a child that would then block on it forever.
+        """
+        with self._pool_lock:
+            if self._pool is None or self._pool_workers != workers:
+                if self._pool is not None:
+                    self._pool.shutdown(wait=False)
+                self._pool = ProcessPoolExecutor(
+                    max_workers=workers,
+                    mp_context=multiprocessing.get_context('forkserver')
+                )
+                self._pool_workers = workers
+            return self._pool
+    
+    def extract_exif_data(self, source) -> dict:
+        """
+        Extract EXIF metadata from an image (supports HEIC, JPEG, PNG).
+        
+        source may be a path or any seekable buffer (e.g. an mmap of a
+        spooled upload), so callers never need to write the file out again.
+        """
         try:
             # Try to register HEIC opener if available
             try:
@@ -24,7 +120,7 @@ class PhotoService:
                 # HEIC support not available, but that's okay for JPEG/PNG
                 pass
             
-            image = Image.open(image_path)
+            image = Image.open(source)
             
             # HEIC files use getexif() method instead of _getexif()
             exif_data = None
@@ -34,7 +130,7 @@ class PhotoService:
                 exif_data = image._getexif()
             
             if not exif_data:
-                print(f"No EXIF data found in {image_path}")
+                print("No EXIF data found")
                 return {}
             
             metadata = {}
@@ -88,7 +184,7 @@ class PhotoService:
             
             return metadata
         except Exception as e:
-            print(f"Error extracting EXIF data from {image_path}: {e}")
+            print(f"Error extracting EXIF data: {e}")
             import traceback
             traceback.print_exc()
             return {}
@@ -145,24 +241,94 @@ class PhotoService:
             print(f"Error extracting datetime: {e}")
             return None
     
-    def save_photo_file(self, file, original_filename: str, convert_heic: bool = True) -> Tuple[str, str]:
+    def read_photo_metadata(self, buffer) -> dict:
         """
-        Save photo file locally and return the file URL and saved extension.
+        Return latitude, longitude and taken_at for a photo buffer.
+        
+        Tries the header-only reader first, which never decodes pixels, and
+        only falls back to Pillow for layouts it does not understand.
+        """
+        metadata = read_gps_metadata(buffer)
+        if metadata is not None:
+            return metadata
+        
+        exif_data = self.extract_exif_data(buffer)
+        
+        gps_coords = None
+        if 'GPSInfo' in exif_data:
+            gps_coords = self.convert_gps_to_decimal(exif_data['GPSInfo'])
+        latitude, longitude = gps_coords or (None, None)
+        
+        return {
+            'latitude': latitude,
+            'longitude': longitude,
+            'taken_at': self.extract_datetime(exif_data),
+        }
+    
+    def spool_upload(self, file) -> Tuple[str, str]:
+        """
+        Stream an upload into the incoming directory, hashing it on the way.
+        
+        The upload is read exactly once; the spool file is later renamed
+        into storage by prepare_photo.
+        
+        Args:
+            file: FileStorage object or binary file-like object
+            
+        Returns:
+            Tuple of (spool_path, content_hash) where content_hash is the
+            hex SHA-256 of the upload
+        """
+        stream = getattr(file, 'stream', file)
+        stream.seek(0)
+        
+        fd, spool_path = tempfile.mkstemp(suffix='.part', dir=self.incoming_dir)
+        hasher = hashlib.sha256()
+        try:
+            with os.fdopen(fd, 'wb') as out:
+                for chunk in iter(lambda: stream.read(SPOOL_CHUNK_SIZE), b''):
+                    hasher.update(chunk)
+                    out.write(chunk)
+        except Exception:
+            os.remove(spool_path)
+            raise
+        
+        return spool_path, hasher.hexdigest()
+    
+    def hash_file(self, path: str) -> str:
+        """Return the hex SHA-256 of a file already on disk."""
+        hasher = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(SPOOL_CHUNK_SIZE), b''):
+                hasher.update(chunk)
+        return hasher.hexdigest()
+    
+    def stage_photo_file(
+        self,
+        spool_path: str,
+        content_hash: str,
+        original_filename: str,
+        buffer=None,
+        convert_heic: bool = True
+    ) -> Tuple[str, str]:
+        """
+        Make the local file that will be stored for a spooled photo.
+        
+        Files are content-addressed: the name is the SHA-256 of the upload,
+        so identical uploads always map to the same file. HEIC is converted
+        to JPEG; anything else is stored as uploaded.
         
         Args:
-            file: FileStorage object
+            spool_path: Path returned by spool_upload
+            content_hash: Hash returned by spool_upload
             original_filename: Original filename
+            buffer: Optional already-open buffer over the spool file
             convert_heic: If True, convert HEIC to JPG for web compatibility
             
         Returns:
-            Tuple of (file_url, saved_extension)
+            Tuple of (local_path, file_name); local_path is the spool itself
+            unless the photo was converted
         """
-        # Generate unique filename
-        timestamp = int(datetime.now().timestamp())
-        file.seek(0)
-        file_hash = hashlib.md5(file.read()).hexdigest()[:8]
-        file.seek(0)  # Reset file pointer after reading
-        
         original_ext = Path(original_filename).suffix.lower()
         
         # Determine if we need to convert HEIC
@@ -172,49 +338,82 @@ class PhotoService:
                 from pillow_heif import register_heif_opener
                 register_heif_opener()
                 
-                # Save temp HEIC file
-                temp_heic = f"/tmp/{timestamp}_{file_hash}{original_ext}"
-                file.save(temp_heic)
-                
-                # Open and convert to JPG
-                img = Image.open(temp_heic)
+                # Decode straight from the spool, no second temp file
+                if buffer is not None:
+                    buffer.seek(0)
+                img = Image.open(buffer if buffer is not None else spool_path)
                 
                 # Preserve EXIF data during conversion
                 exif_data = img.info.get('exif')
                 
-                new_filename = f"{timestamp}_{file_hash}.jpg"
-                file_path = self.upload_dir / new_filename
+                new_filename = f"{content_hash}.jpg"
+                fd, file_path = tempfile.mkstemp(suffix='.jpg', dir=self.incoming_dir)
+                os.close(fd)
                 
                 # Save as JPEG with EXIF
                 if exif_data:
-                    img.save(str(file_path), 'JPEG', quality=95, exif=exif_data)
+                    img.save(file_path, 'JPEG', quality=95, exif=exif_data)
                 else:
-                    img.save(str(file_path), 'JPEG', quality=95)
+                    img.save(file_path, 'JPEG', quality=95)
                 
-                # Clean up temp file
-                os.remove(temp_heic)
+                # The original HEIC is not kept
+                os.remove(spool_path)
                 
-                saved_ext = '.jpg'
                 print(f"Converted HEIC to JPG: {original_filename} -> {new_filename}")
+                return file_path, new_filename
                 
             except ImportError:
                 # pillow-heif not installed, save as-is
                 print(f"Warning: pillow-heif not installed. HEIC file saved as-is but may not display in browsers.")
-                new_filename = f"{timestamp}_{file_hash}{original_ext}"
-                file_path = self.upload_dir / new_filename
-                file.save(str(file_path))
-                saved_ext = original_ext
-                
-        else:
-            # Save regular image formats as-is
-            file_ext = original_ext if original_ext else '.jpg'
-            new_filename = f"{timestamp}_{file_hash}{file_ext}"
-            file_path = self.upload_dir / new_filename
-            file.save(str(file_path))
-            saved_ext = file_ext
-        
-        # Return relative path as URL
-        return f"/uploads/photos/{new_filename}", saved_ext
+                return spool_path, f"{content_hash}{original_ext}"
+        
+        # Save regular image formats as-is
+        file_ext = original_ext if original_ext else '.jpg'
+        return spool_path, f"{content_hash}{file_ext}"
+    
+    def generate_derivatives(self, source_path: str, content_hash: str) -> dict:
+        """
+        Store resized WebP and JPEG copies of a staged photo.
+        
+        The source is decoded once, in JPEG draft mode at the smallest scale
+        that still covers the largest derivative; each smaller size is then
+        resized from the previous one instead of from the original.
+        
+        Returns:
+            {size: {format: url}} as strings, or {} if the image can't be read
+        """
+        try:
+            with Image.open(source_path) as source:
+                # draft() only scales down when the result covers both sides
+                # of the box, so the box follows the photo's own shape; it is
+                # in stored (pre-rotation) pixels, like source.size
+                width, height = source.size
+                scale = min(DERIVATIVE_SIZES[0] / max(width, height), 1.0)
+                box = (math.ceil(width * scale), math.ceil(height * scale))
+                source.draft('RGB', box)
+                img = ImageOps.exif_transpose(source)
+            if img.mode not in ('RGB', 'L'):
+                img = img.convert('RGB')
+            
+            derivatives = {}
+            for size in DERIVATIVE_SIZES:
+                img.thumbnail((size, size), Image.Resampling.LANCZOS, reducing_gap=2.0)
+                derivatives[str(size)] = {}
+                for fmt, (pil_format, options) in DERIVATIVE_FORMATS.items():
+                    fd, path = tempfile.mkstemp(suffix=f'.{fmt}', dir=self.incoming_dir)
+                    os.close(fd)
+                    try:
+                        img.save(path, pil_format, **options)
+                        url = self.storage.put(path, shard_key(f"{content_hash}_{size}.{fmt}"))
+                    except Exception:
+                        if os.path.exists(path):
+                            os.remove(path)
+                        raise
+                    derivatives[str(size)][fmt] = url
+            return derivatives
+        except Exception as e:
+            print(f"Warning: could not create derivatives for {content_hash}: {e}")
+            return {}
     
     def find_or_create_location(
         self, 
@@ -222,28 +421,39 @@ class PhotoService:
         trip_id: int, 
         latitude: float, 
         longitude: float,
-        address: Optional[str] = None
+        address: Optional[str] = None,
+        radius_m: float = LOCATION_MATCH_RADIUS_M
     ) -> dict:
-        """Find existing location nearby or create a new one."""
-        # Search for locations within ~50 meters (roughly 0.0005 degrees)
-        threshold = 0.0005
+        """
+        Return the nearest location of the trip within radius_m, or create one.
+        
+        Candidates come from the LocationsRtree spatial index (kept in sync
+        with Locations by triggers); the exact distance is checked here.
+        """
+        min_x, max_x, min_y, max_y = bbox_around(latitude, longitude, radius_m)
         
+        # CROSS JOIN pins the R*Tree as the outer loop; otherwise the planner
+        # may walk every location of the trip via idx_locations_trip_id
         cursor = connection.execute(
             """
-            SELECT * FROM Locations 
-            WHERE trip_id = ? 
-            AND x BETWEEN ? AND ? 
-            AND y BETWEEN ? AND ?
-            LIMIT 1
+            SELECT Locations.* FROM LocationsRtree
+            CROSS JOIN Locations ON Locations.id = LocationsRtree.id
+            WHERE LocationsRtree.min_x <= ? AND LocationsRtree.max_x >= ?
+            AND LocationsRtree.min_y <= ? AND LocationsRtree.max_y >= ?
+            AND Locations.trip_id = ?
             """,
-            (trip_id, 
-             longitude - threshold, longitude + threshold,
-             latitude - threshold, latitude + threshold)
+            (max_x, min_x, max_y, min_y, trip_id)
         )
-        existing_location = cursor.fetchone()
         
-        if existing_location:
-            return existing_location
+        nearest = None
+        nearest_distance = radius_m
+        for candidate in cursor.fetchall():
+            distance = distance_m(latitude, longitude, candidate['y'], candidate['x'])
+            if distance <= nearest_distance:
+                nearest, nearest_distance = candidate, distance
+        
+        if nearest:
+            return nearest
         
         # Create new location
         created_at = int(datetime.now().timestamp())
@@ -252,27 +462,154 @@ class PhotoService:
             INSERT INTO Locations 
             (trip_id, x, y, name, address, created_at)
             VALUES (?, ?, ?, ?, ?, ?)
+            RETURNING *
             """,
             (trip_id, longitude, latitude, 
              f"Location at ({latitude:.4f}, {longitude:.4f})",
              address, created_at)
         )
+        return cursor.fetchone()
+    
+    def prepare_photo(self, spool_path: str, content_hash: str, original_filename: str) -> dict:
+        """
+        Run the CPU-bound part of the pipeline for one spooled upload.
         
-        location_id = cursor.lastrowid
+        Reads GPS and timestamp from a memory map of the spool file
+        and moves the photo to its permanent location. Never touches the
+        database, so it is safe to run in a worker process.
         
-        # Fetch the created location
+        Returns:
+            Dict with 'status' of 'ready', 'skipped' or 'error'
+        """
+        try:
+            with open(spool_path, 'rb') as f, \
+                    mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+                # Decide on GPS before any decoding or conversion
+                metadata = self.read_photo_metadata(buffer)
+                if metadata['latitude'] is None:
+                    return {'status': 'skipped', 'reason': 'No GPS data'}
+                
+                local_path, file_name = self.stage_photo_file(
+                    spool_path, content_hash, original_filename, buffer=buffer
+                )
+            
+            # Derivatives come from the local file before it is stored,
+            # which may move it to another machine
+            derivatives = self.generate_derivatives(local_path, content_hash)
+            try:
+                file_url = self.storage.put(local_path, shard_key(file_name))
+            except Exception:
+                # A converted HEIC is not a spool file, so nothing else removes it
+                if local_path != spool_path and os.path.exists(local_path):
+                    os.remove(local_path)
+                raise
+            
+            return {
+                'status': 'ready',
+                'latitude': metadata['latitude'],
+                'longitude': metadata['longitude'],
+                'taken_at': metadata['taken_at'],
+                'file_url': file_url,
+                'derivatives': derivatives,
+            }
+        except Exception as e:
+            return {'status': 'error', 'error': str(e)}
+    
+    def prepare_photos(self, staged: List[Tuple[str, str, str]], workers: int = 1) -> List[dict]:
+        """
+        Run prepare_photo over (spool_path, content_hash, original_filename) tuples.
+        
+        With more than one worker the files are spread over a process pool.
+        Results always come back in the order of ``staged``.
+        """
+        if workers <= 1 or len(staged) <= 1:
+            return [self.prepare_photo(*item) for item in staged]
+        
+        pool = self._get_pool(workers)
+        return list(pool.map(
+            _prepare_photo_worker,
+            [str(self.upload_dir)] * len(staged),
+            [self.storage_settings] * len(staged),
+            *zip(*staged),
+        ))
+    
+    def assign_cover_photos(self, connection, created_photos: List[dict]) -> None:
+        """
+        Make the first new photo of each location its cover, unless the
+        location already has one.
+        """
+        first_by_location = {}
+        for photo in created_photos:
+            first_by_location.setdefault(photo['location_id'], photo)
+        if not first_by_location:
+            return
+        
+        location_ids = list(first_by_location)
         cursor = connection.execute(
-            "SELECT * FROM Locations WHERE id = ?", 
-            (location_id,)
+            f"""
+            SELECT DISTINCT location_id FROM Photos
+            WHERE location_id IN ({','.join('?' * len(location_ids))}) AND is_cover_photo = 1
+            """,
+            location_ids
         )
-        return cursor.fetchone()
+        for row in cursor.fetchall():
+            del first_by_location[row['location_id']]
+        
+        covers = list(first_by_location.values())
+        if not covers:
+            return
+        connection.execute(
+            f"UPDATE Photos SET is_cover_photo = 1 WHERE id IN ({','.join('?' * len(covers))})",
+            [photo['id'] for photo in covers]
+        )
+        for photo in covers:
+            photo['is_cover_photo'] = True
+            print(f"⭐ Set {photo['original_filename']} as cover photo")
+    
+    def find_purged(self, connection, content_hashes: List[str], since: int) -> set:
+        """
+        Return the hashes among content_hashes whose files the file cleaner
+        may have deleted at or after since: claimed for purging and not
+        done, or done since then.
+        """
+        unique_hashes = list(set(content_hashes))
+        purged = set()
+        for start in range(0, len(unique_hashes), 500):
+            chunk = unique_hashes[start:start + 500]
+            cursor = connection.execute(
+                f"""
+                SELECT DISTINCT content_hash FROM FilePurgeQueue
+                WHERE content_hash IN ({','.join('?' * len(chunk))})
+                AND claimed_at IS NOT NULL AND (purged_at IS NULL OR purged_at >= ?)
+                """,
+                [*chunk, since]
+            )
+            purged.update(row['content_hash'] for row in cursor.fetchall())
+        return purged
+    
+    def find_blobs(self, connection, content_hashes: List[str]) -> dict:
+        """Return the stored PhotoBlobs rows for the given hashes, keyed by hash."""
+        unique_hashes = list(set(content_hashes))
+        blobs = {}
+        # Stay well below SQLite's bound-parameter limit
+        for start in range(0, len(unique_hashes), 500):
+            chunk = unique_hashes[start:start + 500]
+            cursor = connection.execute(
+                f"SELECT * FROM PhotoBlobs WHERE content_hash IN ({','.join('?' * len(chunk))})",
+                chunk
+            )
+            for blob in cursor.fetchall():
+                blobs[blob['content_hash']] = blob
+        return blobs
     
     def batch_upload_photos(
         self,
         connection,
         files: List,  # List of FileStorage objects from Flask
         trip_id: int,
-        user_id: int
+        user_id: int,
+        workers: int = 1,
+        writer: Optional[GroupCommitWriter] = None
     ) -> List[dict]:
         """
         Batch upload photos with EXIF extraction and auto-location creation.
@@ -282,107 +619,135 @@ class PhotoService:
             files: List of FileStorage objects from Flask request
             trip_id: ID of the trip these photos belong to
             user_id: ID of the user uploading the photos
+            workers: Number of worker processes (1 processes inline)
+            writer: Optional group-commit writer for the database phase
             
         Returns:
             List of created photo dictionaries
         """
-        created_photos = []
+        # Stream each upload to disk once; FileStorage objects cannot be
+        # handed to another process, spool paths can
+        staged = []
+        try:
+            for file in files:
+                spool_path, content_hash = self.spool_upload(file)
+                staged.append((spool_path, content_hash, file.filename))
+        except Exception:
+            for spool_path, _, _ in staged:
+                os.remove(spool_path)
+            raise
+        
+        results = self.ingest_spooled(
+            connection, staged, trip_id, user_id, workers, writer=writer
+        )
+        return [result['photo'] for result in results if result['status'] == 'created']
+    
+    def ingest_spooled(
+        self,
+        connection,
+        staged: List[Tuple[str, str, str]],
+        trip_id: int,
+        user_id: int,
+        workers: int = 1,
+        commit: bool = True,
+        writer: Optional[GroupCommitWriter] = None
+    ) -> List[dict]:
+        """
+        Run already-spooled uploads through the ingest pipeline.
+        
+        EXIF parsing, HEIC conversion and file saving run in a process pool
+        when workers > 1; all database writes stay on the calling thread.
+        Uploads whose SHA-256 is already stored skip all of that and are
+        linked to the existing blob. Spool files are consumed either way.
+        
+        Args:
+            connection: SQLite database connection
+            staged: List of (spool_path, content_hash, original_filename)
+            trip_id: ID of the trip these photos belong to
+            user_id: ID of the user uploading the photos
+            workers: Number of worker processes (1 processes inline)
+            commit: Commit when done; pass False to commit together with
+                the caller's own bookkeeping
+            writer: Apply the database phase through this group-commit
+                writer instead of on connection
+            
+        Returns:
+            One result per staged file, in order, with 'filename', 'status'
+            ('created', 'skipped' or 'error') and 'photo' or 'error'
+        """
         skipped_photos = []
+        # Purges that may delete files stored from here on conflict with this batch
+        started = int(datetime.now().timestamp())
         
-        for file in files:
-            try:
-                original_filename = file.filename
-                print(f"\nProcessing: {original_filename}")
-                
-                # Save file temporarily to extract EXIF
-                temp_path = f"/tmp/{original_filename}"
-                file.seek(0)
-                file.save(temp_path)
-                
-                # Extract EXIF data
-                exif_data = self.extract_exif_data(temp_path)
-                
-                # Get GPS coordinates
-                gps_coords = None
-                if 'GPSInfo' in exif_data:
-                    gps_coords = self.convert_gps_to_decimal(exif_data['GPSInfo'])
-                
-                if not gps_coords:
-                    print(f"⚠️  No GPS data found for {original_filename}, skipping...")
-                    skipped_photos.append(original_filename)
-                    os.remove(temp_path)
-                    continue
-                
-                latitude, longitude = gps_coords
-                print(f"📍 GPS: {latitude:.6f}, {longitude:.6f}")
-                
-                # Find or create location
-                location = self.find_or_create_location(
-                    connection, trip_id, latitude, longitude
-                )
-                
-                # Save photo file permanently (reopen from temp)
-                with open(temp_path, 'rb') as f:
-                    from werkzeug.datastructures import FileStorage
-                    file_storage = FileStorage(f, filename=original_filename)
-                    file_url, saved_ext = self.save_photo_file(file_storage, original_filename)
-                
-                print(f"💾 Saved to: {file_url}")
-                
-                # Extract timestamp
-                taken_at = self.extract_datetime(exif_data)
-                if not taken_at:
-                    taken_at = int(datetime.now().timestamp())
-                
-                # Create Photo record
-                cursor = connection.execute(
-                    """
-                    INSERT INTO Photos 
-                    (location_id, user_id, x, y, file_url, original_filename, taken_at, is_cover_photo)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-                    """,
-                    (location['id'], user_id, longitude, latitude, file_url, 
-                     original_filename, taken_at, False)
-                )
-                
-                photo_id = cursor.lastrowid
-                
-                # Fetch created photo
-                cursor = connection.execute(
-                    "SELECT * FROM Photos WHERE id = ?",
-                    (photo_id,)
-                )
-                photo = cursor.fetchone()
-                created_photos.append(photo)
-                
-                # Clean up temp file
-                os.remove(temp_path)
-                
-                print(f"✅ Successfully uploaded {original_filename}")
-                
-            except Exception as e:
-                print(f"❌ Error processing {file.filename}: {e}")
-                skipped_photos.append(file.filename)
-                continue
+        try:
+            # Known content is not decoded again, and content repeated
+            # within the batch is only processed once
+            known_blobs = self.find_blobs(connection, [item[1] for item in staged])
+            pending = {}
+            for item in staged:
+                if item[1] not in known_blobs and item[1] not in pending:
+                    pending[item[1]] = item
+            prepared = dict(zip(
+                pending, self.prepare_photos(list(pending.values()), workers)
+            ))
+        finally:
+            # Skipped, failed and duplicate files are never moved out of the spool
+            for spool_path, _, _ in staged:
+                if os.path.exists(spool_path):
+                    os.remove(spool_path)
         
-        # Set first photo as cover if no cover exists for that location
-        if created_photos:
-            location_id = created_photos[0]['location_id']
-            cursor = connection.execute(
-                "SELECT * FROM Photos WHERE location_id = ? AND is_cover_photo = 1",
-                (location_id,)
-            )
-            existing_cover = cursor.fetchone()
+        # Resolve every file's outcome first; only photos with GPS go on
+        results = [None] * len(staged)
+        ready = []
+        for index, (_, content_hash, original_filename) in enumerate(staged):
+            if content_hash in known_blobs:
+                blob = known_blobs[content_hash]
+                result = {
+                    'status': 'ready',
+                    'latitude': blob['y'],
+                    'longitude': blob['x'],
+                    'taken_at': blob['taken_at'],
+                    'file_url': blob['file_url'],
+                    'derivatives': json.loads(blob['derivatives'] or '{}'),
+                }
+            else:
+                result = prepared[content_hash]
             
-            if not existing_cover:
-                connection.execute(
-                    "UPDATE Photos SET is_cover_photo = 1 WHERE id = ?",
-                    (created_photos[0]['id'],)
-                )
-                created_photos[0]['is_cover_photo'] = True
-                print(f"⭐ Set {created_photos[0]['original_filename']} as cover photo")
+            print(f"\nProcessing: {original_filename}")
+            
+            if result['status'] == 'skipped':
+                print(f"⚠️  No GPS data found for {original_filename}, skipping...")
+                skipped_photos.append(original_filename)
+                results[index] = {'filename': original_filename, 'status': 'skipped',
+                                  'error': result['reason']}
+                continue
+            
+            if result['status'] == 'error':
+                print(f"❌ Error processing {original_filename}: {result['error']}")
+                skipped_photos.append(original_filename)
+                results[index] = {'filename': original_filename, 'status': 'error',
+                                  'error': result['error']}
+                continue
+            
+            print(f"📍 GPS: {result['latitude']:.6f}, {result['longitude']:.6f}")
+            print(f"💾 Saved to: {result['file_url']}")
+            ready.append((index, content_hash, original_filename, result))
         
-        connection.commit()
+        # All database work for the batch happens in one explicit transaction
+        if writer is not None:
+            versions = writer.run(self.store_batch, ready, trip_id, user_id,
+                                  results, skipped_photos, started)
+        else:
+            if not connection.in_transaction:
+                connection.execute("BEGIN IMMEDIATE")
+            versions = self.store_batch(connection, ready, trip_id, user_id,
+                                        results, skipped_photos, started)
+            if commit:
+                connection.commit()
+        created_photos = [r['photo'] for r in results if r['status'] == 'created']
+        # Uncommitted work may still be rolled back; the cache rebuilds then
+        if writer is not None or commit:
+            cluster_cache.apply_write(*versions, added={trip_id: created_photos})
         
         # Print summary
         print(f"\n{'='*60}")
@@ -393,7 +758,134 @@ class PhotoService:
                 print(f"   - {filename}")
         print(f"{'='*60}\n")
         
-        return created_photos
+        return results
+
+    def store_batch(
+        self,
+        connection,
+        ready: List[Tuple[int, str, str, dict]],
+        trip_id: int,
+        user_id: int,
+        results: List[Optional[dict]],
+        skipped_photos: List[str],
+        started: int
+    ) -> Tuple[Dict[int, int], Dict[int, int]]:
+        """
+        Database phase of ingest: blobs, locations, photos and covers.
+        
+        Runs inside the caller's transaction and never commits, so it can be
+        applied as one operation of a group-commit writer.
+        
+        Args:
+            ready: List of (index, content_hash, original_filename, prepared)
+                for files that have GPS data
+            results: Per-file results, filled in at each file's index
+            skipped_photos: Collects filenames that failed to store
+            started: Timestamp taken before the batch stored any file
+            
+        Returns:
+            The trip's versions before and after the batch, for
+            ClusterCache.apply_write
+        """
+        before = trip_versions(connection, [trip_id])
+        # Blobs are looked up again under the write lock: one found before
+        # decoding may have lost its last photo since. Content without a
+        # blob is only safe to register if no purge of it has run since
+        # the batch began; one that has may have deleted files it stored.
+        stored_blobs = self.find_blobs(connection, [item[1] for item in ready])
+        missing = self.find_purged(
+            connection,
+            [item[1] for item in ready if item[1] not in stored_blobs],
+            started
+        )
+        if missing:
+            for index, content_hash, original_filename, _ in ready:
+                if content_hash in missing:
+                    print(f"❌ Error processing {original_filename}: stored files were removed")
+                    skipped_photos.append(original_filename)
+                    results[index] = {'filename': original_filename, 'status': 'error',
+                                      'error': 'Stored file was removed, upload it again'}
+            ready = [item for item in ready if item[1] not in missing]
+        
+        # Register blobs for content stored by this batch, or stored before
+        # and released since
+        now = int(datetime.now().timestamp())
+        new_blobs = {}
+        for _, content_hash, _, result in ready:
+            if content_hash not in stored_blobs and content_hash not in new_blobs:
+                derivatives = result['derivatives']
+                new_blobs[content_hash] = (
+                    content_hash, result['file_url'],
+                    derivatives.get(str(THUMBNAIL_SIZE), {}).get('webp'),
+                    json.dumps(derivatives), result['longitude'], result['latitude'],
+                    result['taken_at'], now
+                )
+        connection.executemany(
+            """
+            INSERT OR IGNORE INTO PhotoBlobs
+            (content_hash, file_url, thumbnail_url, derivatives, x, y, taken_at, ref_count, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, 0, ?)
+            """,
+            list(new_blobs.values())
+        )
+        
+        # Group the batch in memory so each cluster of nearby photos costs a
+        # single location lookup
+        groups = group_points(
+            [(item[3]['latitude'], item[3]['longitude']) for item in ready],
+            LOCATION_MATCH_RADIUS_M
+        )
+        
+        pending_rows = []
+        for group in groups:
+            seed = ready[group[0]][3]
+            try:
+                location = self.find_or_create_location(
+                    connection, trip_id, seed['latitude'], seed['longitude']
+                )
+            except Exception as e:
+                for member in group:
+                    index, _, original_filename, _ = ready[member]
+                    print(f"❌ Error processing {original_filename}: {e}")
+                    skipped_photos.append(original_filename)
+                    results[index] = {'filename': original_filename, 'status': 'error',
+                                      'error': str(e)}
+                continue
+            
+            for member in group:
+                index, content_hash, original_filename, result = ready[member]
+                derivatives = result['derivatives']
+                pending_rows.append((index, (
+                    location['id'], user_id, result['longitude'], result['latitude'],
+                    result['file_url'],
+                    derivatives.get(str(THUMBNAIL_SIZE), {}).get('webp'),
+                    json.dumps(derivatives), content_hash, original_filename,
+                    result['taken_at'] or now, False,
+                    geohash.encode(result['latitude'], result['longitude'])
+                )))
+        
+        # Create Photo records in bulk, getting the rows back via RETURNING
+        chunk_size = insert_chunk_size(len(PHOTO_INSERT_COLUMNS))
+        for start in range(0, len(pending_rows), chunk_size):
+            chunk = pending_rows[start:start + chunk_size]
+            try:
+                photos = insert_returning(
+                    connection, 'Photos', PHOTO_INSERT_COLUMNS, [row for _, row in chunk]
+                )
+            except Exception as e:
+                for index, row in chunk:
+                    print(f"❌ Error processing {row[8]}: {e}")
+                    skipped_photos.append(row[8])
+                    results[index] = {'filename': row[8], 'status': 'error', 'error': str(e)}
+                continue
+            
+            for (index, row), photo in zip(chunk, photos):
+                results[index] = {'filename': row[8], 'status': 'created', 'photo': photo}
+                print(f"✅ Successfully uploaded {row[8]}")
+        
+        created_photos = [r['photo'] for r in results if r['status'] == 'created']
+        self.assign_cover_photos(connection, created_photos)
+        return before, trip_versions(connection, [trip_id])
 
 
 # Singleton instance
@@ -0,0 +1,159 @@
+"""On-demand resized photo renditions with a bounded on-disk LRU cache.
+
+A rendition is named after its source file and request,
+<stem>_<w>x<h>.<fmt> (0 for an unbounded side), so its bytes never change
+and the name can serve as its ETag. Concurrent misses for one name are
+coalesced: the first request renders and the others wait for it.
+"""
+import os
+import threading
+import uuid
+from collections import OrderedDict
+from concurrent.futures import Future
+from pathlib import Path
+from typing import Callable, Optional
+
+from PIL import Image, ImageOps
+
+from app.photo_service import DERIVATIVE_FORMATS
+
+# EXIF orientations that swap width and height
+TRANSPOSED_ORIENTATIONS = {5, 6, 7, 8}
+ORIENTATION_TAG = 0x0112
+
+
+def rendition_name(source_name: str, width: Optional[int], height: Optional[int],
+                   fmt: str) -> str:
+    return f"{Path(source_name).stem}_{width or 0}x{height or 0}.{fmt}"
+
+
+def render(source: Path, target: Path, width: Optional[int], height: Optional[int],
+           fmt: str):
+    """
+    Write source scaled to fit within width x height (never enlarged).
+
+    JPEG sources are decoded in draft mode at the smallest DCT scale that
+    still covers the output, and the final resize reduces by whole factors
+    before resampling.
+    """
+    pil_format, options = DERIVATIVE_FORMATS[fmt]
+    with Image.open(source) as image:
+        transposed = image.getexif().get(ORIENTATION_TAG) in TRANSPOSED_ORIENTATIONS
+        full_width, full_height = (image.height, image.width) if transposed else image.size
+        scale = min(width / full_width if width else 1.0,
+                    height / full_height if height else 1.0,
+                    1.0)
+        size = (max(1, round(full_width * scale)), max(1, round(full_height * scale)))
+
+        image.draft('RGB', (size[1], size[0]) if transposed else size)
+        img = ImageOps.exif_transpose(image)
+
+    if img.mode not in ('RGB', 'L'):
+        img = img.convert('RGB')
+    if img.size != size:
+        img = img.resize(size, Image.Resampling.LANCZOS, reducing_gap=2.0)
+    img.save(target, pil_format, **options)
+
+
+class RenditionCache:
+    """
+    Rendered files in MEDIA_CACHE_DIR, evicted least recently used first
+    once they exceed MEDIA_CACHE_BYTES.
+
+    Recency is tracked in memory and mirrored to file mtimes, which seed
+    the order when a process starts. Each process evicts on its own view;
+    a file another process removed is simply rendered again.
+    """
+
+    def __init__(self):
+        self.config = None
+        self._entries: 'OrderedDict[str, int]' = OrderedDict()  # name -> bytes
+        self._bytes = 0
+        self._loaded = False
+        self._inflight = {}
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.config = app.config
+
+    @property
+    def directory(self) -> Path:
+        return Path(self.config['MEDIA_CACHE_DIR'])
+
+    def get(self, name: str, render_to: Callable[[Path], None]) -> Path:
+        """
+        Return the path of a cached rendition, creating it on a miss.
+
+        Args:
+            name: Rendition file name, from rendition_name
+            render_to: Writes the rendition to the path it is given
+
+        Returns:
+            Path of the cached file
+        """
+        path = self.directory / name
+        with self._lock:
+            self._load()
+            future = self._inflight.get(name)
+            owner = False
+            if future is None and path.exists():
+                # Possibly rendered by another process since _load
+                if name not in self._entries:
+                    self._entries[name] = path.stat().st_size
+                    self._bytes += self._entries[name]
+                self._entries.move_to_end(name)
+                os.utime(path)
+                return path
+            if future is None:
+                future = self._inflight[name] = Future()
+                owner = True
+
+        if not owner:
+            return future.result()
+
+        temporary = path.with_name(f".{name}.{uuid.uuid4().hex}.tmp")
+        try:
+            render_to(temporary)
+            # Readers in other processes only ever see complete files
+            os.replace(temporary, path)
+            self._add(name, path.stat().st_size)
+            future.set_result(path)
+            return path
+        except BaseException as e:
+            temporary.unlink(missing_ok=True)
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                del self._inflight[name]
+
+    def _load(self):
+        """Index the files already on disk, oldest first; caller holds the lock."""
+        if self._loaded:
+            return
+        self.directory.mkdir(parents=True, exist_ok=True)
+        files = []
+        for entry in os.scandir(self.directory):
+            if entry.name.startswith('.'):
+                # A render in progress, possibly in another process
+                continue
+            stat = entry.stat()
+            files.append((stat.st_mtime, entry.name, stat.st_size))
+        for _, name, size in sorted(files):
+            self._entries[name] = size
+            self._bytes += size
+        self._loaded = True
+
+    def _add(self, name: str, size: int):
+        with self._lock:
+            self._bytes += size - self._entries.pop(name, 0)
+            self._entries[name] = size
+            # Never evict the rendition that is about to be served
+            while self._bytes > self.config['MEDIA_CACHE_BYTES'] and len(self._entries) > 1:
+                oldest, oldest_size = self._entries.popitem(last=False)
+                self._bytes -= oldest_size
+                (self.directory / oldest).unlink(missing_ok=True)
+
+
+# Singleton instance
+rendition_cache = RenditionCache()
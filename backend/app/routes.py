@@ -1,16 +1,29 @@
 """REST API for localization."""
+import math
+import os
 import re
 import flask
 import uuid 
 import hashlib
 from app import app
-from app.db import get_db
+from app.clustering import cluster_cache, photo_trip_versions, trip_versions
+from app.db import get_db, get_read_db, get_writer, run_write
+from app.file_cleanup import file_cleaner
+from app.geo import parse_bbox
+from app.geohash import GEOHASH_PRECISION
+from app.ingest_queue import ingest_queue
+from app.photo_queries import (
+    MAP_FIELDS, PHOTO_FIELDS, find_user_photos_in_bbox, find_user_photos_near, format_cursor,
+    group_user_photos_by_tile, iter_location_photos, parse_cursor, parse_fields
+)
+from app.photo_edits import delete_photos, move_photos, set_cover_photos
 from app.photo_service import photo_service
+from app.upload_sessions import UploadSessionError, upload_session_service
 
 
 @app.route('/')
 def get_index():
-    connection = get_db()
+    connection = get_read_db()
     cur = connection.execute(...)
     context = cur.fetchall()
 
@@ -41,9 +54,31 @@ def batch_upload_photos():
     if trip['user_id'] != user_id:
         return flask.jsonify({'success': False, 'error': 'Not authorized'}), 403
     
+    # async=1: store the raw files, queue them and answer right away
+    if flask.request.form.get('async', '').lower() in ('1', 'true', 'yes'):
+        staged = []
+        try:
+            for file in files:
+                spool_path, content_hash = photo_service.spool_upload(file)
+                staged.append((spool_path, content_hash, file.filename))
+            job_id = ingest_queue.enqueue(connection, staged, trip_id, user_id)
+        except Exception as e:
+            for spool_path, _, _ in staged:
+                os.remove(spool_path)
+            return flask.jsonify({'success': False, 'error': f'Error: {str(e)}'}), 500
+        
+        return flask.jsonify({
+            'success': True,
+            'job_id': job_id,
+            'status_url': flask.url_for('get_ingest_job', job_id=job_id),
+            'message': f'Queued {len(staged)} photos'
+        }), 202
+    
     try:
         created_photos = photo_service.batch_upload_photos(
-            connection=connection, files=files, trip_id=trip_id, user_id=user_id
+            connection=connection, files=files, trip_id=trip_id, user_id=user_id,
+            workers=flask.current_app.config['INGEST_WORKERS'],
+            writer=get_writer(flask.current_app.config)
         )
         
         return flask.jsonify({
@@ -56,17 +91,221 @@ def batch_upload_photos():
         return flask.jsonify({'success': False, 'error': f'Error: {str(e)}'}), 500
 
 
+@app.route('/api/jobs/<int:job_id>', methods=['GET'])
+def get_ingest_job(job_id):
+    """Report progress of a queued batch upload."""
+    job = ingest_queue.get_job(get_read_db(), job_id)
+    
+    if not job:
+        return flask.jsonify({'success': False, 'error': 'Job not found'}), 404
+    
+    return flask.jsonify({'success': True, 'job': job})
+
+
+@app.route('/api/uploads', methods=['POST'])
+def create_upload_session():
+    """Start a resumable chunked upload.
+    
+    JSON body: {trip_id, user_id, files: [{filename, size}, ...]}
+    """
+    data = flask.request.get_json(silent=True)
+    if not isinstance(data, dict):
+        data = {}
+    trip_id = data.get('trip_id')
+    user_id = data.get('user_id')
+    
+    if type(trip_id) is not int or type(user_id) is not int:
+        return flask.jsonify({'success': False, 'error': 'trip_id and user_id required'}), 400
+    
+    connection = get_db()
+    
+    cursor = connection.execute("SELECT * FROM Trips WHERE id = ?", (trip_id,))
+    trip = cursor.fetchone()
+    
+    if not trip:
+        return flask.jsonify({'success': False, 'error': 'Trip not found'}), 404
+    
+    if trip['user_id'] != user_id:
+        return flask.jsonify({'success': False, 'error': 'Not authorized'}), 403
+    
+    try:
+        session = upload_session_service.create_session(
+            connection, trip_id, user_id, data.get('files') or []
+        )
+    except UploadSessionError as e:
+        return flask.jsonify({'success': False, 'error': e.message}), e.status_code
+    
+    return flask.jsonify({
+        'success': True,
+        'session': session,
+        'chunk_size': flask.current_app.config['UPLOAD_CHUNK_SIZE']
+    }), 201
+
+
+@app.route('/api/uploads/<session_id>', methods=['GET'])
+def get_upload_session(session_id):
+    """Report which byte ranges of each file the server already has."""
+    session = upload_session_service.get_session(get_read_db(), session_id)
+    
+    if not session:
+        return flask.jsonify({'success': False, 'error': 'Upload session not found'}), 404
+    
+    return flask.jsonify({'success': True, 'session': session})
+
+
+@app.route('/api/uploads/<session_id>/files/<int:file_index>', methods=['PUT'])
+def put_upload_chunk(session_id, file_index):
+    """Store the request body at ?offset= in one file of an upload session.
+    
+    The file enters the photo pipeline as soon as its last byte arrives.
+    """
+    offset = flask.request.args.get('offset', type=int)
+    length = flask.request.content_length
+    
+    if offset is None or not length:
+        return flask.jsonify({'success': False, 'error': 'offset and a non-empty body required'}), 400
+    
+    try:
+        result = upload_session_service.write_chunk(
+            get_db(), session_id, file_index, offset, flask.request.stream, length
+        )
+    except UploadSessionError as e:
+        return flask.jsonify({'success': False, 'error': e.message}), e.status_code
+    
+    return flask.jsonify({'success': True, 'file': result})
+
+
+@app.route('/api/uploads/<session_id>/finalize', methods=['POST'])
+def finalize_upload_session(session_id):
+    """Close an upload session once every file has been received."""
+    try:
+        summary = upload_session_service.finalize(get_db(), session_id)
+    except UploadSessionError as e:
+        return flask.jsonify({'success': False, 'error': e.message}), e.status_code
+    
+    return flask.jsonify({
+        'success': True,
+        'photos_uploaded': len(summary['photos']),
+        'photos': summary['photos'],
+        'skipped': summary['skipped'],
+        'message': f"Successfully uploaded {len(summary['photos'])} photos"
+    })
+
+
+# Photos serialized per chunk of a streamed listing
+STREAM_CHUNK_ROWS = 200
+
+
+def parse_page_args(default_fields=None, default_limit=None):
+    """Read fields=, after= and limit= of a photo listing request.
+    
+    Returns (fields, after, limit, error); limit is clamped to
+    MAX_PHOTOS_PER_PAGE and stays None when neither given nor defaulted.
+    """
+    args = flask.request.args
+    fields = parse_fields(args.get('fields'), default_fields or MAP_FIELDS)
+    if fields is None:
+        return None, None, None, 'Unknown field in fields'
+    
+    after = None
+    if 'after' in args:
+        after = parse_cursor(args['after'])
+        if after is None:
+            return None, None, None, 'after must be "<taken_at>,<id>"'
+    
+    limit = args.get('limit', default=default_limit, type=int)
+    if limit is not None:
+        limit = max(1, min(limit, flask.current_app.config['MAX_PHOTOS_PER_PAGE']))
+    return fields, after, limit, None
+
+
+def stream_photo_page(rows, limit):
+    """Stream {"success", "photos", "next_after"} without materializing rows.
+    
+    rows: cursor from a listing query run with limit + 1, so one extra row
+    tells whether another page follows; next_after is the cursor to pass
+    as after= for that page, or null on the last one.
+    """
+    def generate():
+        yield '{"success": true, "photos": ['
+        chunk = []
+        count = 0
+        last = None
+        more = False
+        for row in rows:
+            if count == limit:
+                more = True
+                break
+            chunk.append(flask.json.dumps(row))
+            count += 1
+            last = row
+            if len(chunk) == STREAM_CHUNK_ROWS:
+                yield ('' if count == len(chunk) else ',') + ','.join(chunk)
+                chunk = []
+        if chunk:
+            yield ('' if count == len(chunk) else ',') + ','.join(chunk)
+        
+        next_after = format_cursor(last) if more else None
+        yield f'], "next_after": {flask.json.dumps(next_after)}}}'
+    
+    # Keeps the request's read connection open until the last row is sent
+    return flask.Response(flask.stream_with_context(generate()), mimetype='application/json')
+
+
+def version_etag(kind, object_id, version):
+    """ETag of a read response, from the version of the trip or location it shows.
+    
+    The query string is part of it, since fields=, bbox= and the like
+    change the body.
+    """
+    digest = hashlib.sha1(flask.request.query_string).hexdigest()[:12]
+    return f"{kind}{object_id}-v{version}-{digest}"
+
+
+def not_modified(etag):
+    """Return a 304 response if the client already holds etag, else None."""
+    if etag in flask.request.if_none_match:
+        return with_etag(flask.Response(status=304), etag)
+    return None
+
+
+def with_etag(response, etag):
+    response.set_etag(etag)
+    # Clients keep the body but must revalidate before reusing it
+    response.cache_control.no_cache = True
+    return response
+
+
 @app.route('/api/photos/location/<int:location_id>', methods=['GET'])
 def get_photos_by_location(location_id):
-    """Get all photos for a location."""
-    connection = get_db()
-    cursor = connection.execute(
-        "SELECT * FROM Photos WHERE location_id = ?",
-        (location_id,)
+    """Get a location's photos in the order they were taken.
+    
+    Query (all optional): fields=<col,...>&after=<taken_at,id>&limit=<n>
+    Without limit every photo is returned, streamed.
+    """
+    fields, after, limit, error = parse_page_args(default_fields=PHOTO_FIELDS)
+    
+    if error:
+        return flask.jsonify({'success': False, 'error': error}), 400
+    
+    connection = get_read_db()
+    # Read before the rows: a concurrent change can only leave the tag
+    # older than the body, which costs the client one more full response
+    cursor = connection.execute("SELECT version FROM Locations WHERE id = ?", (location_id,))
+    location = cursor.fetchone()
+    etag = None
+    if location:
+        etag = version_etag('location', location_id, location['version'])
+        response = not_modified(etag)
+        if response:
+            return response
+    
+    rows = iter_location_photos(
+        connection, location_id, fields, after, None if limit is None else limit + 1
     )
-    photos = cursor.fetchall()
     
-    return flask.jsonify({'success': True, 'photos': photos})
+    response = stream_photo_page(rows, limit)
+    return with_etag(response, etag) if etag else response
 
 
 @app.route('/api/photos/<int:photo_id>/set-cover', methods=['PATCH', 'POST'])
@@ -87,19 +326,20 @@ def set_cover_photo(photo_id):
     if photo['user_id'] != user_id:
         return flask.jsonify({'success': False, 'error': 'Not authorized'}), 403
     
-    # Remove old cover
-    connection.execute(
-        "UPDATE Photos SET is_cover_photo = 0 WHERE location_id = ?",
-        (photo['location_id'],)
-    )
-    
-    # Set new cover
-    connection.execute(
-        "UPDATE Photos SET is_cover_photo = 1 WHERE id = ?",
-        (photo_id,)
-    )
+    def apply_cover(connection):
+        # Remove old cover
+        connection.execute(
+            "UPDATE Photos SET is_cover_photo = 0 WHERE location_id = ? AND is_cover_photo = 1",
+            (photo['location_id'],)
+        )
+        
+        # Set new cover
+        connection.execute(
+            "UPDATE Photos SET is_cover_photo = 1 WHERE id = ?",
+            (photo_id,)
+        )
     
-    connection.commit()
+    run_write(apply_cover)
     
     return flask.jsonify({'success': True, 'message': 'Cover photo updated'})
 
@@ -125,14 +365,266 @@ def delete_photo(photo_id):
     if photo['user_id'] != user_id:
         return flask.jsonify({'success': False, 'error': 'Not authorized'}), 403
     
-    # Delete file from storage
-    import os
-    file_path = f".{photo['file_url']}"  # Convert URL to file path
-    if os.path.exists(file_path):
-        os.remove(file_path)
+    def apply_delete(connection):
+        before = photo_trip_versions(connection, [photo_id])
+        # Triggers queue the files once no other photo shares the content;
+        # the file cleaner removes them in the background
+        connection.execute("DELETE FROM Photos WHERE id = ?", (photo_id,))
+        return before, trip_versions(connection, before)
+    
+    before, after = run_write(apply_delete)
+    cluster_cache.apply_write(before, after, removed=[photo_id])
+    file_cleaner.wake()
+    
+    return flask.jsonify({'success': True, 'message': 'Photo deleted'})
+
+
+def parse_batch_args():
+    """Read user_id and photo_ids from a batch edit's JSON body.
+    
+    Returns:
+        (user_id, photo_ids, body, error response or None); duplicate ids
+        are dropped, keeping request order
+    """
+    data = flask.request.get_json(silent=True) or {}
+    user_id = data.get('user_id')
+    photo_ids = data.get('photo_ids')
+    limit = flask.current_app.config['MAX_PHOTOS_PER_BATCH']
+    
+    # JSON booleans are ints to isinstance()
+    if type(user_id) is not int or not isinstance(photo_ids, list) or not photo_ids:
+        error = flask.jsonify({'success': False, 'error': 'user_id and photo_ids required'}), 400
+        return None, None, data, error
+    
+    if not all(type(photo_id) is int for photo_id in photo_ids) or len(photo_ids) > limit:
+        error = flask.jsonify({
+            'success': False,
+            'error': f"photo_ids must be a list of at most {limit} ids"
+        }), 400
+        return None, None, data, error
+    
+    return user_id, list(dict.fromkeys(photo_ids)), data, None
+
+
+@app.route('/api/photos/batch-delete', methods=['POST'])
+def batch_delete_photos():
+    """Delete many photos in one transaction.
+    
+    JSON body: {user_id, photo_ids: [...]}; each id gets its own result
+    """
+    user_id, photo_ids, _, error = parse_batch_args()
+    if error:
+        return error
+    
+    def apply_delete(connection):
+        before = photo_trip_versions(connection, photo_ids)
+        results, deleted = delete_photos(connection, user_id, photo_ids)
+        return results, deleted, before, trip_versions(connection, before)
+    
+    results, deleted, before, after = run_write(apply_delete)
+    cluster_cache.apply_write(before, after, removed=[photo['id'] for photo in deleted])
+    if deleted:
+        file_cleaner.wake()
+    
+    return flask.jsonify({'success': True, 'results': results})
+
+
+@app.route('/api/photos/batch-move', methods=['POST'])
+def batch_move_photos():
+    """Move many photos to another location in one transaction.
+    
+    JSON body: {user_id, photo_ids: [...], location_id}
+    """
+    user_id, photo_ids, data, error = parse_batch_args()
+    if error:
+        return error
+    
+    location_id = data.get('location_id')
+    if type(location_id) is not int:
+        return flask.jsonify({'success': False, 'error': 'location_id required'}), 400
+    
+    cursor = get_db().execute(
+        """
+        SELECT Locations.trip_id, Trips.user_id
+        FROM Locations JOIN Trips ON Trips.id = Locations.trip_id
+        WHERE Locations.id = ?
+        """,
+        (location_id,)
+    )
+    location = cursor.fetchone()
+    
+    if not location:
+        return flask.jsonify({'success': False, 'error': 'Location not found'}), 404
+    
+    if location['user_id'] != user_id:
+        return flask.jsonify({'success': False, 'error': 'Not authorized'}), 403
+    
+    def apply_move(connection):
+        before = photo_trip_versions(connection, photo_ids)
+        before.update(trip_versions(connection, [location['trip_id']]))
+        results, photos = move_photos(connection, user_id, photo_ids, location_id)
+        return results, photos, before, trip_versions(connection, before)
+    
+    results, photos, before, after = run_write(apply_move)
+    # Photos keep their coordinates, so only moves between trips change clusters
+    other_trips = [photo for photo in photos if photo['trip_id'] != location['trip_id']]
+    cluster_cache.apply_write(
+        before, after,
+        added={location['trip_id']: other_trips},
+        removed=[photo['id'] for photo in other_trips]
+    )
+    
+    return flask.jsonify({'success': True, 'results': results})
+
+
+@app.route('/api/photos/batch-set-cover', methods=['POST'])
+def batch_set_cover_photos():
+    """Make each photo the cover of its location, in one transaction.
+    
+    JSON body: {user_id, photo_ids: [...]}, at most one photo per location
+    """
+    user_id, photo_ids, _, error = parse_batch_args()
+    if error:
+        return error
+    
+    results = run_write(set_cover_photos, user_id, photo_ids)
+    
+    return flask.jsonify({'success': True, 'results': results})
+
+
+@app.route('/api/trips', methods=['GET'])
+def get_trips():
+    """List a user's trips with their photo counts and bounds."""
+    user_id = flask.request.args.get('user_id', type=int)
+    
+    if not user_id:
+        return flask.jsonify({'success': False, 'error': 'user_id required'}), 400
+    
+    # Counts and bounds are maintained by triggers; no joins needed
+    cursor = get_read_db().execute(
+        "SELECT * FROM Trips WHERE user_id = ? ORDER BY start_date DESC, id DESC",
+        (user_id,)
+    )
+    
+    return flask.jsonify({'success': True, 'trips': cursor.fetchall()})
+
+
+@app.route('/api/trips/<int:trip_id>', methods=['GET'])
+def get_trip(trip_id):
+    """Get a trip with its locations and each location's cover thumbnail."""
+    connection = get_read_db()
+    cursor = connection.execute("SELECT * FROM Trips WHERE id = ?", (trip_id,))
+    trip = cursor.fetchone()
+    
+    if not trip:
+        return flask.jsonify({'success': False, 'error': 'Trip not found'}), 404
+    
+    etag = version_etag('trip', trip_id, trip['version'])
+    response = not_modified(etag)
+    if response:
+        return response
+    
+    cursor = connection.execute(
+        """
+        SELECT Locations.*, Photos.thumbnail_url AS cover_thumbnail_url
+        FROM Locations LEFT JOIN Photos ON Photos.id = Locations.cover_photo_id
+        WHERE Locations.trip_id = ?
+        """,
+        (trip_id,)
+    )
+    
+    response = flask.jsonify({'success': True, 'trip': trip, 'locations': cursor.fetchall()})
+    return with_etag(response, etag)
+
+
+@app.route('/api/trips/<int:trip_id>/clusters', methods=['GET'])
+def get_trip_clusters(trip_id):
+    """Photo clusters and single photos of a trip inside a map viewport.
+    
+    Query: bbox=min_lon,min_lat,max_lon,max_lat&zoom=<map zoom>
+    """
+    bbox = parse_bbox(flask.request.args.get('bbox', ''))
+    zoom = flask.request.args.get('zoom', type=float)
+    
+    if bbox is None or zoom is None or not math.isfinite(zoom):
+        return flask.jsonify({'success': False, 'error': 'bbox and zoom required'}), 400
+    
+    connection = get_read_db()
+    cursor = connection.execute("SELECT version FROM Trips WHERE id = ?", (trip_id,))
+    trip = cursor.fetchone()
+    
+    if not trip:
+        return flask.jsonify({'success': False, 'error': 'Trip not found'}), 404
+    
+    etag = version_etag('trip', trip_id, trip['version'])
+    response = not_modified(etag)
+    if response:
+        return response
+    
+    result = cluster_cache.query(connection, trip_id, bbox, math.floor(zoom))
+    
+    if result is None:
+        return flask.jsonify({'success': False, 'error': 'Trip not found'}), 404
+    
+    response = flask.jsonify({'success': True, 'zoom': math.floor(zoom), **result})
+    return with_etag(response, etag)
+
+
+@app.route('/api/users/<int:user_id>/photos', methods=['GET'])
+def get_user_photos_in_bbox(user_id):
+    """A user's newest photos inside a map viewport, across all trips.
+    
+    Query: bbox=min_lon,min_lat,max_lon,max_lat&limit=<n, default 500>
+    &after=<taken_at,id>&fields=<col,...>
+    """
+    bbox = parse_bbox(flask.request.args.get('bbox', '-180,-90,180,90'))
+    fields, after, limit, error = parse_page_args(default_limit=500)
+    
+    if bbox is None:
+        return flask.jsonify({'success': False, 'error': 'Invalid bbox'}), 400
+    
+    if error:
+        return flask.jsonify({'success': False, 'error': error}), 400
+    
+    rows = find_user_photos_in_bbox(get_read_db(), user_id, bbox, limit + 1, fields, after)
+    
+    return stream_photo_page(rows, limit)
+
+
+@app.route('/api/users/<int:user_id>/photos/nearby', methods=['GET'])
+def get_user_photos_nearby(user_id):
+    """A user's photos near a point, nearest first.
+    
+    Query: lat=&lon=&radius=<meters, default 500>&limit=<n>
+    """
+    latitude = flask.request.args.get('lat', type=float)
+    longitude = flask.request.args.get('lon', type=float)
+    radius = flask.request.args.get('radius', default=500.0, type=float)
+    limit = flask.request.args.get('limit', default=100, type=int)
+    
+    if latitude is None or longitude is None:
+        return flask.jsonify({'success': False, 'error': 'lat and lon required'}), 400
+    
+    if not (-90 <= latitude <= 90 and -180 <= longitude <= 180 and radius > 0):
+        return flask.jsonify({'success': False, 'error': 'Invalid lat, lon or radius'}), 400
+    
+    limit = max(1, min(limit, flask.current_app.config['MAX_PHOTOS_PER_PAGE']))
+    photos = find_user_photos_near(get_read_db(), user_id, latitude, longitude, radius, limit)
+    
+    return flask.jsonify({'success': True, 'photos': photos})
+
+
+@app.route('/api/users/<int:user_id>/photos/tiles', methods=['GET'])
+def get_user_photo_tiles(user_id):
+    """Photo counts per geohash tile.
+    
+    Query: precision=<1-9, default 5>
+    """
+    precision = flask.request.args.get('precision', default=5, type=int)
+    
+    if not 1 <= precision <= GEOHASH_PRECISION:
+        return flask.jsonify({'success': False, 'error': 'precision must be 1-9'}), 400
     
-    # Delete from database
-    connection.execute("DELETE FROM Photos WHERE id = ?", (photo_id,))
-    connection.commit()
+    tiles = group_user_photos_by_tile(get_read_db(), user_id, precision)
     
-    return flask.jsonify({'success': True, 'message': 'Photo deleted'})
\ No newline at end of file
+    return flask.jsonify({'success': True, 'tiles': tiles})
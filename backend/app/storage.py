@@ -0,0 +1,328 @@
+"""Storage backends for photo files, and the move to the sharded layout.
+
+Usage:
+    python -m app.storage   Move files stored in the old flat layout into
+                            the sharded one and rewrite their URLs
+
+Files are stored under content-addressed keys such as
+photos/ab/cd/<sha256>.jpg: the first two byte pairs of the hash pick one
+of 256 x 256 directories, so no directory grows large however many photos
+are stored. The same keys are used locally and in an S3 bucket.
+"""
+import argparse
+import json
+import mimetypes
+import os
+import re
+import shutil
+import tempfile
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+# Config keys a storage backend is built from; worker processes receive
+# these instead of a backend instance
+STORAGE_SETTINGS = (
+    'STORAGE_BACKEND', 'MEDIA_ROOT', 'STORAGE_S3_BUCKET', 'STORAGE_S3_ENDPOINT_URL',
+    'STORAGE_S3_PUBLIC_URL', 'STORAGE_S3_REGION',
+)
+
+SHARDED_KEY = re.compile(r'^photos/[0-9a-f]{2}/[0-9a-f]{2}/[^/]+$')
+
+# Rows per transaction when rewriting URLs to the sharded layout
+MIGRATE_BATCH_SIZE = 1000
+
+
+def shard_key(name: str) -> str:
+    """Return the storage key of a content-addressed file name."""
+    return f"photos/{name[0:2]}/{name[2:4]}/{name}"
+
+
+class Storage:
+    """
+    Interface of a photo file store.
+
+    Keys are relative paths like photos/ab/cd/<name>; URLs are what the
+    database stores and clients load.
+    """
+
+    def put(self, local_path: str, key: str, move: bool = True) -> str:
+        """Store a local file under key and return its URL; move consumes the file."""
+        raise NotImplementedError
+
+    def delete(self, key: str):
+        raise NotImplementedError
+
+    def delete_many(self, keys: List[str]):
+        for key in keys:
+            self.delete(key)
+
+    def exists(self, key: str) -> bool:
+        raise NotImplementedError
+
+    def list_files(self, prefix: str) -> Iterable[Tuple[str, float]]:
+        """Yield (key, modified timestamp) of every file whose key starts with prefix."""
+        raise NotImplementedError
+
+    def url(self, key: str) -> str:
+        raise NotImplementedError
+
+    def key_for_url(self, url: str) -> Optional[str]:
+        """Return the key behind a stored URL, or None if this store did not issue it."""
+        raise NotImplementedError
+
+    def local_copy(self, key: str):
+        """Context manager yielding a local path that holds the file's bytes."""
+        raise NotImplementedError
+
+
+class LocalStorage(Storage):
+    """Files under a local directory, served by the app under /uploads."""
+
+    URL_PREFIX = '/uploads/'
+
+    def __init__(self, root):
+        self.root = Path(root)
+
+    def path(self, key: str) -> Path:
+        return self.root / key
+
+    def put(self, local_path: str, key: str, move: bool = True) -> str:
+        path = self.path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        if move:
+            # A rename when the spool is on the same filesystem
+            shutil.move(local_path, path)
+        elif not path.exists():
+            try:
+                os.link(local_path, path)
+            except OSError:
+                shutil.copy2(local_path, path)
+        return self.url(key)
+
+    def delete(self, key: str):
+        self.path(key).unlink(missing_ok=True)
+
+    def exists(self, key: str) -> bool:
+        return self.path(key).exists()
+
+    def list_files(self, prefix: str) -> Iterable[Tuple[str, float]]:
+        for directory, dirnames, filenames in os.walk(self.path(prefix)):
+            # Skips spools and temporary files
+            dirnames[:] = [name for name in dirnames if not name.startswith('.')]
+            for name in filenames:
+                if name.startswith('.'):
+                    continue
+                path = Path(directory) / name
+                try:
+                    modified = path.stat().st_mtime
+                except FileNotFoundError:
+                    continue
+                yield path.relative_to(self.root).as_posix(), modified
+
+    def url(self, key: str) -> str:
+        return f"{self.URL_PREFIX}{key}"
+
+    def key_for_url(self, url: str) -> Optional[str]:
+        if not url.startswith(self.URL_PREFIX):
+            return None
+        return url[len(self.URL_PREFIX):]
+
+    @contextmanager
+    def local_copy(self, key: str) -> Iterator[Path]:
+        yield self.path(key)
+
+
+class S3Storage(Storage):
+    """
+    Files in an S3 bucket, or any S3-compatible store (MinIO, R2, ...)
+    when endpoint_url is set. Credentials come from boto3's usual sources.
+    """
+
+    def __init__(self, bucket: str, endpoint_url: Optional[str] = None,
+                 public_url: Optional[str] = None, region: Optional[str] = None):
+        try:
+            import boto3
+        except ImportError:
+            raise RuntimeError("STORAGE_BACKEND 's3' needs boto3 (pip install boto3)")
+
+        self.client = boto3.client('s3', endpoint_url=endpoint_url, region_name=region)
+        self.bucket = bucket
+        if public_url is None:
+            # Path-style for custom endpoints, virtual-hosted style on AWS
+            public_url = (f"{endpoint_url.rstrip('/')}/{bucket}" if endpoint_url
+                          else f"https://{bucket}.s3.amazonaws.com")
+        self.public_url = public_url.rstrip('/')
+
+    def put(self, local_path: str, key: str, move: bool = True) -> str:
+        self.client.upload_file(
+            str(local_path), self.bucket, key,
+            ExtraArgs={
+                'ContentType': mimetypes.guess_type(key)[0] or 'application/octet-stream',
+                # Keys are content hashes, so objects never change
+                'CacheControl': 'public, max-age=31536000, immutable',
+            }
+        )
+        if move:
+            os.remove(local_path)
+        return self.url(key)
+
+    def delete(self, key: str):
+        self.client.delete_object(Bucket=self.bucket, Key=key)
+
+    def delete_many(self, keys: List[str]):
+        # DeleteObjects takes at most 1000 keys per request
+        for start in range(0, len(keys), 1000):
+            self.client.delete_objects(
+                Bucket=self.bucket,
+                Delete={'Objects': [{'Key': key} for key in keys[start:start + 1000]],
+                        'Quiet': True}
+            )
+
+    def list_files(self, prefix: str) -> Iterable[Tuple[str, float]]:
+        paginator = self.client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=prefix):
+            for item in page.get('Contents', []):
+                yield item['Key'], item['LastModified'].timestamp()
+
+    def exists(self, key: str) -> bool:
+        from botocore.exceptions import ClientError
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=key)
+        except ClientError as e:
+            if e.response['Error']['Code'] in ('404', 'NoSuchKey', 'NotFound'):
+                return False
+            raise
+        return True
+
+    def url(self, key: str) -> str:
+        return f"{self.public_url}/{key}"
+
+    def key_for_url(self, url: str) -> Optional[str]:
+        prefix = f"{self.public_url}/"
+        if not url.startswith(prefix):
+            return None
+        return url[len(prefix):]
+
+    @contextmanager
+    def local_copy(self, key: str) -> Iterator[Path]:
+        fd, path = tempfile.mkstemp(suffix=Path(key).suffix)
+        os.close(fd)
+        try:
+            self.client.download_file(self.bucket, key, path)
+            yield Path(path)
+        finally:
+            os.remove(path)
+
+
+def create_storage(config) -> Storage:
+    """Build the backend selected by STORAGE_BACKEND ('local' or 's3')."""
+    backend = config['STORAGE_BACKEND']
+    if backend == 'local':
+        return LocalStorage(config['MEDIA_ROOT'])
+    if backend == 's3':
+        return S3Storage(
+            config['STORAGE_S3_BUCKET'],
+            endpoint_url=config.get('STORAGE_S3_ENDPOINT_URL'),
+            public_url=config.get('STORAGE_S3_PUBLIC_URL'),
+            region=config.get('STORAGE_S3_REGION'),
+        )
+    raise ValueError(f"Unknown STORAGE_BACKEND {backend!r}")
+
+
+def migrate_layout(connection, legacy: LocalStorage, storage: Storage) -> int:
+    """
+    Move files of the flat uploads/photos layout into sharded keys.
+
+    Each file is first copied (hard-linked locally) to its new key, then
+    the URLs in PhotoBlobs and Photos are rewritten a batch at a time, and
+    the old files are removed only once every row points at the new
+    ones, so the app keeps serving throughout and a rerun picks up where
+    an interrupted one stopped.
+
+    Returns:
+        Number of files moved
+    """
+    moved = {}  # old URL -> new URL
+
+    def rewrite(url: Optional[str]) -> Optional[str]:
+        key = legacy.key_for_url(url) if url else None
+        if key is None or SHARDED_KEY.match(key):
+            return url
+        if url not in moved:
+            path = legacy.path(key)
+            new_key = shard_key(path.name)
+            if path.exists():
+                moved[url] = storage.put(str(path), new_key, move=False)
+            elif storage.exists(new_key):
+                # Copied by an earlier run that stopped before this row
+                moved[url] = storage.url(new_key)
+            else:
+                print(f"Warning: {url} is missing, left as is")
+                moved[url] = url
+        return moved[url]
+
+    def rewrite_derivatives(value: Optional[str]) -> Optional[str]:
+        derivatives = json.loads(value or '{}')
+        if not derivatives:
+            return value
+        return json.dumps({
+            size: {fmt: rewrite(url) for fmt, url in formats.items()}
+            for size, formats in derivatives.items()
+        })
+
+    for table in ('PhotoBlobs', 'Photos'):
+        last_rowid = 0
+        while True:
+            cursor = connection.execute(
+                f"""
+                SELECT rowid AS row_id, file_url, thumbnail_url, derivatives FROM {table}
+                WHERE rowid > ? ORDER BY rowid LIMIT ?
+                """,
+                (last_rowid, MIGRATE_BATCH_SIZE)
+            )
+            rows = cursor.fetchall()
+            if not rows:
+                break
+            last_rowid = rows[-1]['row_id']
+
+            updates = []
+            for row in rows:
+                values = (rewrite(row['file_url']), rewrite(row['thumbnail_url']),
+                          rewrite_derivatives(row['derivatives']))
+                if values != (row['file_url'], row['thumbnail_url'], row['derivatives']):
+                    updates.append((*values, row['row_id']))
+            connection.executemany(
+                f"UPDATE {table} SET file_url = ?, thumbnail_url = ?, derivatives = ? WHERE rowid = ?",
+                updates
+            )
+            connection.commit()
+
+    count = 0
+    for old_url, new_url in moved.items():
+        if new_url != old_url:
+            legacy.delete(legacy.key_for_url(old_url))
+            count += 1
+    return count
+
+
+def main(argv=None):
+    from app import app as flask_app
+    from app.db import connect
+
+    parser = argparse.ArgumentParser(
+        description="Move stored photos into the sharded storage layout."
+    )
+    parser.add_argument('--database', default=str(flask_app.config['DATABASE_FILENAME']),
+                        help="SQLite file to update (default: DATABASE_FILENAME)")
+    args = parser.parse_args(argv)
+
+    config = dict(flask_app.config, DATABASE_FILENAME=args.database)
+    connection = connect(config)
+    moved = migrate_layout(connection, LocalStorage(config['MEDIA_ROOT']), create_storage(config))
+    connection.close()
+    print(f"+ Moved {moved} files to the sharded layout.")
+
+
+if __name__ == '__main__':
+    main()
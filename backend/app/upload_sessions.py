@@ -0,0 +1,289 @@
+"""Resumable chunked uploads that feed the photo ingest pipeline."""
+import shutil
+import uuid
+from datetime import datetime
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+from app.photo_service import PhotoService, SPOOL_CHUNK_SIZE, photo_service
+
+
+class UploadSessionError(Exception):
+    """A chunked upload request that cannot be applied, with an HTTP status."""
+
+    def __init__(self, message: str, status_code: int = 400):
+        super().__init__(message)
+        self.message = message
+        self.status_code = status_code
+
+
+def merge_ranges(ranges: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
+    """Merge overlapping or touching (start, end) byte ranges."""
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def missing_ranges(received: List[Tuple[int, int]], size: int) -> List[Tuple[int, int]]:
+    """Return the (start, end) byte ranges of [0, size) not yet received."""
+    missing = []
+    position = 0
+    for start, end in received:
+        if start > position:
+            missing.append((position, start))
+        position = max(position, end)
+    if position < size:
+        missing.append((position, size))
+    return missing
+
+
+class UploadSessionService:
+    """
+    Session-based chunked uploads.
+
+    A client creates a session listing the files it will send, PUTs byte
+    ranges of each file at explicit offsets, can ask which ranges the server
+    already holds, and finalizes once everything has arrived. Session state
+    lives in SQLite so an interrupted upload can resume after a restart;
+    file data is staged under the photo service's incoming directory.
+    """
+
+    def __init__(self, service: PhotoService):
+        self.photo_service = service
+
+    @property
+    def sessions_dir(self) -> Path:
+        # Follows the photo service's incoming directory once the app configures it
+        return self.photo_service.incoming_dir / 'sessions'
+
+    def _part_path(self, session_id: str, file_index: int) -> Path:
+        return self.sessions_dir / session_id / f"{file_index}.part"
+
+    def create_session(self, connection, trip_id: int, user_id: int, files: List[dict]) -> dict:
+        """
+        Open a new upload session.
+
+        Args:
+            files: List of {'filename': str, 'size': int} in upload order
+        """
+        if not isinstance(files, list) or not files:
+            raise UploadSessionError('No files listed')
+        for entry in files:
+            # type() rather than isinstance(): JSON true must not pass as a size
+            if not (isinstance(entry, dict)
+                    and isinstance(entry.get('filename'), str) and entry['filename']
+                    and type(entry.get('size')) is int and entry['size'] > 0):
+                raise UploadSessionError('Each file needs a filename and a positive size')
+
+        session_id = uuid.uuid4().hex
+        created_at = int(datetime.now().timestamp())
+        connection.execute(
+            """
+            INSERT INTO UploadSessions (id, trip_id, user_id, status, created_at)
+            VALUES (?, ?, ?, 'open', ?)
+            """,
+            (session_id, trip_id, user_id, created_at)
+        )
+        connection.executemany(
+            """
+            INSERT INTO UploadSessionFiles (session_id, file_index, filename, size)
+            VALUES (?, ?, ?, ?)
+            """,
+            [(session_id, index, entry['filename'], entry['size'])
+             for index, entry in enumerate(files)]
+        )
+        connection.commit()
+
+        # Create every part file up front so chunk writers never truncate
+        # each other's data
+        (self.sessions_dir / session_id).mkdir(parents=True)
+        for index in range(len(files)):
+            self._part_path(session_id, index).touch()
+        return self.get_session(connection, session_id)
+
+    def get_session(self, connection, session_id: str) -> Optional[dict]:
+        """Return a session with per-file received and missing byte ranges."""
+        cursor = connection.execute(
+            "SELECT * FROM UploadSessions WHERE id = ?",
+            (session_id,)
+        )
+        session = cursor.fetchone()
+        if not session:
+            return None
+
+        cursor = connection.execute(
+            "SELECT * FROM UploadSessionFiles WHERE session_id = ? ORDER BY file_index",
+            (session_id,)
+        )
+        files = cursor.fetchall()
+
+        cursor = connection.execute(
+            """
+            SELECT file_index, chunk_offset, chunk_length FROM UploadChunks
+            WHERE session_id = ?
+            """,
+            (session_id,)
+        )
+        chunks = {}
+        for chunk in cursor.fetchall():
+            chunks.setdefault(chunk['file_index'], []).append(
+                (chunk['chunk_offset'], chunk['chunk_offset'] + chunk['chunk_length'])
+            )
+
+        for file in files:
+            received = merge_ranges(chunks.get(file['file_index'], []))
+            file['received'] = [list(r) for r in received]
+            file['missing'] = [list(r) for r in missing_ranges(received, file['size'])]
+
+        session['files'] = files
+        return session
+
+    def write_chunk(self, connection, session_id: str, file_index: int,
+                    offset: int, stream, length: int) -> dict:
+        """
+        Store one byte range of a file and ingest the file once it is complete.
+
+        Args:
+            stream: Readable binary stream holding exactly ``length`` bytes
+        """
+        cursor = connection.execute(
+            """
+            SELECT f.*, s.trip_id, s.user_id, s.status AS session_status
+            FROM UploadSessionFiles f JOIN UploadSessions s ON s.id = f.session_id
+            WHERE f.session_id = ? AND f.file_index = ?
+            """,
+            (session_id, file_index)
+        )
+        file = cursor.fetchone()
+        if not file:
+            raise UploadSessionError('Upload session or file not found', 404)
+        if file['session_status'] != 'open':
+            raise UploadSessionError('Upload session is already finalized', 409)
+        if file['status'] != 'pending':
+            raise UploadSessionError('File is already complete', 409)
+        if offset < 0 or length <= 0 or offset + length > file['size']:
+            raise UploadSessionError('Chunk is outside the declared file size', 416)
+
+        written = 0
+        with open(self._part_path(session_id, file_index), 'r+b') as out:
+            out.seek(offset)
+            while written < length:
+                chunk = stream.read(min(SPOOL_CHUNK_SIZE, length - written))
+                if not chunk:
+                    break
+                out.write(chunk)
+                written += len(chunk)
+        if written != length:
+            raise UploadSessionError('Chunk body is shorter than its Content-Length')
+
+        connection.execute(
+            """
+            INSERT OR REPLACE INTO UploadChunks
+            (session_id, file_index, chunk_offset, chunk_length)
+            VALUES (?, ?, ?, ?)
+            """,
+            (session_id, file_index, offset, length)
+        )
+        connection.commit()
+
+        cursor = connection.execute(
+            """
+            SELECT chunk_offset, chunk_offset + chunk_length AS chunk_end FROM UploadChunks
+            WHERE session_id = ? AND file_index = ?
+            """,
+            (session_id, file_index)
+        )
+        received = merge_ranges([(c['chunk_offset'], c['chunk_end']) for c in cursor.fetchall()])
+        if missing_ranges(received, file['size']):
+            return {'file_index': file_index, 'status': 'pending',
+                    'received': [list(r) for r in received]}
+
+        return self._ingest_file(connection, file)
+
+    def _ingest_file(self, connection, file: dict) -> dict:
+        """Hand a fully received file to the ingest pipeline."""
+        # Claim the file so a concurrent final chunk cannot ingest it twice
+        cursor = connection.execute(
+            """
+            UPDATE UploadSessionFiles SET status = 'processing'
+            WHERE session_id = ? AND file_index = ? AND status = 'pending'
+            """,
+            (file['session_id'], file['file_index'])
+        )
+        connection.commit()
+        if cursor.rowcount != 1:
+            return {'file_index': file['file_index'], 'status': 'processing'}
+
+        part_path = str(self._part_path(file['session_id'], file['file_index']))
+        try:
+            content_hash = self.photo_service.hash_file(part_path)
+            result = self.photo_service.ingest_spooled(
+                connection,
+                [(part_path, content_hash, file['filename'])],
+                file['trip_id'],
+                file['user_id']
+            )[0]
+        except Exception as e:
+            # The part file may already be gone; record the failure rather
+            # than leave the file claimed, so finalize can still close the session
+            if connection.in_transaction:
+                connection.rollback()
+            result = {'filename': file['filename'], 'status': 'error', 'error': str(e)}
+
+        connection.execute(
+            """
+            UPDATE UploadSessionFiles SET status = ?, photo_id = ?, error = ?
+            WHERE session_id = ? AND file_index = ?
+            """,
+            (result['status'], result['photo']['id'] if 'photo' in result else None,
+             result.get('error'), file['session_id'], file['file_index'])
+        )
+        connection.commit()
+
+        return {'file_index': file['file_index'], **result}
+
+    def finalize(self, connection, session_id: str) -> dict:
+        """Close a session whose files have all been received and ingested."""
+        session = self.get_session(connection, session_id)
+        if not session:
+            raise UploadSessionError('Upload session not found', 404)
+
+        incomplete = [f['file_index'] for f in session['files']
+                      if f['status'] in ('pending', 'processing')]
+        if incomplete:
+            raise UploadSessionError(
+                f"Files still incomplete: {', '.join(map(str, incomplete))}", 409
+            )
+
+        connection.execute(
+            "UPDATE UploadSessions SET status = 'finalized' WHERE id = ?",
+            (session_id,)
+        )
+        connection.execute(
+            "DELETE FROM UploadChunks WHERE session_id = ?",
+            (session_id,)
+        )
+        connection.commit()
+        shutil.rmtree(self.sessions_dir / session_id, ignore_errors=True)
+
+        photo_ids = [f['photo_id'] for f in session['files'] if f['photo_id']]
+        photos = []
+        if photo_ids:
+            cursor = connection.execute(
+                f"SELECT * FROM Photos WHERE id IN ({','.join('?' * len(photo_ids))}) ORDER BY id",
+                photo_ids
+            )
+            photos = cursor.fetchall()
+
+        return {
+            'photos': photos,
+            'skipped': [f['filename'] for f in session['files'] if f['status'] != 'created'],
+        }
+
+
+# Singleton instance
+upload_session_service = UploadSessionService(photo_service)
@@ -0,0 +1,130 @@
+-- Bring a database created from the original schema up to date with the
+-- ingest pipeline: content-addressed blobs, derivatives, the Locations
+-- R*Tree, chunked upload sessions and the ingest job queue.
+
+CREATE VIRTUAL TABLE LocationsRtree USING rtree(
+    id,
+    min_x, max_x,
+    min_y, max_y
+);
+
+INSERT INTO LocationsRtree
+SELECT id, x, x, y, y FROM Locations WHERE x IS NOT NULL AND y IS NOT NULL;
+
+CREATE TRIGGER locations_rtree_insert AFTER INSERT ON Locations
+WHEN NEW.x IS NOT NULL AND NEW.y IS NOT NULL
+BEGIN
+    INSERT INTO LocationsRtree VALUES (NEW.id, NEW.x, NEW.x, NEW.y, NEW.y);
+END;
+
+CREATE TRIGGER locations_rtree_update AFTER UPDATE OF x, y ON Locations
+BEGIN
+    DELETE FROM LocationsRtree WHERE id = OLD.id;
+    INSERT INTO LocationsRtree
+    SELECT NEW.id, NEW.x, NEW.x, NEW.y, NEW.y
+    WHERE NEW.x IS NOT NULL AND NEW.y IS NOT NULL;
+END;
+
+CREATE TRIGGER locations_rtree_delete AFTER DELETE ON Locations
+BEGIN
+    DELETE FROM LocationsRtree WHERE id = OLD.id;
+END;
+
+
+CREATE TABLE PhotoBlobs (
+    content_hash CHAR(64) PRIMARY KEY,
+    file_url TEXT NOT NULL,
+    thumbnail_url TEXT,
+    derivatives TEXT,
+    x REAL,
+    y REAL,
+    taken_at INTEGER,
+    ref_count INTEGER NOT NULL DEFAULT 0,
+    created_at INTEGER
+);
+
+
+-- Photos stored before content addressing keep a NULL content_hash and
+-- own their file outright
+ALTER TABLE Photos ADD COLUMN thumbnail_url TEXT;
+ALTER TABLE Photos ADD COLUMN derivatives TEXT;
+ALTER TABLE Photos ADD COLUMN content_hash CHAR(64) REFERENCES PhotoBlobs(content_hash);
+
+CREATE INDEX idx_photos_content_hash ON Photos(content_hash);
+
+CREATE TRIGGER photos_blob_ref_insert AFTER INSERT ON Photos
+WHEN NEW.content_hash IS NOT NULL
+BEGIN
+    UPDATE PhotoBlobs SET ref_count = ref_count + 1
+    WHERE content_hash = NEW.content_hash;
+END;
+
+CREATE TRIGGER photos_blob_ref_delete AFTER DELETE ON Photos
+WHEN OLD.content_hash IS NOT NULL
+BEGIN
+    UPDATE PhotoBlobs SET ref_count = ref_count - 1
+    WHERE content_hash = OLD.content_hash;
+END;
+
+
+CREATE TABLE UploadSessions (
+    id CHAR(32) PRIMARY KEY,
+    trip_id INTEGER NOT NULL,
+    user_id INTEGER NOT NULL,
+    status VARCHAR(20) NOT NULL DEFAULT 'open',
+    created_at INTEGER,
+    FOREIGN KEY (trip_id) REFERENCES Trips(id) ON DELETE CASCADE,
+    FOREIGN KEY (user_id) REFERENCES Users(id) ON DELETE CASCADE
+);
+
+
+CREATE TABLE UploadSessionFiles (
+    session_id CHAR(32) NOT NULL,
+    file_index INTEGER NOT NULL,
+    filename VARCHAR(255) NOT NULL,
+    size INTEGER NOT NULL,
+    status VARCHAR(20) NOT NULL DEFAULT 'pending',
+    photo_id INTEGER,
+    error TEXT,
+    PRIMARY KEY (session_id, file_index),
+    FOREIGN KEY (session_id) REFERENCES UploadSessions(id) ON DELETE CASCADE
+);
+
+
+CREATE TABLE UploadChunks (
+    session_id CHAR(32) NOT NULL,
+    file_index INTEGER NOT NULL,
+    chunk_offset INTEGER NOT NULL,
+    chunk_length INTEGER NOT NULL,
+    PRIMARY KEY (session_id, file_index, chunk_offset),
+    FOREIGN KEY (session_id, file_index)
+        REFERENCES UploadSessionFiles(session_id, file_index) ON DELETE CASCADE
+);
+
+
+CREATE TABLE IngestJobs (
+    id INTEGER PRIMARY KEY,
+    trip_id INTEGER NOT NULL,
+    user_id INTEGER NOT NULL,
+    status VARCHAR(20) NOT NULL DEFAULT 'queued',
+    error TEXT,
+    created_at INTEGER,
+    started_at INTEGER,
+    finished_at INTEGER,
+    FOREIGN KEY (trip_id) REFERENCES Trips(id) ON DELETE CASCADE,
+    FOREIGN KEY (user_id) REFERENCES Users(id) ON DELETE CASCADE
+);
+
+
+CREATE TABLE IngestJobFiles (
+    job_id INTEGER NOT NULL,
+    file_index INTEGER NOT NULL,
+    filename VARCHAR(255) NOT NULL,
+    spool_path TEXT NOT NULL,
+    content_hash CHAR(64) NOT NULL,
+    status VARCHAR(20) NOT NULL DEFAULT 'pending',
+    photo_id INTEGER,
+    error TEXT,
+    PRIMARY KEY (job_id, file_index),
+    FOREIGN KEY (job_id) REFERENCES IngestJobs(id) ON DELETE CASCADE
+);
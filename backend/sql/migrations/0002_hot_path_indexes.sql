@@ -0,0 +1,13 @@
+-- Secondary indexes for the columns every route filters on
+
+CREATE INDEX idx_trips_user_id ON Trips(user_id);
+
+CREATE INDEX idx_locations_trip_id ON Locations(trip_id);
+
+CREATE INDEX idx_photos_location_id ON Photos(location_id);
+CREATE INDEX idx_photos_user_id ON Photos(user_id);
+
+-- At most one row per location, so cover lookups stay tiny
+CREATE INDEX idx_photos_location_cover ON Photos(location_id) WHERE is_cover_photo = 1;
+
+CREATE INDEX idx_shared_trips_share_token ON SharedTrips(share_token);
@@ -0,0 +1,123 @@
+-- Denormalized per-location and per-trip aggregates so trip list and
+-- trip detail reads are single-row lookups
+
+ALTER TABLE Trips ADD COLUMN location_count INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE Trips ADD COLUMN photo_count INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE Trips ADD COLUMN min_x REAL;
+ALTER TABLE Trips ADD COLUMN max_x REAL;
+ALTER TABLE Trips ADD COLUMN min_y REAL;
+ALTER TABLE Trips ADD COLUMN max_y REAL;
+
+ALTER TABLE Locations ADD COLUMN photo_count INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE Locations ADD COLUMN cover_photo_id INTEGER;
+ALTER TABLE Locations ADD COLUMN first_taken_at INTEGER;
+ALTER TABLE Locations ADD COLUMN last_taken_at INTEGER;
+
+UPDATE Locations SET
+    photo_count = (SELECT COUNT(*) FROM Photos WHERE location_id = Locations.id),
+    cover_photo_id = (SELECT id FROM Photos
+                      WHERE location_id = Locations.id AND is_cover_photo = 1 LIMIT 1),
+    first_taken_at = (SELECT MIN(taken_at) FROM Photos WHERE location_id = Locations.id),
+    last_taken_at = (SELECT MAX(taken_at) FROM Photos WHERE location_id = Locations.id);
+
+UPDATE Trips SET
+    location_count = (SELECT COUNT(*) FROM Locations WHERE trip_id = Trips.id),
+    photo_count = (SELECT COALESCE(SUM(photo_count), 0) FROM Locations WHERE trip_id = Trips.id),
+    min_x = (SELECT MIN(x) FROM Locations WHERE trip_id = Trips.id AND y IS NOT NULL),
+    max_x = (SELECT MAX(x) FROM Locations WHERE trip_id = Trips.id AND y IS NOT NULL),
+    min_y = (SELECT MIN(y) FROM Locations WHERE trip_id = Trips.id AND x IS NOT NULL),
+    max_y = (SELECT MAX(y) FROM Locations WHERE trip_id = Trips.id AND x IS NOT NULL);
+
+
+-- Per-location photo aggregates, kept current as photos come and go
+CREATE TRIGGER photos_aggregate_insert AFTER INSERT ON Photos
+BEGIN
+    UPDATE Locations SET
+        photo_count = photo_count + 1,
+        cover_photo_id = CASE WHEN NEW.is_cover_photo THEN NEW.id ELSE cover_photo_id END,
+        first_taken_at = min(COALESCE(first_taken_at, NEW.taken_at), COALESCE(NEW.taken_at, first_taken_at)),
+        last_taken_at = max(COALESCE(last_taken_at, NEW.taken_at), COALESCE(NEW.taken_at, last_taken_at))
+    WHERE id = NEW.location_id;
+END;
+
+CREATE TRIGGER photos_aggregate_delete AFTER DELETE ON Photos
+BEGIN
+    UPDATE Locations SET
+        photo_count = photo_count - 1,
+        cover_photo_id = CASE WHEN cover_photo_id = OLD.id THEN NULL ELSE cover_photo_id END,
+        first_taken_at = CASE WHEN OLD.taken_at = first_taken_at
+            THEN (SELECT MIN(taken_at) FROM Photos WHERE location_id = OLD.location_id)
+            ELSE first_taken_at END,
+        last_taken_at = CASE WHEN OLD.taken_at = last_taken_at
+            THEN (SELECT MAX(taken_at) FROM Photos WHERE location_id = OLD.location_id)
+            ELSE last_taken_at END
+    WHERE id = OLD.location_id;
+END;
+
+CREATE TRIGGER photos_aggregate_cover AFTER UPDATE OF is_cover_photo ON Photos
+WHEN NEW.is_cover_photo IS NOT OLD.is_cover_photo
+BEGIN
+    UPDATE Locations SET cover_photo_id = CASE
+        WHEN NEW.is_cover_photo THEN NEW.id
+        WHEN cover_photo_id = OLD.id THEN NULL
+        ELSE cover_photo_id END
+    WHERE id = NEW.location_id;
+END;
+
+-- Moves and retimes are rare; recompute both affected locations outright
+CREATE TRIGGER photos_aggregate_move AFTER UPDATE OF location_id, taken_at ON Photos
+BEGIN
+    UPDATE Locations SET
+        photo_count = (SELECT COUNT(*) FROM Photos WHERE location_id = Locations.id),
+        cover_photo_id = (SELECT id FROM Photos
+                          WHERE location_id = Locations.id AND is_cover_photo = 1 LIMIT 1),
+        first_taken_at = (SELECT MIN(taken_at) FROM Photos WHERE location_id = Locations.id),
+        last_taken_at = (SELECT MAX(taken_at) FROM Photos WHERE location_id = Locations.id)
+    WHERE id IN (OLD.location_id, NEW.location_id);
+END;
+
+
+-- Per-trip counts and bounding box, fed by the location rows and their
+-- photo_count. The box only covers locations with both coordinates.
+CREATE TRIGGER locations_aggregate_insert AFTER INSERT ON Locations
+BEGIN
+    UPDATE Trips SET
+        location_count = location_count + 1,
+        photo_count = photo_count + NEW.photo_count,
+        min_x = CASE WHEN NEW.x IS NULL OR NEW.y IS NULL THEN min_x ELSE min(COALESCE(min_x, NEW.x), NEW.x) END,
+        max_x = CASE WHEN NEW.x IS NULL OR NEW.y IS NULL THEN max_x ELSE max(COALESCE(max_x, NEW.x), NEW.x) END,
+        min_y = CASE WHEN NEW.x IS NULL OR NEW.y IS NULL THEN min_y ELSE min(COALESCE(min_y, NEW.y), NEW.y) END,
+        max_y = CASE WHEN NEW.x IS NULL OR NEW.y IS NULL THEN max_y ELSE max(COALESCE(max_y, NEW.y), NEW.y) END
+    WHERE id = NEW.trip_id;
+END;
+
+CREATE TRIGGER locations_aggregate_photos AFTER UPDATE OF photo_count ON Locations
+WHEN NEW.trip_id = OLD.trip_id
+BEGIN
+    UPDATE Trips SET photo_count = photo_count + NEW.photo_count - OLD.photo_count
+    WHERE id = NEW.trip_id;
+END;
+
+CREATE TRIGGER locations_aggregate_delete AFTER DELETE ON Locations
+BEGIN
+    UPDATE Trips SET
+        location_count = location_count - 1,
+        photo_count = photo_count - OLD.photo_count,
+        min_x = (SELECT MIN(x) FROM Locations WHERE trip_id = OLD.trip_id AND y IS NOT NULL),
+        max_x = (SELECT MAX(x) FROM Locations WHERE trip_id = OLD.trip_id AND y IS NOT NULL),
+        min_y = (SELECT MIN(y) FROM Locations WHERE trip_id = OLD.trip_id AND x IS NOT NULL),
+        max_y = (SELECT MAX(y) FROM Locations WHERE trip_id = OLD.trip_id AND x IS NOT NULL)
+    WHERE id = OLD.trip_id;
+END;
+
+CREATE TRIGGER locations_aggregate_update AFTER UPDATE OF trip_id, x, y ON Locations
+BEGIN
+    UPDATE Trips SET
+        location_count = (SELECT COUNT(*) FROM Locations WHERE trip_id = Trips.id),
+        photo_count = (SELECT COALESCE(SUM(photo_count), 0) FROM Locations WHERE trip_id = Trips.id),
+        min_x = (SELECT MIN(x) FROM Locations WHERE trip_id = Trips.id AND y IS NOT NULL),
+        max_x = (SELECT MAX(x) FROM Locations WHERE trip_id = Trips.id AND y IS NOT NULL),
+        min_y = (SELECT MIN(y) FROM Locations WHERE trip_id = Trips.id AND x IS NOT NULL),
+        max_y = (SELECT MAX(y) FROM Locations WHERE trip_id = Trips.id AND x IS NOT NULL)
+    WHERE id IN (OLD.trip_id, NEW.trip_id);
+END;
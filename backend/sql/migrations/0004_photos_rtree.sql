@@ -0,0 +1,36 @@
+-- Spatial index over Photos(x, y) for viewport queries across trips. The
+-- auxiliary columns let the user filter and recency sort run on the index
+-- rows before any Photos row is read.
+CREATE VIRTUAL TABLE PhotosRtree USING rtree(
+    id,
+    min_x, max_x,
+    min_y, max_y,
+    +user_id,
+    +taken_at
+);
+
+CREATE TRIGGER photos_rtree_insert AFTER INSERT ON Photos
+WHEN NEW.x IS NOT NULL AND NEW.y IS NOT NULL
+BEGIN
+    INSERT INTO PhotosRtree VALUES (NEW.id, NEW.x, NEW.x, NEW.y, NEW.y, NEW.user_id, NEW.taken_at);
+END;
+
+CREATE TRIGGER photos_rtree_update AFTER UPDATE OF x, y, user_id, taken_at ON Photos
+BEGIN
+    DELETE FROM PhotosRtree WHERE id = OLD.id;
+    INSERT INTO PhotosRtree
+    SELECT NEW.id, NEW.x, NEW.x, NEW.y, NEW.y, NEW.user_id, NEW.taken_at
+    WHERE NEW.x IS NOT NULL AND NEW.y IS NOT NULL;
+END;
+
+CREATE TRIGGER photos_rtree_delete AFTER DELETE ON Photos
+BEGIN
+    DELETE FROM PhotosRtree WHERE id = OLD.id;
+END;
+
+INSERT INTO PhotosRtree
+SELECT id, x, x, y, y, user_id, taken_at FROM Photos WHERE x IS NOT NULL AND y IS NOT NULL;
+
+-- Newest-first listing of a user's photos; replaces the plain user_id index
+DROP INDEX idx_photos_user_id;
+CREATE INDEX idx_photos_user_taken_at ON Photos(user_id, taken_at DESC, id DESC);
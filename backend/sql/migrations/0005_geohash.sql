@@ -0,0 +1,10 @@
+-- Geohash keys (precision 9, ~5 m cells) written by the ingest path. Rows
+-- that predate this migration are filled in by python -m app.migrate.
+
+ALTER TABLE Photos ADD COLUMN geohash CHAR(9);
+ALTER TABLE Locations ADD COLUMN geohash CHAR(9);
+
+-- Prefix range scans: photos near a point or grouped into tiles per user,
+-- and a trip's locations near a point
+CREATE INDEX idx_photos_user_geohash ON Photos(user_id, geohash);
+CREATE INDEX idx_locations_trip_geohash ON Locations(trip_id, geohash);
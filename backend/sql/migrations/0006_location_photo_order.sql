@@ -0,0 +1,7 @@
+-- Keyset pagination of a location's photos: (location_id, taken_at) with the
+-- implicit trailing rowid serves WHERE location_id = ? AND (taken_at, id) > (?, ?)
+-- ORDER BY taken_at, id as one range scan. It also covers every lookup the
+-- plain location_id index served.
+
+DROP INDEX idx_photos_location_id;
+CREATE INDEX idx_photos_location_taken_at ON Photos(location_id, taken_at);
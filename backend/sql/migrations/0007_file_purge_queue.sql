@@ -0,0 +1,37 @@
+-- Deferred file removal: deleting rows only queues their files, and a
+-- background purger removes them in batches. A blob's files are queued
+-- when its last photo goes, including photos removed by ON DELETE CASCADE
+-- from Locations or Trips; photos from before content addressing own
+-- their files outright.
+
+CREATE TABLE FilePurgeQueue (
+    id INTEGER PRIMARY KEY,
+    content_hash CHAR(64),
+    file_url TEXT NOT NULL,
+    thumbnail_url TEXT,
+    derivatives TEXT,
+    queued_at INTEGER
+);
+
+CREATE TRIGGER photo_blobs_release AFTER UPDATE OF ref_count ON PhotoBlobs
+WHEN NEW.ref_count <= 0
+BEGIN
+    INSERT INTO FilePurgeQueue (content_hash, file_url, thumbnail_url, derivatives, queued_at)
+    VALUES (NEW.content_hash, NEW.file_url, NEW.thumbnail_url, NEW.derivatives,
+            CAST(strftime('%s', 'now') AS INTEGER));
+    DELETE FROM PhotoBlobs WHERE content_hash = NEW.content_hash;
+END;
+
+CREATE TRIGGER photos_release_unshared AFTER DELETE ON Photos
+WHEN OLD.content_hash IS NULL
+BEGIN
+    INSERT INTO FilePurgeQueue (file_url, thumbnail_url, derivatives, queued_at)
+    VALUES (OLD.file_url, OLD.thumbnail_url, OLD.derivatives,
+            CAST(strftime('%s', 'now') AS INTEGER));
+END;
+
+-- Blobs already orphaned before this migration
+INSERT INTO FilePurgeQueue (content_hash, file_url, thumbnail_url, derivatives, queued_at)
+SELECT content_hash, file_url, thumbnail_url, derivatives, CAST(strftime('%s', 'now') AS INTEGER)
+FROM PhotoBlobs WHERE ref_count <= 0;
+DELETE FROM PhotoBlobs WHERE ref_count <= 0;
@@ -0,0 +1,29 @@
+-- Per-trip and per-location version counters, bumped by triggers on every
+-- change, so read endpoints can answer If-None-Match from a single row
+
+ALTER TABLE Trips ADD COLUMN version INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE Locations ADD COLUMN version INTEGER NOT NULL DEFAULT 0;
+
+CREATE TRIGGER locations_version AFTER UPDATE ON Locations
+WHEN NEW.version = OLD.version
+BEGIN
+    UPDATE Locations SET version = version + 1 WHERE id = NEW.id;
+END;
+
+CREATE TRIGGER locations_version_trip AFTER UPDATE OF version ON Locations
+BEGIN
+    UPDATE Trips SET version = version + 1 WHERE id = NEW.trip_id;
+END;
+
+CREATE TRIGGER trips_version AFTER UPDATE ON Trips
+WHEN NEW.version = OLD.version
+BEGIN
+    UPDATE Trips SET version = version + 1 WHERE id = NEW.id;
+END;
+
+CREATE TRIGGER photos_version AFTER UPDATE OF
+    x, y, file_url, thumbnail_url, derivatives, content_hash, original_filename, geohash
+ON Photos
+BEGIN
+    UPDATE Locations SET version = version + 1 WHERE id = NEW.location_id;
+END;
@@ -0,0 +1,7 @@
+-- Running ingest jobs record the process that claimed them and when it
+-- last reported in, so other processes only requeue jobs whose owner died
+
+ALTER TABLE IngestJobs ADD COLUMN owner TEXT;
+ALTER TABLE IngestJobs ADD COLUMN heartbeat_at INTEGER;
+
+CREATE INDEX idx_ingest_jobs_status ON IngestJobs(status, id);
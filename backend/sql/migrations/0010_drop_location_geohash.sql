@@ -0,0 +1,5 @@
+-- Nothing reads Locations.geohash: the location match goes through
+-- LocationsRtree, so the column and its index were only write overhead
+
+DROP INDEX idx_locations_trip_geohash;
+ALTER TABLE Locations DROP COLUMN geohash;
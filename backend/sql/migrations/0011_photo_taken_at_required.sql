@@ -0,0 +1,23 @@
+-- Keyset pagination compares (taken_at, id) row values, which skip rows
+-- with a NULL taken_at. Ingest has always fallen back to the upload time;
+-- fill in older rows the same way and refuse NULLs from now on. SQLite
+-- cannot add NOT NULL to an existing column, so triggers enforce it.
+
+UPDATE Photos SET taken_at = COALESCE(
+    (SELECT created_at FROM PhotoBlobs WHERE content_hash = Photos.content_hash),
+    (SELECT created_at FROM Locations WHERE id = Photos.location_id),
+    0
+)
+WHERE taken_at IS NULL;
+
+CREATE TRIGGER photos_taken_at_insert BEFORE INSERT ON Photos
+WHEN NEW.taken_at IS NULL
+BEGIN
+    SELECT RAISE(ABORT, 'NOT NULL constraint failed: Photos.taken_at');
+END;
+
+CREATE TRIGGER photos_taken_at_update BEFORE UPDATE OF taken_at ON Photos
+WHEN NEW.taken_at IS NULL
+BEGIN
+    SELECT RAISE(ABORT, 'NOT NULL constraint failed: Photos.taken_at');
+END;
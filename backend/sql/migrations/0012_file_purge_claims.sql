@@ -0,0 +1,10 @@
+-- The purger claims a batch of entries in one short transaction, deletes
+-- their files with no transaction open and marks them purged in another.
+-- Purged entries stay for FILE_GC_GRACE_SECONDS so an ingest that stored
+-- the same content before the deletion finds the claim when it commits.
+
+ALTER TABLE FilePurgeQueue ADD COLUMN claimed_at INTEGER;
+ALTER TABLE FilePurgeQueue ADD COLUMN purged_at INTEGER;
+
+CREATE INDEX idx_file_purge_queue_hash ON FilePurgeQueue(content_hash);
+CREATE INDEX idx_file_purge_queue_purged_at ON FilePurgeQueue(purged_at);
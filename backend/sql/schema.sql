@@ -16,9 +16,18 @@ CREATE TABLE Trips (
     start_date INTEGER,
     end_date INTEGER,
     created_at INTEGER,
+    location_count INTEGER NOT NULL DEFAULT 0,
+    photo_count INTEGER NOT NULL DEFAULT 0,
+    min_x REAL,
+    max_x REAL,
+    min_y REAL,
+    max_y REAL,
+    version INTEGER NOT NULL DEFAULT 0,
     FOREIGN KEY (user_id) REFERENCES Users(id) ON DELETE CASCADE
 );
 
+CREATE INDEX idx_trips_user_id ON Trips(user_id);
+
 
 CREATE TABLE Locations (
     id INTEGER PRIMARY KEY,
@@ -33,9 +42,56 @@ CREATE TABLE Locations (
     time_needed INTEGER,
     best_time_to_visit VARCHAR(100),
     created_at INTEGER,
+    photo_count INTEGER NOT NULL DEFAULT 0,
+    cover_photo_id INTEGER,
+    first_taken_at INTEGER,
+    last_taken_at INTEGER,
+    version INTEGER NOT NULL DEFAULT 0,
     FOREIGN KEY (trip_id) REFERENCES Trips(id) ON DELETE CASCADE
 );
 
+CREATE INDEX idx_locations_trip_id ON Locations(trip_id);
+
+
+-- Spatial index over Locations(x, y), maintained by the triggers below
+CREATE VIRTUAL TABLE LocationsRtree USING rtree(
+    id,
+    min_x, max_x,
+    min_y, max_y
+);
+
+CREATE TRIGGER locations_rtree_insert AFTER INSERT ON Locations
+WHEN NEW.x IS NOT NULL AND NEW.y IS NOT NULL
+BEGIN
+    INSERT INTO LocationsRtree VALUES (NEW.id, NEW.x, NEW.x, NEW.y, NEW.y);
+END;
+
+CREATE TRIGGER locations_rtree_update AFTER UPDATE OF x, y ON Locations
+BEGIN
+    DELETE FROM LocationsRtree WHERE id = OLD.id;
+    INSERT INTO LocationsRtree
+    SELECT NEW.id, NEW.x, NEW.x, NEW.y, NEW.y
+    WHERE NEW.x IS NOT NULL AND NEW.y IS NOT NULL;
+END;
+
+CREATE TRIGGER locations_rtree_delete AFTER DELETE ON Locations
+BEGIN
+    DELETE FROM LocationsRtree WHERE id = OLD.id;
+END;
+
+
+CREATE TABLE PhotoBlobs (
+    content_hash CHAR(64) PRIMARY KEY,
+    file_url TEXT NOT NULL,
+    thumbnail_url TEXT,
+    derivatives TEXT,
+    x REAL,
+    y REAL,
+    taken_at INTEGER,
+    ref_count INTEGER NOT NULL DEFAULT 0,
+    created_at INTEGER
+);
+
 
 CREATE TABLE Photos (
     id INTEGER PRIMARY KEY,
@@ -44,13 +100,252 @@ CREATE TABLE Photos (
     x REAL,
     y REAL,
     file_url TEXT NOT NULL,
+    thumbnail_url TEXT,
+    derivatives TEXT,
+    content_hash CHAR(64),
     original_filename VARCHAR(255),
     taken_at INTEGER,
     is_cover_photo BOOLEAN DEFAULT FALSE,
+    geohash CHAR(9),
     FOREIGN KEY (location_id) REFERENCES Locations(id) ON DELETE CASCADE,
-    FOREIGN KEY (user_id) REFERENCES Users(id) ON DELETE CASCADE
+    FOREIGN KEY (user_id) REFERENCES Users(id) ON DELETE CASCADE,
+    FOREIGN KEY (content_hash) REFERENCES PhotoBlobs(content_hash)
+);
+
+CREATE INDEX idx_photos_content_hash ON Photos(content_hash);
+
+-- A location's photos in (taken_at, id) order, for keyset pagination
+CREATE INDEX idx_photos_location_taken_at ON Photos(location_id, taken_at);
+
+-- Newest-first listing of a user's photos
+CREATE INDEX idx_photos_user_taken_at ON Photos(user_id, taken_at DESC, id DESC);
+
+-- Geohash prefix range scans for nearby photos and tile grouping
+CREATE INDEX idx_photos_user_geohash ON Photos(user_id, geohash);
+
+-- At most one row per location, so cover lookups stay tiny
+CREATE INDEX idx_photos_location_cover ON Photos(location_id) WHERE is_cover_photo = 1;
+
+-- Keyset pagination skips NULL taken_at rows; SQLite cannot add NOT NULL
+-- to a column in a migration, so these triggers stand in for it
+CREATE TRIGGER photos_taken_at_insert BEFORE INSERT ON Photos
+WHEN NEW.taken_at IS NULL
+BEGIN
+    SELECT RAISE(ABORT, 'NOT NULL constraint failed: Photos.taken_at');
+END;
+
+CREATE TRIGGER photos_taken_at_update BEFORE UPDATE OF taken_at ON Photos
+WHEN NEW.taken_at IS NULL
+BEGIN
+    SELECT RAISE(ABORT, 'NOT NULL constraint failed: Photos.taken_at');
+END;
+
+-- Keep PhotoBlobs.ref_count in step with the Photos rows linked to each blob
+CREATE TRIGGER photos_blob_ref_insert AFTER INSERT ON Photos
+WHEN NEW.content_hash IS NOT NULL
+BEGIN
+    UPDATE PhotoBlobs SET ref_count = ref_count + 1
+    WHERE content_hash = NEW.content_hash;
+END;
+
+CREATE TRIGGER photos_blob_ref_delete AFTER DELETE ON Photos
+WHEN OLD.content_hash IS NOT NULL
+BEGIN
+    UPDATE PhotoBlobs SET ref_count = ref_count - 1
+    WHERE content_hash = OLD.content_hash;
+END;
+
+-- Files of deleted rows, removed in batches by the background purger. A
+-- blob's files are queued when its last photo goes (cascades included);
+-- photos without a blob own their files outright. The purger claims a
+-- batch, deletes its files outside any transaction and marks it purged;
+-- purged entries stay for FILE_GC_GRACE_SECONDS so a concurrent ingest of
+-- the same content can tell its files are gone.
+CREATE TABLE FilePurgeQueue (
+    id INTEGER PRIMARY KEY,
+    content_hash CHAR(64),
+    file_url TEXT NOT NULL,
+    thumbnail_url TEXT,
+    derivatives TEXT,
+    queued_at INTEGER,
+    claimed_at INTEGER,
+    purged_at INTEGER
 );
 
+CREATE INDEX idx_file_purge_queue_hash ON FilePurgeQueue(content_hash);
+CREATE INDEX idx_file_purge_queue_purged_at ON FilePurgeQueue(purged_at);
+
+CREATE TRIGGER photo_blobs_release AFTER UPDATE OF ref_count ON PhotoBlobs
+WHEN NEW.ref_count <= 0
+BEGIN
+    INSERT INTO FilePurgeQueue (content_hash, file_url, thumbnail_url, derivatives, queued_at)
+    VALUES (NEW.content_hash, NEW.file_url, NEW.thumbnail_url, NEW.derivatives,
+            CAST(strftime('%s', 'now') AS INTEGER));
+    DELETE FROM PhotoBlobs WHERE content_hash = NEW.content_hash;
+END;
+
+CREATE TRIGGER photos_release_unshared AFTER DELETE ON Photos
+WHEN OLD.content_hash IS NULL
+BEGIN
+    INSERT INTO FilePurgeQueue (file_url, thumbnail_url, derivatives, queued_at)
+    VALUES (OLD.file_url, OLD.thumbnail_url, OLD.derivatives,
+            CAST(strftime('%s', 'now') AS INTEGER));
+END;
+
+
+-- Spatial index over Photos(x, y) for viewport queries across trips. The
+-- auxiliary columns let the user filter and recency sort run on the index
+-- rows before any Photos row is read.
+CREATE VIRTUAL TABLE PhotosRtree USING rtree(
+    id,
+    min_x, max_x,
+    min_y, max_y,
+    +user_id,
+    +taken_at
+);
+
+CREATE TRIGGER photos_rtree_insert AFTER INSERT ON Photos
+WHEN NEW.x IS NOT NULL AND NEW.y IS NOT NULL
+BEGIN
+    INSERT INTO PhotosRtree VALUES (NEW.id, NEW.x, NEW.x, NEW.y, NEW.y, NEW.user_id, NEW.taken_at);
+END;
+
+CREATE TRIGGER photos_rtree_update AFTER UPDATE OF x, y, user_id, taken_at ON Photos
+BEGIN
+    DELETE FROM PhotosRtree WHERE id = OLD.id;
+    INSERT INTO PhotosRtree
+    SELECT NEW.id, NEW.x, NEW.x, NEW.y, NEW.y, NEW.user_id, NEW.taken_at
+    WHERE NEW.x IS NOT NULL AND NEW.y IS NOT NULL;
+END;
+
+CREATE TRIGGER photos_rtree_delete AFTER DELETE ON Photos
+BEGIN
+    DELETE FROM PhotosRtree WHERE id = OLD.id;
+END;
+
+
+-- Per-location photo aggregates, kept current as photos come and go
+CREATE TRIGGER photos_aggregate_insert AFTER INSERT ON Photos
+BEGIN
+    UPDATE Locations SET
+        photo_count = photo_count + 1,
+        cover_photo_id = CASE WHEN NEW.is_cover_photo THEN NEW.id ELSE cover_photo_id END,
+        first_taken_at = min(COALESCE(first_taken_at, NEW.taken_at), COALESCE(NEW.taken_at, first_taken_at)),
+        last_taken_at = max(COALESCE(last_taken_at, NEW.taken_at), COALESCE(NEW.taken_at, last_taken_at))
+    WHERE id = NEW.location_id;
+END;
+
+CREATE TRIGGER photos_aggregate_delete AFTER DELETE ON Photos
+BEGIN
+    UPDATE Locations SET
+        photo_count = photo_count - 1,
+        cover_photo_id = CASE WHEN cover_photo_id = OLD.id THEN NULL ELSE cover_photo_id END,
+        first_taken_at = CASE WHEN OLD.taken_at = first_taken_at
+            THEN (SELECT MIN(taken_at) FROM Photos WHERE location_id = OLD.location_id)
+            ELSE first_taken_at END,
+        last_taken_at = CASE WHEN OLD.taken_at = last_taken_at
+            THEN (SELECT MAX(taken_at) FROM Photos WHERE location_id = OLD.location_id)
+            ELSE last_taken_at END
+    WHERE id = OLD.location_id;
+END;
+
+CREATE TRIGGER photos_aggregate_cover AFTER UPDATE OF is_cover_photo ON Photos
+WHEN NEW.is_cover_photo IS NOT OLD.is_cover_photo
+BEGIN
+    UPDATE Locations SET cover_photo_id = CASE
+        WHEN NEW.is_cover_photo THEN NEW.id
+        WHEN cover_photo_id = OLD.id THEN NULL
+        ELSE cover_photo_id END
+    WHERE id = NEW.location_id;
+END;
+
+-- Moves and retimes are rare; recompute both affected locations outright
+CREATE TRIGGER photos_aggregate_move AFTER UPDATE OF location_id, taken_at ON Photos
+BEGIN
+    UPDATE Locations SET
+        photo_count = (SELECT COUNT(*) FROM Photos WHERE location_id = Locations.id),
+        cover_photo_id = (SELECT id FROM Photos
+                          WHERE location_id = Locations.id AND is_cover_photo = 1 LIMIT 1),
+        first_taken_at = (SELECT MIN(taken_at) FROM Photos WHERE location_id = Locations.id),
+        last_taken_at = (SELECT MAX(taken_at) FROM Photos WHERE location_id = Locations.id)
+    WHERE id IN (OLD.location_id, NEW.location_id);
+END;
+
+
+-- Per-trip counts and bounding box, fed by the location rows and their
+-- photo_count. The box only covers locations with both coordinates.
+CREATE TRIGGER locations_aggregate_insert AFTER INSERT ON Locations
+BEGIN
+    UPDATE Trips SET
+        location_count = location_count + 1,
+        photo_count = photo_count + NEW.photo_count,
+        min_x = CASE WHEN NEW.x IS NULL OR NEW.y IS NULL THEN min_x ELSE min(COALESCE(min_x, NEW.x), NEW.x) END,
+        max_x = CASE WHEN NEW.x IS NULL OR NEW.y IS NULL THEN max_x ELSE max(COALESCE(max_x, NEW.x), NEW.x) END,
+        min_y = CASE WHEN NEW.x IS NULL OR NEW.y IS NULL THEN min_y ELSE min(COALESCE(min_y, NEW.y), NEW.y) END,
+        max_y = CASE WHEN NEW.x IS NULL OR NEW.y IS NULL THEN max_y ELSE max(COALESCE(max_y, NEW.y), NEW.y) END
+    WHERE id = NEW.trip_id;
+END;
+
+CREATE TRIGGER locations_aggregate_photos AFTER UPDATE OF photo_count ON Locations
+WHEN NEW.trip_id = OLD.trip_id
+BEGIN
+    UPDATE Trips SET photo_count = photo_count + NEW.photo_count - OLD.photo_count
+    WHERE id = NEW.trip_id;
+END;
+
+CREATE TRIGGER locations_aggregate_delete AFTER DELETE ON Locations
+BEGIN
+    UPDATE Trips SET
+        location_count = location_count - 1,
+        photo_count = photo_count - OLD.photo_count,
+        min_x = (SELECT MIN(x) FROM Locations WHERE trip_id = OLD.trip_id AND y IS NOT NULL),
+        max_x = (SELECT MAX(x) FROM Locations WHERE trip_id = OLD.trip_id AND y IS NOT NULL),
+        min_y = (SELECT MIN(y) FROM Locations WHERE trip_id = OLD.trip_id AND x IS NOT NULL),
+        max_y = (SELECT MAX(y) FROM Locations WHERE trip_id = OLD.trip_id AND x IS NOT NULL)
+    WHERE id = OLD.trip_id;
+END;
+
+CREATE TRIGGER locations_aggregate_update AFTER UPDATE OF trip_id, x, y ON Locations
+BEGIN
+    UPDATE Trips SET
+        location_count = (SELECT COUNT(*) FROM Locations WHERE trip_id = Trips.id),
+        photo_count = (SELECT COALESCE(SUM(photo_count), 0) FROM Locations WHERE trip_id = Trips.id),
+        min_x = (SELECT MIN(x) FROM Locations WHERE trip_id = Trips.id AND y IS NOT NULL),
+        max_x = (SELECT MAX(x) FROM Locations WHERE trip_id = Trips.id AND y IS NOT NULL),
+        min_y = (SELECT MIN(y) FROM Locations WHERE trip_id = Trips.id AND x IS NOT NULL),
+        max_y = (SELECT MAX(y) FROM Locations WHERE trip_id = Trips.id AND x IS NOT NULL)
+    WHERE id IN (OLD.trip_id, NEW.trip_id);
+END;
+
+
+-- Change counters for conditional GETs. Every change to a location's row
+-- or photos bumps Locations.version, every change to a trip's row or
+-- locations bumps Trips.version. Photo inserts, deletes, moves and cover
+-- changes already update their location through the aggregate triggers.
+CREATE TRIGGER locations_version AFTER UPDATE ON Locations
+WHEN NEW.version = OLD.version
+BEGIN
+    UPDATE Locations SET version = version + 1 WHERE id = NEW.id;
+END;
+
+CREATE TRIGGER locations_version_trip AFTER UPDATE OF version ON Locations
+BEGIN
+    UPDATE Trips SET version = version + 1 WHERE id = NEW.trip_id;
+END;
+
+CREATE TRIGGER trips_version AFTER UPDATE ON Trips
+WHEN NEW.version = OLD.version
+BEGIN
+    UPDATE Trips SET version = version + 1 WHERE id = NEW.id;
+END;
+
+CREATE TRIGGER photos_version AFTER UPDATE OF
+    x, y, file_url, thumbnail_url, derivatives, content_hash, original_filename, geohash
+ON Photos
+BEGIN
+    UPDATE Locations SET version = version + 1 WHERE id = NEW.location_id;
+END;
+
 
 CREATE TABLE SharedTrips (
     id INTEGER PRIMARY KEY,
@@ -63,3 +358,76 @@ CREATE TABLE SharedTrips (
     FOREIGN KEY (trip_id) REFERENCES Trips(id) ON DELETE CASCADE,
     FOREIGN KEY (shared_by_user_id) REFERENCES Users(id) ON DELETE CASCADE
 );
+
+CREATE INDEX idx_shared_trips_share_token ON SharedTrips(share_token);
+
+
+CREATE TABLE UploadSessions (
+    id CHAR(32) PRIMARY KEY,
+    trip_id INTEGER NOT NULL,
+    user_id INTEGER NOT NULL,
+    status VARCHAR(20) NOT NULL DEFAULT 'open',
+    created_at INTEGER,
+    FOREIGN KEY (trip_id) REFERENCES Trips(id) ON DELETE CASCADE,
+    FOREIGN KEY (user_id) REFERENCES Users(id) ON DELETE CASCADE
+);
+
+
+CREATE TABLE UploadSessionFiles (
+    session_id CHAR(32) NOT NULL,
+    file_index INTEGER NOT NULL,
+    filename VARCHAR(255) NOT NULL,
+    size INTEGER NOT NULL,
+    status VARCHAR(20) NOT NULL DEFAULT 'pending',
+    photo_id INTEGER,
+    error TEXT,
+    PRIMARY KEY (session_id, file_index),
+    FOREIGN KEY (session_id) REFERENCES UploadSessions(id) ON DELETE CASCADE
+);
+
+
+CREATE TABLE UploadChunks (
+    session_id CHAR(32) NOT NULL,
+    file_index INTEGER NOT NULL,
+    chunk_offset INTEGER NOT NULL,
+    chunk_length INTEGER NOT NULL,
+    PRIMARY KEY (session_id, file_index, chunk_offset),
+    FOREIGN KEY (session_id, file_index)
+        REFERENCES UploadSessionFiles(session_id, file_index) ON DELETE CASCADE
+);
+
+
+CREATE TABLE IngestJobs (
+    id INTEGER PRIMARY KEY,
+    trip_id INTEGER NOT NULL,
+    user_id INTEGER NOT NULL,
+    status VARCHAR(20) NOT NULL DEFAULT 'queued',
+    error TEXT,
+    created_at INTEGER,
+    started_at INTEGER,
+    finished_at INTEGER,
+    owner TEXT,
+    heartbeat_at INTEGER,
+    FOREIGN KEY (trip_id) REFERENCES Trips(id) ON DELETE CASCADE,
+    FOREIGN KEY (user_id) REFERENCES Users(id) ON DELETE CASCADE
+);
+
+CREATE INDEX idx_ingest_jobs_status ON IngestJobs(status, id);
+
+
+CREATE TABLE IngestJobFiles (
+    job_id INTEGER NOT NULL,
+    file_index INTEGER NOT NULL,
+    filename VARCHAR(255) NOT NULL,
+    spool_path TEXT NOT NULL,
+    content_hash CHAR(64) NOT NULL,
+    status VARCHAR(20) NOT NULL DEFAULT 'pending',
+    photo_id INTEGER,
+    error TEXT,
+    PRIMARY KEY (job_id, file_index),
+    FOREIGN KEY (job_id) REFERENCES IngestJobs(id) ON DELETE CASCADE
+);
+
+
+-- Matches the newest file in sql/migrations; bump both together
+PRAGMA user_version = 12;
@@ -11,7 +11,7 @@ import { UploadModal } from '@/components/upload'
 import { usePhotos } from '@/hooks/usePhotos'
 import { getLocationWithPhotos, mockLocations } from '@/lib/mockData'
 import { locationAPI } from '@/services/api'
-import { calculateTripBounds, getCityCoordinates, createCityBounds } from '@/lib/mapUtils'
+import { calculateTripBounds, tripBoundsFromAggregates, getCityCoordinates, createCityBounds } from '@/lib/mapUtils'
 import type { Photo, Location, Trip } from '@/types'
 import './App.css'
 
@@ -72,14 +72,15 @@ function App() {
     setSelectedTrip(trip)
     setSidebarView('trip-detail')
 
-    // Calculate bounds for trip locations and focus map (merge runtime + mock)
+    // Prefer the bounds the backend keeps on the trip; otherwise calculate
+    // them from trip locations (merge runtime + mock)
     const runtimeTripLocs = locations.filter((loc) => loc.trip_id === trip.id)
     const mockTripLocs = mockLocations.filter((loc) => loc.trip_id === trip.id)
     const byId: Record<string, Location> = {}
     for (const l of mockTripLocs) byId[l.id] = l
     for (const l of runtimeTripLocs) byId[l.id] = { ...(byId[l.id] || {} as Location), ...l }
     const tripLocations = Object.values(byId)
-    const bounds = calculateTripBounds(tripLocations)
+    const bounds = tripBoundsFromAggregates(trip) ?? calculateTripBounds(tripLocations)
 
     if (bounds) {
       setMapFocusBounds(bounds)
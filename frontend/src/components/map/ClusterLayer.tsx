@@ -68,7 +68,7 @@ export function ClusterLayer({
         html: `
           <div class="photo-marker">
             <img
-              src="${photo.file_url}"
+              src="${photo.thumbnail_url || photo.file_url}"
               alt="${photo.original_filename}"
               class="photo-marker-img"
             />
@@ -18,7 +18,7 @@ export function PhotoMarker({ photo, onClick }: PhotoMarkerProps) {
     html: `
       <div class="photo-marker">
         <img
-          src="${photo.file_url}"
+          src="${photo.thumbnail_url || photo.file_url}"
           alt="${photo.original_filename}"
           class="photo-marker-img"
         />
@@ -4,7 +4,29 @@
  */
 
 import L from 'leaflet'
-import type { Location } from '@/types'
+import type { Location, Trip } from '@/types'
+
+/**
+ * Bounding box stored on a trip by the backend
+ * @param trip Trip with min_x/max_x/min_y/max_y aggregates
+ * @returns LatLngBounds or null if the trip has no located places
+ */
+export function tripBoundsFromAggregates(trip: Trip): L.LatLngBounds | null {
+  if (trip.min_x == null || trip.max_x == null || trip.min_y == null || trip.max_y == null) return null
+
+  // Single location: create small bounds around it
+  if (trip.min_x === trip.max_x && trip.min_y === trip.max_y) {
+    return L.latLngBounds([
+      [trip.min_y - 0.01, trip.min_x - 0.01],
+      [trip.max_y + 0.01, trip.max_x + 0.01],
+    ])
+  }
+
+  return L.latLngBounds([
+    [trip.min_y, trip.min_x],
+    [trip.max_y, trip.max_x],
+  ])
+}
 
 /**
  * Calculate bounding box for a set of locations
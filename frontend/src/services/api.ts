@@ -18,6 +18,8 @@ import type {
   UploadPhotoRequest,
   ShareTripRequest,
   TripFilters,
+  ClusterResponse,
+  MapPoint,
 } from '@/types'
 
 // ============================================
@@ -498,6 +500,33 @@ export const photoAPI = {
   },
 }
 
+// ============================================
+// Map API
+// ============================================
+
+export const mapAPI = {
+  /**
+   * Get server-side photo clusters for the visible map area of a trip
+   * Backend endpoint: GET /api/trips/:tripId/clusters?bbox=&zoom=
+   * bbox is Leaflet's bounds.toBBoxString() (min_lon,min_lat,max_lon,max_lat)
+   * Response: { zoom, clusters: MapCluster[], points: MapPoint[] }
+   */
+  getClusters: async (tripId: string, bbox: string, zoom: number): Promise<ClusterResponse> => {
+    const response = await api.get(`/trips/${tripId}/clusters`, { params: { bbox, zoom } })
+    return response.data
+  },
+
+  /**
+   * Get a user's newest photos inside the visible map area, across all trips
+   * Backend endpoint: GET /api/users/:userId/photos?bbox=&limit=
+   * Response: { photos: MapPoint[] }
+   */
+  getUserPhotos: async (userId: string, bbox: string, limit = 500): Promise<MapPoint[]> => {
+    const response = await api.get(`/users/${userId}/photos`, { params: { bbox, limit } })
+    return response.data.photos
+  },
+}
+
 // ============================================
 // Share API
 // ============================================
@@ -28,6 +28,12 @@ export interface Trip {
   rating?: number // Average rating from locations
   cover_photo?: Photo
   photo_count?: number
+  location_count?: number
+  // Bounding box of the trip's locations, maintained by the backend
+  min_x?: number | null
+  max_x?: number | null
+  min_y?: number | null
+  max_y?: number | null
 }
 
 export interface Location {
@@ -46,6 +52,12 @@ export interface Location {
   created_at: string
   // Additional fields
   photos?: Photo[] // Photos at this location
+  // Aggregates maintained by the backend
+  photo_count?: number
+  cover_photo_id?: string | null
+  cover_thumbnail_url?: string | null
+  first_taken_at?: number | null
+  last_taken_at?: number | null
 }
 
 export interface Photo {
@@ -55,6 +67,8 @@ export interface Photo {
   x: number // longitude
   y: number // latitude
   file_url: string
+  thumbnail_url?: string // 128px WebP made at ingest
+  derivatives?: string // JSON: { "<size>": { webp: url, jpeg: url } }
   original_filename: string
   taken_at?: string // from EXIF data
   is_cover_photo: boolean
@@ -143,6 +157,28 @@ export interface ShareTripRequest {
   expires_in_days?: number
 }
 
+export interface MapCluster {
+  x: number // mean longitude of the clustered photos
+  y: number // mean latitude
+  count: number
+  photo_id: string // representative photo for the cluster icon
+  thumbnail_url?: string | null
+}
+
+export interface MapPoint {
+  id: string
+  x: number
+  y: number
+  thumbnail_url?: string | null
+  taken_at?: number | null
+}
+
+export interface ClusterResponse {
+  zoom: number
+  clusters: MapCluster[]
+  points: MapPoint[]
+}
+
 // ============================================
 // UI State Types
 // ============================================